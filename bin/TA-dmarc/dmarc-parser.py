@@ -33,235 +33,20 @@ SOFTWARE.
 ##################################################################
 
 import argparse
-import json
-import re
 import os
 import sys
-import shutil
-import copy
-
-import xml.etree.ElementTree as ET
-
-from datetime import datetime
-from collections import defaultdict
 
 # add the lib dir to the path to import libs from there
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "lib"))
 
 from classes import splunk_info as si
 from classes import custom_logger as c_logger
+from classes import dmarc_parser as dp
 
-__version__ = "3.1.1"
+__version__ = "3.5.0"
 __author__ = 'Arnold Holzel'
 __license__ = 'Apache License 2.0'
 
-def nested_dict(n, type):
-    if n == 1:
-        return defaultdict(type)
-    else:
-        return defaultdict(lambda: nested_dict(n-1, type))
-
-def del_none(d):
-    for key, value in list(d.items()):
-        if value is None:
-            del d[key]
-        elif isinstance(value, dict):
-            del_none(value)
-    return d  
-
-def get_kv_dict(d, out=dict()):
-    for k, v in d.items():
-        if isinstance(v, dict):
-            get_kv_dict(v)
-        else:
-            out[k] = v.strip()  
-            
-    return out
-    
-report_defaultdata = nested_dict(6, dict)
-
-def process_dmarc_xml(xml_file, output='json', resolve=0, resolve_timeout=2):
-    # open the provided xml file and read the content into a string.
-    try:
-        with open(xml_file, 'rb') as content_file:
-            script_logger.debug('Reading the XML file content.')
-            xml = content_file.read()
-    except EnvironmentError:
-        script_logger.exception(f"Cannot open file='{dmarc_rua_xml}' traceback=")
-        exit(0)
-
-    try:
-        # try to read the xml file
-        root = ET.fromstring(xml)   
-    except Exception as exception:
-        # some files are not correctly constructed and that will give a exception 
-        # if the exception is a parseerror that remove the problem line and try again.
-        error = str(type(exception).__name__)
-        script_logger.exception(f"Problem with the xml tree: {error}")
-
-        if error == 'ParseError':
-            line_number = False
-            
-            if 'line' in str(exception) and 'column' in str(exception):
-                line_regex = re.search(r'line\s+(\d+)', str(exception))
-                line_number = int(line_regex.group(1))
-                
-            del xml
-            
-            source_file = open(xml_file, 'r')
-            s_lines = source_file.readlines()
-            source_file.close()
-            
-            if line_number:
-                script_logger.debug(f"Problem line: {s_lines[line_number-1]}")
-                del s_lines[line_number-1]
-
-            with open(xml_file, 'w+') as target_file:
-                for line in s_lines:
-                    target_file.write(line)
-
-            with open(xml_file, 'rb') as content_file:
-                script_logger.debug("Reading the XML file content again.")
-                xml = content_file.read()
-        else:
-            try:
-                problem_dir     = os.path.normpath(app_log_dir + os.sep + 'problems')
-                problem_file    = os.path.basename(xml_file)
-                new_problem_file= os.path.normpath(problem_dir + os.sep + problem_file)
-                os.rename(xml_file,new_problem_file)
-                
-                script_logger.warning("The file is moved to the problem directory please review the file to fix the problem")
-            except Exception:
-                script_logger.exception("Could not move file to the problem directory, please remove the file manually")
-            exit(0)
-        
-
-    # find the root element of the xml, this should be the feedback element
-    try:
-        root = ET.fromstring(xml)
-
-        # loop trough the xml and find al the possible items that the xml can have. And store everything
-        # in a multidimensional dict. if an item is not found a None value will be set, this will later on be removed
-        # this dict will later on either be converted into a json or in key=value pairs.
-        
-        # find the 'feedback' item of the xml, and all the items directly below that, that can only occur once
-        for feedback in root.iter('feedback'):
-            report_defaultdata['feedback']['version'] = feedback.findtext('version',None)
-            report_defaultdata['feedback']['file_name'] = str(os.path.basename(os.path.normpath(xml_file)))
-            
-            # find the report_metadata info
-            report_defaultdata['feedback']['report_metadata']['org_name'] = feedback.findtext('report_metadata/org_name',None)
-            report_defaultdata['feedback']['report_metadata']['email'] = feedback.findtext('report_metadata/email',None)
-            report_defaultdata['feedback']['report_metadata']['extra_contact_info'] = feedback.findtext('report_metadata/extra_contact_info',None)
-            report_defaultdata['feedback']['report_metadata']['report_id'] = feedback.findtext('report_metadata/report_id',None)
-            
-            # find the date_range info
-            report_defaultdata['feedback']['report_metadata']['date_range']['begin'] = feedback.findtext('report_metadata/date_range/begin',None)
-            report_defaultdata['feedback']['report_metadata']['date_range']['end'] = feedback.findtext('report_metadata/date_range/end',None)
-            
-            # find the policy_published info
-            report_defaultdata['feedback']['policy_published']['domain'] = feedback.findtext('policy_published/domain',None)
-            report_defaultdata['feedback']['policy_published']['adkim'] = feedback.findtext('policy_published/adkim',None)
-            report_defaultdata['feedback']['policy_published']['aspf'] = feedback.findtext('policy_published/aspf',None)
-            report_defaultdata['feedback']['policy_published']['p'] = feedback.findtext('policy_published/p',None)
-            report_defaultdata['feedback']['policy_published']['sp'] = feedback.findtext('policy_published/sp',None)
-            report_defaultdata['feedback']['policy_published']['pct'] = feedback.findtext('policy_published/pct',None)
-
-            # find the record info, this tag can occure multiple times, so loop through all of them
-            for record in feedback.iter('record'):
-                report_recorddata = copy.deepcopy(report_defaultdata)
-
-                # find the identifiers per record.
-                for identifiers in record.findall('identifiers'):
-                    report_recorddata['feedback']['record']['identifiers']['header_from'] = identifiers.findtext('header_from',None)
-                    report_recorddata['feedback']['record']['identifiers']['envelope_from'] = identifiers.findtext('envelope_from',None)
-                    report_recorddata['feedback']['record']['identifiers']['envelope_to'] = identifiers.findtext('envelope_to',None)
-
-                for dkim in record.findall('./auth_results/dkim'):
-                    report_recorddata['feedback']['record']['auth_results']['dkim']['domain'] = dkim.findtext('domain',None)
-                    report_recorddata['feedback']['record']['auth_results']['dkim']['selector'] = dkim.findtext('selector',None)
-                    report_recorddata['feedback']['record']['auth_results']['dkim']['result'] = dkim.findtext('result',None)
-                    report_recorddata['feedback']['record']['auth_results']['dkim']['human_result'] = dkim.findtext('human_result',None)
-
-                for spf in record.findall('./auth_results/spf'):
-                    report_recorddata['feedback']['record']['auth_results']['spf']['domain'] = spf.findtext('domain',None)
-                    report_recorddata['feedback']['record']['auth_results']['spf']['scope'] = spf.findtext('scope',None)
-                    report_recorddata['feedback']['record']['auth_results']['spf']['result'] = spf.findtext('result',None)
-                
-                # a record can have multiple rows, loop through all of them.
-                for row in record.iter('row'):
-                    
-                    source_ip = row.findtext('source_ip',None)
-                    
-                    if resolve == 1:
-                        from dns import resolver,reversename
-                        errors              = ''
-                        timeout             = float(resolve_timeout)
-                        resolver            = resolver.Resolver()
-                        resolver.timeout    = timeout
-                        resolver.lifetime   = timeout
-
-                        try:
-                            addr = reversename.from_address(source_ip)    
-                            answer = resolver.resolve(addr, 'PTR') 
-                        except Exception as exception:
-                            # catch the exeption and give that back (NXDOMAIN/NoAnswer/....)
-                            errors = str(type(exception).__name__)
-                            script_logger.debug(f"There was a problem with the dns query for {source_ip}")
-
-                            if errors.lower() == 'timeout':
-                                try:
-                                    addr = reversename.from_address(source_ip)    
-                                    answer = resolver.resolve(addr, 'PTR') 
-                                except Exception as exception:
-                                    # catch the exeption and give that back (NXDOMAIN/NoAnswer/....)
-                                    errors = str(type(exception).__name__)
-                        
-                        if not errors:
-                            for rr in answer:
-                                hostname = rr
-                        else:
-                            hostname = errors
-                    else:
-                        hostname            = '-'
-                        
-                    report_recorddata['feedback']['record']['row']['source_ip']                             = str(source_ip)
-                    report_recorddata['feedback']['record']['row']['source_hostname']                       = str(hostname).lower()
-                    report_recorddata['feedback']['record']['row']['count']                                 = row.findtext('count',None)
-                    report_recorddata['feedback']['record']['row']['policy_evaluated']['disposition']       = row.findtext('policy_evaluated/disposition',None)
-                    report_recorddata['feedback']['record']['row']['policy_evaluated']['dkim']              = row.findtext('policy_evaluated/dkim',None)
-                    report_recorddata['feedback']['record']['row']['policy_evaluated']['spf']               = row.findtext('policy_evaluated/spf',None)
-                    report_recorddata['feedback']['record']['row']['policy_evaluated']['reason']['type']    = row.findtext('policy_evaluated/reason/type',None)
-                    
-                # remove the empty values from the dict
-                report_recorddata           = del_none(report_recorddata)
-
-                if output == 'json':
-                    # create a json from the dict
-                    jsondata                = json.dumps(report_recorddata)
-                    result_logger.info(jsondata)
-                elif output == 'kv':
-                    # create a 1 dimensional dict from with the keys and values from the multidimensional dict. 
-                    kvdata                  = get_kv_dict(report_recorddata)
-                    kv                      = ''
-                    for k,v in kvdata.items():
-                        kv                  = kv + k + '="' + v + '", '
-                        
-                    kv                      = kv.strip(' ,')
-                    result_logger.info(kv)
-    except Exception:
-        script_logger.exception(f"A exception occured with file='{xml_file}', traceback=")
-        try:
-            problem_dir     = os.path.normpath(app_log_dir + os.sep + 'problems')
-            problem_file    = os.path.basename(xml_file)
-            new_problem_file= os.path.normpath(problem_dir + os.sep + problem_file)
-            os.rename(xml_file,new_problem_file)
-            
-            script_logger.warning("The file is moved to the problem directory please review the file to fix the problem")
-        except Exception:
-            script_logger.exception("Could not move file to the problem directory, please remove the file manually")
-        exit(0)
-   
 if __name__ == '__main__':
     logger = c_logger.Logger()
     
@@ -290,9 +75,14 @@ if __name__ == '__main__':
     app_root_dir            = splunk_paths['app_root_dir']                                  # The app root directory
     log_root_dir            = os.path.normpath(app_root_dir + os.sep + 'logs')              # The root directory for the logs
     app_log_dir             = os.path.normpath(log_root_dir + os.sep + 'dmarc_splunk')      # The directory to store the output for Splunk
-    problem_dir             = os.path.normpath(app_log_dir + os.sep + 'problems')           # The directory for problem files
+    problem_dir             = os.path.normpath(log_root_dir + os.sep + 'problems')          # The directory for problem files
+    ptr_cache_file          = os.path.normpath(log_root_dir + os.sep + 'ptr_cache.db')      # The file to store the resolved PTR's in
 
     log_level               = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'log_level')
+    resolve_cache           = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'resolve_cache')
+    resolve_concurrency     = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'resolve_concurrency') or 50
+    resolve_deadline        = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'resolve_deadline') or 300
+    resolve_cache_size      = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'resolve_cache_size') or 10000
 
     # Get the dmarc RUA file name
     dmarc_rua_xml           = args.file
@@ -312,32 +102,14 @@ if __name__ == '__main__':
     else:
         resolve             = 0
 
-    script_logger.debug(f"Start processing file='{dmarc_rua_xml}' resolve dns: {resolve}")
+    # Only use the PTR cache if it is not disabled in the config
+    if resolve == 0 or str(resolve_cache).lower() in ['0', 'false', 'f']:
+        ptr_cache_file      = None
+
     script_logger.debug(f"results file: '{result_log_file}'")
-    
-    # In theory all files have a extention, but "in the wild" I have seen reports where 
-    # all the dots (.) where replaced with spaces ( ) so the files don't have a extention anymore
-    if not dmarc_rua_xml.endswith('.xml'):
-        # do a very crude check if this is a xml file, read the first line and see if it starts with a < 
-        script_logger.warning(f"file='{dmarc_rua_xml}' doesn't have a .xml extention")
-        
-        with open(dmarc_rua_xml) as unknown_file:
-            content = unknown_file.read(1)
-            if content != '<':
-                script_logger.warning(f"file='{dmarc_rua_xml}' doesn't look like a xml file, it will be moved to the problem dir.")
-                shutil.move(dmarc_rua_xml, problem_dir)
-                exit(0)
-            else:
-                script_logger.debug(f"file='{dmarc_rua_xml}' seems to be a XML file, so continue processing it.")
-    
 
-    # Get all the info from the report
-    script_logger.debug(f"Start getting the data from file='{os.path.basename(os.path.normpath(dmarc_rua_xml))}'")
-    process_dmarc_xml(dmarc_rua_xml, output, resolve)
-    
-    # Remove the original file so we don't process it again the next time the script runs
-    try:
-        script_logger.debug(f"Delete file='{dmarc_rua_xml}'' now")
-        os.remove(dmarc_rua_xml)
-    except Exception:
-        script_logger.exception(f"Unable to delete file='{dmarc_rua_xml}'")
\ No newline at end of file
+    # The actual parsing is done by the DMARC_Parser class, so the ta-dmarc_converter.py script
+    # can also do this in one process for all files.
+    dmarc_parser            = dp.DMARC_Parser(script_logger, result_logger, output=output, resolve=resolve, problem_dir=problem_dir, ptr_cache_file=ptr_cache_file, resolve_concurrency=resolve_concurrency, resolve_deadline=resolve_deadline, resolve_cache_size=resolve_cache_size)
+    dmarc_parser.process_file(dmarc_rua_xml)
+    dmarc_parser.log_cache_statistics()
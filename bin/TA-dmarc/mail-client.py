@@ -35,13 +35,18 @@ SOFTWARE.
 ##################################################################
 
 import argparse
+import datetime
 import email
 import email.header
 import imaplib 
+import io
+import json
 import os
 import poplib
+import queue
 import re
 import sys
+import threading
 
 from io import StringIO
 
@@ -50,13 +55,14 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..
 
 from classes import splunk_info as si
 from classes import custom_logger as c_logger
+from classes import attachment_store as ast
+from classes import mail_decoder as md
 
-__version__ = "3.3.0"
+__version__ = "3.11.8"
 __author__ = 'Arnold Holzel'
 __license__ = 'Apache License 2.0'
 
 delete_files_after = 7 # days after which old parser files will be deleted 
-max_emails_per_fetch = 1000
 allowed_mail_subjects = [
                         'report domain', 
                         'dmarc aggregate report', 
@@ -101,7 +107,10 @@ splunk_paths = splunk_info.give_splunk_paths(script_dir)
 app_root_dir = splunk_paths['app_root_dir']                                             # The app root directory
 log_root_dir = os.path.normpath(app_root_dir + os.sep + 'logs')                         # The root directory for the logs
 attachment_dir = os.path.normpath(log_root_dir + os.sep + 'attach_raw')                 # The directory to store the attachments 
+attachment_tmp_dir = os.path.normpath(log_root_dir + os.sep + 'attach_tmp')             # The directory to store the attachments while they are downloaded
 app_log_dir = os.path.normpath(log_root_dir + os.sep + 'dmarc_splunk')                  # The directory to store the output for Splunk
+imap_state_file = os.path.normpath(log_root_dir + os.sep + 'imap_state.json')           # The file to keep the state of the IMAP mailbox between runs
+pop3_state_file = os.path.normpath(log_root_dir + os.sep + 'pop3_state.json')           # The file to keep the seen UIDL's of the POP3 mailbox between runs
 
 # Set the logfile to report everything in
 script_log_file = os.path.normpath(app_log_dir + os.sep + 'mail_parser.log')
@@ -113,12 +122,62 @@ if not os.path.exists(attachment_dir):
     os.makedirs(attachment_dir)
 if not os.path.exists(app_log_dir):
     os.makedirs(app_log_dir)
-    
+
 # Prepare the logger
 log_level = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'log_level')
 logger = c_logger.Logger()
 script_logger = logger.logger_setup('script_logger', level=log_level)
 
+# The attachments are downloaded to a temp file in the attachment_tmp_dir and moved to the attachment_dir when all the
+# attachments of the message are on disk. The temp files of a earlier run that was stopped while downloading are removed.
+attachment_store = ast.Attachment_Store(attachment_dir, attachment_tmp_dir, script_logger)
+attachment_store.cleanup()
+
+def make_binary(input):
+    if input == "0" or input.lower() == "false" or input.lower() == "f" or int(input) == 0:
+        output = 0
+    elif input == "1" or input.lower() == "true" or input.lower() == "t" or int(input) == 1:
+        output = 1
+    else:
+        output = 0
+        
+    return output
+
+# The IMAP search options
+imap_search_unseen = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'imap_search_unseen')
+imap_search_since = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'imap_search_since')
+imap_fetch_batch_size = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'imap_fetch_batch_size')
+imap_connections = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'imap_connections')
+attachment_chunk_size = splunk_info.get_config(str(splunk_paths['app_name'].lower()) + '.conf', 'main', 'attachment_chunk_size')
+
+if imap_search_unseen is not None:
+    imap_search_unseen = make_binary(imap_search_unseen)
+else:
+    imap_search_unseen = 0
+
+if imap_search_since is not None:
+    imap_search_since = make_binary(imap_search_since)
+else:
+    imap_search_since = 0
+
+# The number of messages to get with one IMAP FETCH
+try:
+    imap_fetch_batch_size = max(int(imap_fetch_batch_size), 1)
+except (TypeError, ValueError):
+    imap_fetch_batch_size = 200
+
+# The number of IMAP connections to process the batches with at the same time
+try:
+    imap_connections = max(int(imap_connections), 1)
+except (TypeError, ValueError):
+    imap_connections = 1
+
+# The max number of bytes of a attachment that is downloaded at once
+try:
+    attachment_chunk_size = max(int(attachment_chunk_size), 4096)
+except (TypeError, ValueError):
+    attachment_chunk_size = 1048576
+
 if args.use_conf_file:
     custom_conf_file = f"{splunk_paths['app_name'].lower()}.conf"
     script_logger.info(f"Getting configuration from conf file: '{custom_conf_file}'")
@@ -136,11 +195,476 @@ else:
     if not args.folder:
         args.folder = 'Inbox'
 
-def imap_mailbox():
-    global args, script_logger
-    # Set a counter to count the number of messages we processed
-    count = 0
+def decode_subject(message):
+    # Decode the subject of a message, some senders use encoded subjects
+    if message['Subject'] is None:
+        return ''
+
+    return str(email.header.make_header(email.header.decode_header(message['Subject'])))
+
+def parse_fetch_response(data):
+    """
+    Split the response of a (multi message) IMAP FETCH per message
+
+    INPUT:
+    data                | list      | The data part of the imaplib fetch response
+
+    OUTPUT:
+    messages            | dict      | message UID: (fetch info bytes, content bytes)
+    """
+    messages = {}
+
+    for item in data:
+        # every message is a tuple (b'<seq> (UID <uid> <fetch info> {<size>}', b'<content>'), followed by b')'
+        if isinstance(item, tuple):
+            uid = re.search(rb'UID (\d+)', item[0])
+
+            if uid:
+                messages[int(uid.group(1))] = (item[0], item[1])
+
+    return messages
+
+def split_fetch_response(data):
+    """
+    Split the response of a (multi message) IMAP FETCH per message, with all the response parts of the message.
+    Unlike parse_fetch_response this also works for responses with more than one literal per message.
+
+    INPUT:
+    data                | list      | The data part of the imaplib fetch response
+
+    OUTPUT:
+    messages            | dict      | message UID: list with the bytes and (bytes, literal bytes) items of the message
+    """
+    messages = {}
+    items = None
+
+    for item in data:
+        line = item[0] if isinstance(item, tuple) else item
+
+        if line is None:
+            continue
+
+        # A new message starts with: <seq> (, the rest of the message (after a literal) starts with a space or )
+        if re.match(rb'^\d+ \(', line):
+            uid = re.search(rb'UID (\d+)', line)
+            items = messages.setdefault(int(uid.group(1)), []) if uid else None
+
+        if items is not None:
+            items.append(item)
+
+    return messages
+
+def make_message_set(uids):
+    """
+    Make a IMAP message set of a list of UID's, consecutive UID's are combined to a range
+
+    INPUT:
+    uids                | list      | The UID's (int)
+
+    OUTPUT:
+    message_set         | string    | The message set, e.g.: 1:5,8,10:12
+    """
+    ranges = []
+
+    for uid in sorted(uids):
+        if ranges and uid == ranges[-1][1] + 1:
+            ranges[-1][1] = uid
+        else:
+            ranges.append([uid, uid])
+
+    return ','.join(str(first) if first == last else f"{first}:{last}" for first, last in ranges)
+
+def fetch_headers(connection, uids):
+    """
+    Get the subject and sender of multiple messages with one FETCH, without getting the complete
+    messages and without setting the \\Seen flag.
+
+    INPUT:
+    connection          | IMAP4     | The IMAP connection with the mailbox selected
+    uids                | list      | The UID's of the messages to get the headers for
+
+    OUTPUT:
+    headers             | dict      | message UID: (subject, sender)
+    """
+    headers = {}
+
+    if not uids:
+        return headers
+
+    try:
+        response, data = connection.uid('FETCH', make_message_set(uids), '(UID BODY.PEEK[HEADER.FIELDS (SUBJECT FROM CONTENT-TYPE)])')
+    except imaplib.IMAP4.error:
+        script_logger.exception("Could not fetch the message headers")
+        return headers
+
+    if response != 'OK':
+        script_logger.warning(f"Response is NOT OK, response: {response}")
+        return headers
+
+    for uid, (fetch_info, header_data) in parse_fetch_response(data).items():
+        message = email.message_from_bytes(header_data)
+        headers[uid] = (decode_subject(message), message['From'] or '')
+
+    return headers
+
+def is_attachment_name(filename):
+    # Only save the attachments with a extension of a (compressed) DMARC report
+    return filename is not None and (filename[-3:] == '.gz' or filename[-4:] == '.zip' or filename[-5:] == '.gzip')
+
+def save_message_attachments(emailid, lines):
+    """
+    Save the zip/gzip attachments of a complete message, the message is processed line by line
+    and the attachments are decoded while they are written to disk. The attachments are only
+    moved to the attachment_dir when the complete message is processed.
+
+    INPUT:
+    emailid             | int       | The id/UID of the message
+    lines               | iterable  | The lines of the message (bytes without the line break)
+
+    OUTPUT:
+    delete              | bool      | True if the message can get the delete flag
+    """
+    def open_part(part_headers):
+        message_headers = parser.headers
+
+        if not (message_headers.get_content_maintype() == 'multipart' or any(ctype in message_headers.get_content_type().lower() for ctype in allowed_content_types)):
+            return None
+
+        if part_headers.get('Content-Disposition') is None:
+            return None
+
+        # Get the attachment if it is a zip or gzip file and store it on disk
+        filename = part_headers.get_filename()
+
+        if not is_attachment_name(filename):
+            script_logger.warning(f"Message id: {emailid}, No valid attachement found. Attachement found: {filename}")
+            return None
+
+        script_logger.debug(f"Message id: {emailid}, Attachment found, name: {filename}, store attachement in: {attachment_dir}")
+        file_path = attachment_store.open(f"{emailid}.{len(temp_files) + 1}", filename)
+        temp_files.append(file_path.name)
+        return file_path
+
+    temp_files = []
+    parser = md.MIME_Stream_Parser(open_part, attachment_store.close)
+
+    try:
+        for line in lines:
+            parser.feed_line(line)
+
+        parser.close()
+    except Exception:
+        if parser.output is not None:
+            parser.output.close()
+
+        for temp_file in temp_files:
+            attachment_store.discard(temp_file)
+        raise
+
+    for temp_file in temp_files:
+        attachment_store.commit(temp_file)
+
+    if parser.defects:
+        script_logger.warning(f"Message id: {emailid}, the attachments are damaged and may not be complete: {', '.join(parser.defects)}")
+
+    if parser.headers is None:
+        return False
+
+    script_logger.debug(f"Message id: {emailid}, Content main type: {parser.headers.get_content_maintype()}, content type: {parser.headers.get_content_type()}")
+
+    # Give the mail the delete flag after reading and downloading attachments or if it doesn't have a zip/gzip attachement
+    return parser.headers.get_content_maintype() == 'multipart' or any(ctype in parser.headers.get_content_type().lower() for ctype in allowed_content_types)
+
+def fetch_bodystructures(connection, uids):
+    """
+    Get the BODYSTRUCTURE of multiple messages with one FETCH and select the attachment parts
+
+    INPUT:
+    connection          | IMAP4     | The IMAP connection with the mailbox selected
+    uids                | list      | The UID's of the messages
+
+    OUTPUT:
+    structures          | dict      | message UID: (delete, list with the attachment parts), messages without a (valid) BODYSTRUCTURE are not in the dict
+    """
+    structures = {}
+
+    try:
+        response, data = connection.uid('FETCH', make_message_set(uids), '(UID BODYSTRUCTURE)')
+    except imaplib.IMAP4.error as error:
+        script_logger.warning(f"Could not fetch the BODYSTRUCTURE of the messages: {make_message_set(uids)} error: {error}")
+        return structures
+
+    if response != 'OK':
+        script_logger.warning(f"Response is NOT OK, response: {response}")
+        return structures
+
+    for uid, items in split_fetch_response(data).items():
+        try:
+            bodystructure = md.parse_bodystructure(items)
+            parts = md.find_attachment_parts(bodystructure)
+        except (IndexError, TypeError, ValueError):
+            script_logger.debug(f"Message UID: {uid}, could not parse the BODYSTRUCTURE: {items}")
+            continue
+
+        # The same check as for a complete message: only multipart messages or messages of a allowed type are processed
+        main_type = 'multipart' if isinstance(bodystructure[0], list) else parts[0]['content_type']
+        delete = main_type == 'multipart' or any(ctype in main_type for ctype in allowed_content_types)
+
+        attachments = []
+
+        # The same selection as for a complete message: only the parts with a Content-Disposition and a zip/gzip name,
+        # a attached mail itself is skipped, its parts are in the list as well
+        for part in parts:
+            if part['disposition'] is None or part['content_type'] == 'message/rfc822':
+                continue
+
+            if is_attachment_name(part['filename']):
+                attachments.append(part)
+            else:
+                script_logger.warning(f"Message UID: {uid}, No valid attachement found. Attachement found: {part['filename']}")
+
+        script_logger.debug(f"Message UID: {uid}, Content main type: {main_type}, attachments: {[(part['section'], part['filename']) for part in attachments]}")
+        structures[uid] = (delete, attachments)
+
+    return structures
+
+def write_attachment_part(uid, part, chunks):
+    # Decode the (still encoded) chunks of a attachment part and write them to a temp file,
+    # the temp file is moved to the attachment_dir with attachment_store.commit() when the message is done
+    script_logger.debug(f"Message UID: {uid}, Attachment found, name: {part['filename']}, store attachement in: {attachment_dir}")
+    decoder = md.Transfer_Decoder(part['encoding'])
+    file_path = attachment_store.open(f"{uid}.{part['section']}", part['filename'])
+
+    try:
+        for chunk in chunks:
+            file_path.write(decoder.decode(chunk))
+        file_path.write(decoder.flush())
+    except Exception:
+        # Don't leave a truncated attachment behind when a chunk can't be fetched
+        file_path.close()
+        attachment_store.discard(file_path.name)
+        raise
+
+    attachment_store.close(file_path)
+
+    if decoder.defects:
+        script_logger.warning(f"Message UID: {uid}, the attachment: {part['filename']} is damaged and may not be complete: {', '.join(decoder.defects)}")
+
+    return file_path.name
+
+def fetch_part_chunks(connection, uid, section):
+    """
+    Get a part of a message in chunks of attachment_chunk_size with partial fetches: BODY.PEEK[<section>]<offset.length>
+
+    INPUT:
+    connection          | IMAP4     | The IMAP connection with the mailbox selected
+    uid                 | int       | The UID of the message
+    section             | string    | The section number of the part
+
+    OUTPUT:
+    chunk               | bytes     | The next chunk of the (still encoded) part, raises a IMAP4.error if a chunk can't be fetched
+    """
+    offset = 0
+
+    while True:
+        response, data = connection.uid('FETCH', str(uid), f"(UID BODY.PEEK[{section}]<{offset}.{attachment_chunk_size}>)")
+
+        if response != 'OK':
+            raise imaplib.IMAP4.error(f"Response is NOT OK, response: {response}")
+
+        chunk = b''
+        for item in split_fetch_response(data).get(uid, []):
+            if isinstance(item, tuple) and re.search(rb'BODY\[' + re.escape(section.encode()) + rb'\]', item[0]):
+                chunk = item[1]
+
+        if chunk:
+            yield chunk
+
+        if len(chunk) < attachment_chunk_size:
+            return
+
+        offset += len(chunk)
+
+def fetch_attachment_parts(connection, structures):
+    """
+    Download only the attachment parts of the messages and decode them while they are written to disk.
+    The messages with the same section numbers are fetched with one FETCH (max attachment_chunk_size
+    bytes of parts per FETCH), parts that are bigger than attachment_chunk_size are fetched in chunks
+    so they are never completely in memory.
+
+    INPUT:
+    connection          | IMAP4     | The IMAP connection with the mailbox selected
+    structures          | dict      | message UID: (delete, attachment parts) from fetch_bodystructures
+
+    OUTPUT:
+    delete_uids         | list      | The UID's of the messages that are done and can get the delete flag
+    done_uids           | list      | The UID's of the messages that are done but don't get the delete flag
+    """
+    delete_uids = []
+    done_uids = []
+    sections = {}
+    chunked_uids = []
+    temp_files = {}
+
+    for uid, (delete, attachments) in structures.items():
+        small_parts = tuple(part['section'] for part in attachments if (part['size'] or 0) <= attachment_chunk_size)
+
+        if small_parts:
+            # The size of the parts of the messages in one FETCH is max attachment_chunk_size (but at least one message),
+            # the complete response of a FETCH is in memory
+            size = sum(part['size'] or 0 for part in attachments if part['section'] in small_parts)
+            groups = sections.setdefault(small_parts, [])
+
+            if not groups or groups[-1][0] + size > attachment_chunk_size:
+                groups.append([0, []])
+
+            groups[-1][0] += size
+            groups[-1][1].append(uid)
+        elif attachments:
+            chunked_uids.append(uid)
+        elif delete:
+            delete_uids.append(uid)
+        else:
+            done_uids.append(uid)
+
+    for section_list, uids in ((section_list, uids) for section_list, groups in sections.items() for size, uids in groups):
+        fetch_items = ' '.join(f"BODY.PEEK[{section}]" for section in section_list)
+
+        try:
+            response, data = connection.uid('FETCH', make_message_set(uids), f"(UID {fetch_items})")
+        except imaplib.IMAP4.error as error:
+            script_logger.warning(f"Could not fetch the attachments of the messages: {make_message_set(uids)} error: {error}")
+            continue
+
+        if response != 'OK':
+            script_logger.warning(f"Response is NOT OK, response: {response}")
+            continue
+
+        for uid, items in split_fetch_response(data).items():
+            if uid not in structures:
+                continue
+
+            bodies = {}
+
+            for item in items:
+                if isinstance(item, tuple):
+                    section = re.search(rb'BODY\[([\d.]+)\]', item[0])
+                    if section:
+                        bodies[section.group(1).decode()] = item[1]
+
+            if any(section not in bodies for section in section_list):
+                script_logger.warning(f"Message UID: {uid}, not all attachments where in the fetch response")
+                continue
+
+            try:
+                for part in structures[uid][1]:
+                    if part['section'] in bodies:
+                        body = bodies[part['section']]
+                        temp_files.setdefault(uid, []).append(write_attachment_part(uid, part, (body[offset:offset + 65536] for offset in range(0, len(body), 65536))))
+            except Exception:
+                # Only this message is skipped, it is tried again the next run
+                script_logger.exception(f"Message UID: {uid}, could not save the attachments. Traceback: ")
+
+                for temp_file in temp_files.pop(uid, []):
+                    attachment_store.discard(temp_file)
+                continue
+
+            # The big parts of this message still need to be fetched
+            chunked_uids.append(uid)
+
+    for uid in chunked_uids:
+        delete, attachments = structures[uid]
+
+        try:
+            for part in attachments:
+                if (part['size'] or 0) > attachment_chunk_size:
+                    temp_files.setdefault(uid, []).append(write_attachment_part(uid, part, fetch_part_chunks(connection, uid, part['section'])))
+        except Exception as error:
+            # Only this message is skipped, it is tried again the next run
+            if isinstance(error, imaplib.IMAP4.error):
+                script_logger.warning(f"Message UID: {uid}, could not fetch the attachment. Error: {error}")
+            else:
+                script_logger.exception(f"Message UID: {uid}, could not save the attachments. Traceback: ")
+
+            for temp_file in temp_files.pop(uid, []):
+                attachment_store.discard(temp_file)
+            continue
+
+        # All the attachments of the message are downloaded
+        for temp_file in temp_files.pop(uid, []):
+            attachment_store.commit(temp_file)
+
+        if delete:
+            delete_uids.append(uid)
+        else:
+            done_uids.append(uid)
+
+    return delete_uids, done_uids
 
+def read_mailbox_state(state_file_name):
+    # Get the saved state of the current mailbox (host, user and folder) from the state file
+    try:
+        with open(state_file_name, 'r') as state_file:
+            return json.load(state_file).get(f"{args.user}@{args.host}/{args.folder}", {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        script_logger.warning(f"Could not read the state file: {state_file_name}, starting without state")
+        return {}
+
+def write_mailbox_state(state_file_name, mailbox_state):
+    # Save the state of the current mailbox, the other mailboxes in the file are kept as is
+    try:
+        with open(state_file_name, 'r') as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        state = {}
+
+    state[f"{args.user}@{args.host}/{args.folder}"] = mailbox_state
+
+    try:
+        with open(state_file_name + '.tmp', 'w') as state_file:
+            json.dump(state, state_file, indent=4)
+        os.replace(state_file_name + '.tmp', state_file_name)
+    except OSError:
+        script_logger.exception(f"Could not write the state file: {state_file_name}")
+
+def quote_search_string(search_string):
+    # Quote a string for use in a IMAP SEARCH command
+    return '"' + search_string.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def build_search_criteria(since=None):
+    """
+    Make the IMAP SEARCH criteria so the server only returns the (possible) DMARC messages
+
+    INPUT:
+    since               | date      | Only search for messages received on or after this date, None for all messages
+
+    OUTPUT:
+    criteria            | string    | The search criteria, e.g.: UNDELETED OR SUBJECT "report domain" SUBJECT "report_domain"
+    """
+    # IMAP SEARCH has no list of OR's, "OR a b c" is written as "OR OR a b c"
+    criteria = ['UNDELETED']
+    subjects = [f"SUBJECT {quote_search_string(subject)}" for subject in allowed_mail_subjects]
+    criteria.append('OR ' * (len(subjects) - 1) + ' '.join(subjects))
+
+    if imap_search_unseen == 1:
+        criteria.append('UNSEEN')
+
+    if since is not None:
+        # The date format must be 17-Oct-2026, don't use strftime because of the locale dependent month name
+        months = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+        criteria.append(f"SINCE {since.day}-{months[since.month - 1]}-{since.year}")
+
+    return ' '.join(criteria)
+
+def imap_connect():
+    """
+    Make a IMAP or IMAPS connection, login and select the folder
+
+    OUTPUT:
+    connection          | IMAP4     | The connection with the folder selected, None if that didn't work
+    """
     # Make a IMAP or IMAPS connection to the given server and on the given port
     if args.protocol == 'IMAPS':
         script_logger.debug(f"Setting up a IMAP SSL connection to server: {args.host} on port: {args.port}")
@@ -148,7 +672,7 @@ def imap_mailbox():
             connection = imaplib.IMAP4_SSL(args.host, args.port)
         except:
             script_logger.exception('Something went wrong with the IMAP4 SSL connection. Traceback: ')
-            exit(1)
+            return None
     else:
         script_logger.warning('Please consider using IMAPS instead of IMAP, now plain text passwords are send to the server.')
         script_logger.debug(f"Setting up a IMAP (No SSL) connection to server: {args.host} on port: {args.port}")
@@ -156,7 +680,7 @@ def imap_mailbox():
             connection = imaplib.IMAP4(args.host, args.port)
         except:
             script_logger.exception('Something went wrong with the IMAP4 connection. Traceback: ')
-            exit(1)
+            return None
  
     # Login to the mailbox
     script_logger.info(f"Logging in as user: {args.user}")
@@ -167,95 +691,280 @@ def imap_mailbox():
         script_logger.debug(f"Authentication succesfull for user: {args.user}")
     except imaplib.IMAP4.error as error:
         script_logger.exception(f"Authentication failed for user: {args.user}; error: {error}")
-        exit(1)
+        return None
 
     # Select the correct mailbox (folder) and check number of messages
     response, data = connection.select(args.folder)
     if response == 'OK':
-        num_of_msgs = data[0]
-        script_logger.info(f"There are {num_of_msgs0} messages in folder: {args.folder}")
+        num_of_msgs = int(data[0])
+        script_logger.info(f"There are {num_of_msgs} messages in folder: {args.folder}")
     else:
         error = str(data[0])
         script_logger.critical(f"There was a error selecting the folder: {args.folder} the error was: {error}")
-    
-    # Check the mailbox status
-    mailbox_status = connection.status(args.folder, '(MESSAGES RECENT UIDNEXT UIDVALIDITY UNSEEN)')
-    script_logger.debug(f"Mailbox status: {mailbox_status}")
+        return None
 
-    unseen_rex = re.search(r'(?:.*UNSEEN\s*)(\d+)', str(mailbox_status))
-    unseen_count = int(unseen_rex.group(1))
-    
-    # if unseen count is to high get the mails in batch mode
-    if unseen_count > max_emails_per_fetch:
-        msg_id_list = list(range(1,max_emails_per_fetch))
-        script_logger.warning(f"There are to many mails in the mailbox to get them all at once, only get the first {max_emails_per_fetch}")
-    else:
-        # Search for all messages
-        try:
-            response, msg_id_list = connection.search(None, 'ALL')
-            msg_id_list = msg_id_list[0].split()
-        except Exception as e:
-            script_logger.exception(f"Something did't go as expected: {e}")
-    
-    # loop through the mails in the mailbox and download the attachtments
-    for emailid in msg_id_list:
-        _, flag_before_response = connection.fetch(emailid, '(FLAGS)')
-        script_logger.debug(f"Message id: {emailid}, flags: {flag_before_response}")
-        
-        fetch_response, msg_data = connection.fetch(emailid, '(RFC822)')
-        message = email.message_from_bytes(msg_data[0][1])
-        subject = str(email.header.make_header(email.header.decode_header(message['Subject']))) 
-
-        if fetch_response == 'OK' and any(sub in subject.lower() for sub in allowed_mail_subjects):
-            # Search for all the dmarc messages, they should always contain the string 'Report Domain' but I check
-            # for a variety of strings from the allowed_mail_subjects list.
-            script_logger.debug(f"Message id: {emailid}, Response is OK, continue.")
-            sender = message['From']
-            
-            # Check to see if there is an actual sender....
-            if len(sender) == 0:
-                sender = 'unknown'
-            
-            script_logger.debug(f"Message id: {emailid}, Sender: {sender}")
-            script_logger.debug(f"Message id: {emailid}, Content main type: {message.get_content_maintype()}, content type: {message.get_content_type()}")
-            
-            # Get the attachment if it is a zip or gzip file and store it on disk
-            if message.get_content_maintype() == 'multipart' or any(ctype in message.get_content_type().lower() for ctype in allowed_content_types):
-                for part in message.walk():
-                    if part.get_content_maintype() != 'multipart' and part.get('Content-Disposition') is not None:
-                        # Save the attachement in the given directory
-                        filename = part.get_filename()
-
-                        if filename != None and (filename[-3:] == '.gz' or filename[-4:] == '.zip' or filename[-5:] == '.gzip'):
-                            script_logger.debug(f"Message id: {emailid}, Attachment found, name: {filename}")
-                            # Replace the '!' for a '_' so is doesn't need to be escaped later on
-                            filename = re.sub(r'(\!)', r'_', filename)
-                        
-                            file_path = open(os.path.normpath(attachment_dir + os.sep + filename), 'wb')
-                            script_logger.debug(f"Message id: {emailid}, Store attachement as: {os.path.normpath(attachment_dir + os.sep + filename)}")
-                            file_path.write(part.get_payload(decode=True))
-                            file_path.close()
-                        else:
-                            script_logger.warning(f"Message id: {emailid}, No valid attachement found. Attachement found: {filename}")
-            
-                # Give the mail the delete flag after reading and downloading attachments or if it doesn't have a zip/gzip attachement
-                _, response = connection.store(emailid, '+FLAGS', r'(\Deleted)')
-                
-        elif not any(sub in subject.lower() for sub in allowed_mail_subjects):
-            script_logger.info(f"Message id: {emailid}, is not a DMARC message. Message subject: {subject}")
+    return connection
+
+def process_imap_batch(connection, batch):
+    """
+    Process a batch of messages: get the headers, the BODYSTRUCTURE and the attachments 
+    and set the seen and delete flags of the DMARC messages
+
+    INPUT:
+    connection          | IMAP4     | The IMAP connection with the folder selected
+    batch               | list      | The UID's of the messages
+
+    OUTPUT:
+    count               | int       | The number of processed messages
+    done_uids           | set       | The UID's of the messages that are processed without problems
+    """
+    count = 0
+    done_uids = set()
+
+    # Get the headers of the messages with one FETCH and only download the 
+    # attachments of the messages that have a DMARC subject, also with one FETCH.
+    headers = fetch_headers(connection, batch)
+    dmarc_uids = []
+
+    for emailid in batch:
+        if emailid not in headers:
+            script_logger.warning(f"Message UID: {emailid}, could not get the headers")
+            continue
+
+        subject, sender = headers[emailid]
+
+        if not any(sub in subject.lower() for sub in allowed_mail_subjects):
+            script_logger.info(f"Message UID: {emailid}, is not a DMARC message. Message subject: {subject}")
+            done_uids.add(emailid)
+            count +=1
         else:
-            script_logger.warning(f"Response is NOT OK, response: {response}")
+            dmarc_uids.append(emailid)
 
-        # Check if there where to many mails to process at once, if so append 1 to the end of the msg_id_list
-        if msg_id_list[-1] < unseen_count:
-            msg_id_list.append(msg_id_list[-1]+1)
+    if not dmarc_uids:
+        return count, done_uids
+
+    for emailid in dmarc_uids:
+        # Search for all the dmarc messages, they should always contain the string 'Report Domain' but I check
+        # for a variety of strings from the allowed_mail_subjects list.
+        sender = headers[emailid][1]
+        
+        # Check to see if there is an actual sender....
+        if len(sender) == 0:
+            sender = 'unknown'
+        
+        script_logger.debug(f"Message UID: {emailid}, Sender: {sender}")
+
+    # Get the BODYSTRUCTURE of the messages and only download the attachments
+    structures = fetch_bodystructures(connection, dmarc_uids)
+    delete_uids, structure_done_uids = fetch_attachment_parts(connection, structures)
+    done_uids.update(structure_done_uids)
+    count += len(delete_uids) + len(structure_done_uids)
+
+    # The complete message is downloaded for the messages without a (valid) BODYSTRUCTURE
+    rfc822_uids = [emailid for emailid in dmarc_uids if emailid not in structures]
+
+    # The complete messages are fetched one by one, imaplib reads the complete response in memory
+    for emailid in rfc822_uids:
+        # BODY.PEEK[] so the messages are not marked as seen before the attachments are saved
+        try:
+            fetch_response, msg_data = connection.uid('FETCH', str(emailid), '(UID BODY.PEEK[])')
+        except imaplib.IMAP4.error as error:
+            script_logger.warning(f"Could not fetch the message: {emailid} error: {error}")
+            fetch_response, msg_data = 'NO', []
+
+        if fetch_response != 'OK':
+            script_logger.warning(f"Response is NOT OK, response: {fetch_response}")
+
+        messages = parse_fetch_response(msg_data)
+
+        if emailid not in messages:
+            script_logger.warning(f"Message UID: {emailid}, was not in the fetch response")
+            continue
+
+        script_logger.debug(f"Message UID: {emailid}, Response is OK, continue.")
+
+        lines = (line.rstrip(b'\r\n') for line in io.BytesIO(messages[emailid][1]))
+
+        try:
+            if save_message_attachments(emailid, lines):
+                delete_uids.append(emailid)
+            else:
+                done_uids.add(emailid)
+        except Exception:
+            # Only this message is skipped, it is tried again the next run
+            script_logger.exception(f"Message UID: {emailid}, could not save the attachments. Traceback: ")
+            continue
 
         count +=1
-    
+
+    # Set the seen and delete flags of the whole batch at once
+    if delete_uids:
+        try:
+            store_response, _ = connection.uid('STORE', make_message_set(delete_uids), '+FLAGS.SILENT', r'(\Seen \Deleted)')
+        except imaplib.IMAP4.error as error:
+            script_logger.warning(f"Could not set the delete flag on the messages: {make_message_set(delete_uids)} error: {error}")
+            store_response = 'NO'
+
+        if store_response == 'OK':
+            done_uids.update(delete_uids)
+        else:
+            script_logger.warning(f"Response is NOT OK, response: {store_response}")
+
+    return count, done_uids
+
+def imap_worker(batches, results, results_lock):
+    """
+    Process batches of messages with a own IMAP connection until there are no batches left
+
+    INPUT:
+    batches             | Queue     | The batches (lists of UID's) to process
+    results             | dict      | The shared count and done_uids of all workers
+    results_lock        | Lock      | Lock for the results
+    """
+    connection = imap_connect()
+
+    if connection is None:
+        # The other workers will process the batches
+        return
+
+    try:
+        while True:
+            try:
+                batch = batches.get_nowait()
+            except queue.Empty:
+                break
+
+            batch_count, batch_done_uids = process_imap_batch(connection, batch)
+
+            with results_lock:
+                results['count'] += batch_count
+                results['done_uids'].update(batch_done_uids)
+    except Exception:
+        # The messages of the batches that are not done will be processed the next run
+        script_logger.exception(f"Something went wrong in IMAP worker: {threading.current_thread().name}")
+    finally:
+        try:
+            connection.logout()
+        except Exception:
+            pass
+
+def imap_mailbox():
+    global args, script_logger
+    # Set a counter to count the number of messages we processed
+    count = 0
+
+    connection = imap_connect()
+
+    if connection is None:
+        exit(1)
+
+    # Get the UIDVALIDITY of the folder from the select response, if it is not the same as in the state file
+    # the UID's of the last run are no longer valid and all messages need to be checked again.
+    mailbox_state = read_mailbox_state(imap_state_file)
+    _, uidvalidity = connection.response('UIDVALIDITY')
+
+    if uidvalidity[0] is None:
+        _, status = connection.status(args.folder, '(UIDVALIDITY)')
+        uidvalidity = re.findall(rb'UIDVALIDITY (\d+)', status[0])
+
+    uidvalidity = int(uidvalidity[0])
+
+    if mailbox_state.get('uidvalidity') != uidvalidity:
+        if 'uidvalidity' in mailbox_state:
+            script_logger.warning(f"The UIDVALIDITY of folder: {args.folder} changed from {mailbox_state['uidvalidity']} to {uidvalidity}, all messages will be checked again")
+
+        mailbox_state['uidvalidity'] = uidvalidity
+        mailbox_state['last_uid'] = 0
+
+    last_uid = mailbox_state['last_uid']
+    script_logger.debug(f"UIDVALIDITY: {uidvalidity}, last processed UID: {last_uid}")
+
+    # Let the server search for the DMARC messages, if enabled only for the unseen messages and/or the messages
+    # since the last run. SINCE only works with dates (no time) so search from the day before the last run.
+    run_date = datetime.date.today()
+    since = None
+
+    if imap_search_since == 1 and 'last_run' in mailbox_state:
+        since = datetime.date.fromisoformat(mailbox_state['last_run']) - datetime.timedelta(days=1)
+
+    search_criteria = build_search_criteria(since)
+
+    # Only the messages after the last processed UID
+    search_criteria = f"UID {last_uid + 1}:* {search_criteria}"
+    script_logger.debug(f"IMAP search criteria: {search_criteria}")
+
+    try:
+        response, uid_list = connection.uid('SEARCH', None, search_criteria)
+    except imaplib.IMAP4.error as error:
+        # Not all servers can handle all search criteria, fall back to all messages and filter on the subject here
+        script_logger.warning(f"The server could not handle the search, searching for all messages instead. Error: {error}")
+        response, uid_list = connection.uid('SEARCH', None, f"UID {last_uid + 1}:*")
+
+    if response == 'OK':
+        # n:* always matches the message with the highest UID, even if that UID is lower than n, so filter those out
+        uid_list = sorted(int(uid) for uid in uid_list[0].split() if int(uid) > last_uid)
+        script_logger.info(f"Found {len(uid_list)} possible DMARC messages in folder: {args.folder}")
+    else:
+        script_logger.warning(f"Response is NOT OK, response: {response}")
+        uid_list = []
+
+    # The UID's that are processed without problems. The checkpoint is only moved up to the first UID 
+    # that had a problem so that message (and the ones after it) will be tried again the next run.
+    done_uids = set()
+
+    # Process the messages in batches, with more than one connection the batches are divided over
+    # the connections. The delete flags are only set after the attachments are written to disk, 
+    # the messages are deleted (EXPUNGE) after all the connections are done.
+    batches = [uid_list[batch_start:batch_start + imap_fetch_batch_size] for batch_start in range(0, len(uid_list), imap_fetch_batch_size)]
+    connections = min(imap_connections, len(batches))
+
+    if connections > 1:
+        script_logger.info(f"Processing {len(batches)} batches with {connections} IMAP connections")
+        batch_queue = queue.Queue()
+        results = {'count': 0, 'done_uids': done_uids}
+        results_lock = threading.Lock()
+
+        for batch in batches:
+            batch_queue.put(batch)
+
+        workers = [threading.Thread(target=imap_worker, args=(batch_queue, results, results_lock), name=f"imap_worker_{n}") for n in range(connections)]
+
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        count = results['count']
+
+        # The first connection was not used while the workers did there work, it could be disconnected by the server
+        try:
+            connection.noop()
+        except (imaplib.IMAP4.abort, OSError):
+            script_logger.info("The IMAP connection was closed by the server, reconnecting")
+            connection = imap_connect()
+
+            if connection is None:
+                exit(1)
+    else:
+        for batch in batches:
+            batch_count, batch_done_uids = process_imap_batch(connection, batch)
+            count += batch_count
+            done_uids.update(batch_done_uids)
+
     script_logger.info(f"Processed {count} messages.")
     
     # Delete all the messages with the delete flag set
     _, response = connection.expunge()
+
+    # Save the last UID of the messages that are all processed and the date of this run for the next SINCE search
+    for uid in uid_list:
+        if uid not in done_uids:
+            break
+        last_uid = uid
+
+    mailbox_state['last_uid'] = last_uid
+    mailbox_state['last_run'] = run_date.isoformat()
+    write_mailbox_state(imap_state_file, mailbox_state)
     
     # Close the mailbox
     connection.close()
@@ -263,6 +972,50 @@ def imap_mailbox():
     # Logout
     connection.logout()
  
+def pop3_retr_lines(connection, msg_id):
+    """
+    RETR a POP3 message line by line instead of getting the complete message in memory
+    like poplib's retr() does.
+
+    poplib has no public API to read a response line by line, so this adapter uses the
+    internal _putcmd(), _getresp() and _getline() methods of POP3/POP3_SSL (the same ones
+    retr() uses). If a Python version doesn't have them, the message is read with the
+    public retr() (complete message in memory) and given line by line.
+
+    INPUT:
+    connection          | POP3      | The POP3 connection
+    msg_id              | int       | The message number
+
+    OUTPUT:
+    line                | bytes     | The next line of the message without the line break
+
+    NOTE: the lines must be read up to the end, also if the processing of the message fails,
+    the rest of the response is otherwise read as the response of the next command.
+    """
+    if not all(hasattr(connection, method) for method in ('_putcmd', '_getresp', '_getline')):
+        script_logger.debug(f"poplib has no line by line RETR, fetching the complete mail with id {msg_id}")
+        server_msg, lines, octets = connection.retr(msg_id)
+        script_logger.debug(f"Server response for fetching mail with id {msg_id}; {server_msg}")
+
+        # retr() already removed the extra dots
+        yield from lines
+        return
+
+    connection._putcmd(f"RETR {msg_id}")
+    server_msg = connection._getresp()
+    script_logger.debug(f"Server response for fetching mail with id {msg_id}; {server_msg}")
+
+    while True:
+        line, _ = connection._getline()
+
+        # The end of the message is a line with only a dot, lines that start with a dot get a extra dot
+        if line == b'.':
+            return
+        if line.startswith(b'..'):
+            line = line[1:]
+
+        yield line
+
 def pop3_mailbox():
     global args, script_logger
     import fnmatch
@@ -314,59 +1067,79 @@ def pop3_mailbox():
     totalcount, size = connection.stat()
     script_logger.debug(f"There are {totalcount} messages to process. Mailbox size is {size} bytes")
     
-    for emailid in range(totalcount):
-        (server_msg, lines, _) = connection.retr(emailid+1)
-        script_logger.debug(f"Server response for fetching mail with id {emailid}; {server_msg}")
+    # Get the unique id's of the messages, the messages that are not DMARC messages stay in the mailbox
+    # and there UIDL is kept in the state file so they are not checked again the next run.
+    mailbox_state = read_mailbox_state(pop3_state_file)
+    seen_uidls = set(mailbox_state.get('seen_uidls', []))
+
+    try:
+        _, uidl_lines, _ = connection.uidl()
+        uidls = {int(line.split()[0]): line.split()[1].decode() for line in uidl_lines}
+    except poplib.error_proto as error:
+        script_logger.warning(f"The server doesn't support UIDL, all messages will be checked. Error: {error}")
+        uidls = {}
+
+    for actual_email_id in range(1, totalcount + 1):
+        uidl = uidls.get(actual_email_id)
 
-        raw_email = b'\r\n'.join(lines)
-        parsed_email = email.message_from_bytes(raw_email)
-        message_subject = str(email.header.make_header(email.header.decode_header(parsed_email['Subject'])))
-            
-        actual_email_id = emailid + 1
+        if uidl in seen_uidls:
+            script_logger.debug(f"Message id: {actual_email_id}, UIDL: {uidl} is already checked before, skipping it")
+            continue
+
+        # Only get the headers to check the subject
+        try:
+            (server_msg, lines, _) = connection.top(actual_email_id, 0)
+        except poplib.error_proto as error:
+            script_logger.warning(f"Message id: {actual_email_id}, could not get the headers. Error: {error}")
+            continue
+
+        script_logger.debug(f"Server response for fetching the headers of mail with id {actual_email_id}; {server_msg}")
+        message_headers = email.message_from_bytes(b'\r\n'.join(lines))
+        message_subject = decode_subject(message_headers)
 
         # Check the subject, only process the dmarc messages, they always contain one of the strings from the allowed_mail_subjects
-        if any(sub in message_subject.lower() for sub in allowed_mail_subjects):
-            # Get email sender
-            sender = parsed_email['From']
-            
-            # Check to see if there is an actual sender....
-            if len(sender) > 0:
-                sender = str(sender[0])
-            else:
-                sender = 'unknown'
-            
-            script_logger.debug(f"Message id: {actual_email_id}, Sender: {sender}")
-            script_logger.debug(f"Message id: {actual_email_id}, Content main type: {parsed_email.get_content_maintype()}, content type: {parsed_email.get_content_type()}")
-            
-            # Get the attachment if it is a zip or gzip file and store it on disk
-            if parsed_email.get_content_maintype() == 'multipart' or any(ctype in parsed_email.get_content_type().lower() for ctype in allowed_content_types):
-                for part in parsed_email.walk():
-                    if part.get_content_maintype() != 'multipart' and part.get('Content-Disposition') is not None:
-                        
-                        # Save the attachement in the given directory
-                        filename = part.get_filename()
-                        if filename != None and (filename[-3:] == '.gz' or filename[-4:] == '.zip' or filename[-5:] == '.gzip'):
-                            script_logger.debug(f"Message id: {actual_email_id}, Attachment found, name: {filename}")
-                            # Replace the '!' for a '_' so is doesn't need to be escaped later on
-                            filename = re.sub(r'(\!)', r'_', filename)
-                        
-                            file_path = open(os.path.normpath(attachment_dir + os.sep + filename), 'a+b')
-                            script_logger.debug(f"Message id: {actual_email_id}, Store attachement as: {os.path.normpath(attachment_dir + os.sep + filename)}")
-                            file_path.write(part.get_payload(decode=True))
-                            file_path.close()
-                        else:
-                            script_logger.warning(f"Message id: {actual_email_id}, No valid attachement found. Attachement found: {filename}")
-            # Delete mail after reading and downloading attachments or if it doesn't have a zip/gzip attachement
-            connection.dele(actual_email_id)
-            count += 1
-        else:
-            script_logger.debug(f"Message id: {actual_email_id}, is not a DMARC message. Message subject: {message_subject}; body: {parsed_email}")
+        if not any(sub in message_subject.lower() for sub in allowed_mail_subjects):
+            script_logger.debug(f"Message id: {actual_email_id}, is not a DMARC message. Message subject: {message_subject}")
+
+            if uidl is not None:
+                seen_uidls.add(uidl)
+
+            continue
+
+        # Get email sender
+        sender = message_headers['From']
         
-        emailid += 1
+        # Check to see if there is an actual sender....
+        if sender is None or len(sender) == 0:
+            sender = 'unknown'
+        
+        script_logger.debug(f"Message id: {actual_email_id}, Sender: {sender}")
+
+        # Get the message line by line and save the zip/gzip attachments while the message comes in
+        lines = pop3_retr_lines(connection, actual_email_id)
+
+        try:
+            save_message_attachments(actual_email_id, lines)
+        except Exception:
+            script_logger.exception(f"Message id: {actual_email_id}, could not save the attachments, the message is not deleted. Traceback: ")
+
+            # Read the rest of the message up to the terminating dot, otherwise the next command gets the rest of the message as response
+            for _ in lines:
+                pass
+            continue
+
+        # Delete mail after reading and downloading attachments or if it doesn't have a zip/gzip attachement
+        connection.dele(actual_email_id)
+        count += 1
  
     script_logger.info(f"Total attachments downloaded: {count}")
     # Do a clean exit of the mailbox so all the mails will be deleted
     connection.quit()
+
+    # Only keep the UIDL's of the messages that are still in the mailbox
+    if uidls:
+        mailbox_state['seen_uidls'] = sorted(seen_uidls & set(uidls.values()))
+        write_mailbox_state(pop3_state_file, mailbox_state)
     
     if log_level < 20:
         stdout_output = sys.stdout.getvalue()
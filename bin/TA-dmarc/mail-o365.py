@@ -31,13 +31,18 @@ SOFTWARE.
 ##################################################################
 
 import argparse
-import base64
+import concurrent.futures
+import contextlib
 import datetime
+import hashlib
+import itertools
 import json
 import os
 import re
 import requests
+import requests.adapters
 import sys
+import time
 
 # add the lib dir to the path to import libs from there
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "..", "lib"))
@@ -46,12 +51,20 @@ import msal
 
 from classes import splunk_info as si
 from classes import custom_logger as c_logger
+from classes import attachment_store as ast
+from classes import graph_throttle as gt
 
-__version__ = "1.2.1"
+__version__ = "1.12.7"
 __author__ = 'Arnold Holzel'
 __license__ = 'Apache License 2.0'
 
-max_emails_per_fetch = 500
+messages_per_page = 100
+message_fields = 'sender,subject,hasAttachments,receivedDateTime,isRead'
+batch_size = 20                     # The max number of requests in one Graph JSON $batch
+batch_max_retries = 3               # The max number of times a failed (throttled) request in a batch is send again
+max_retry_wait = 60                 # The max number of seconds to wait before a retry
+graph_max_retries = 5               # The max number of times a throttled (429/503/504) Graph request is send again
+max_processed_ids = 5000            # The max number of ID's of processed messages kept in the state file (delta), changed messages are in the delta again
 allowed_mail_subjects = [
                         'report domain', 
                         'dmarc aggregate report', 
@@ -83,7 +96,7 @@ options.add_argument('-t', '--tenant_id', help='The tenantID to use for the conn
 options.add_argument('-s', '--client_secret', help='The client secret to use for the connection')
 options.add_argument('-u', '--user', help='user\'s email id')
 options.add_argument('-f', '--folder', help='mail folder from which the mail to retrieve', default='Inbox')
-options.add_argument('-a', '--action', help='The action to take when a mail is processed; move/delete/mark_read', default='mark_read')
+options.add_argument('-a', '--action', help='The action to take when a mail is processed; move/delete/mark_read/none (none only with o365_delta_sync)', default='mark_read')
 options.add_argument('-m', '--move_to', help='The folder to move emails to the following variables can be used \
     [year] [month] [day] [ week] Example: Inbox/done/[year]/week_[week] will become Inbox/done/2023/week_03', default='Inbox/done/[year]/week_[week]')
 options.add_argument('--proxy', action='store_true', help='Use a proxy server to connect to the internet', default=False)
@@ -92,8 +105,13 @@ options.add_argument('-y', '--proxy_user', help='The user to authenticate to the
 options.add_argument('-z', '--proxy_pwd', help='The password for the proxy user if needed', default='default_None')
 options.add_argument('-v', '--verbose', action='store_true', help='enable verbose logging on the CLI')
 options.add_argument('--sessionKey', help='The splunk session key to use')
+options.add_argument('--login_url', help='The Microsoft login url, only change this for testing against a local (mock) server', default=LOGIN_URL)
+options.add_argument('--graph_url', help='The Microsoft Graph url, only change this for testing against a local (mock) server', default=GRAPH_URL)
 args = options.parse_args()
 
+LOGIN_URL = args.login_url.rstrip('/')
+GRAPH_URL = args.graph_url.rstrip('/')
+
 if args.sessionKey is None:
     logger = c_logger.Logger()
     script_logger = logger.logger_setup('script_logger', level=20)
@@ -118,6 +136,7 @@ splunk_paths = splunk_info.give_splunk_paths(script_dir)
 app_root_dir = splunk_paths['app_root_dir']                                             # The app root directory
 log_root_dir = os.path.normpath(app_root_dir + os.sep + 'logs')                         # The root directory for the logs
 attachment_dir = os.path.normpath(log_root_dir + os.sep + 'attach_raw')                 # The directory to store the attachments 
+attachment_tmp_dir = os.path.normpath(log_root_dir + os.sep + 'attach_tmp')             # The directory to store the attachments while they are downloaded
 app_log_dir = os.path.normpath(log_root_dir + os.sep + 'dmarc_splunk')                  # The directory to store the output for Splunk
 
 # Set the logfile to report everything in
@@ -130,12 +149,75 @@ if not os.path.exists(attachment_dir):
     os.makedirs(attachment_dir)
 if not os.path.exists(app_log_dir):
     os.makedirs(app_log_dir)
-    
+
 # Prepare the logger
 log_level = splunk_info.get_config(f"{splunk_paths['app_name'].lower()}.conf", 'main', 'log_level')
 logger = c_logger.Logger()
 script_logger = logger.logger_setup('script_logger', level=log_level)
 
+# The attachments are downloaded to a temp file in the attachment_tmp_dir and moved to the attachment_dir when all the
+# attachments of the message are on disk. The temp files of a earlier run that was stopped while downloading are removed.
+attachment_store = ast.Attachment_Store(attachment_dir, attachment_tmp_dir, script_logger)
+attachment_store.cleanup()
+
+def make_binary(input):
+    if input == "0" or input.lower() == "false" or input.lower() == "f" or int(input) == 0:
+        output = 0
+    elif input == "1" or input.lower() == "true" or input.lower() == "t" or int(input) == 1:
+        output = 1
+    else:
+        output = 0
+        
+    return output
+
+# The max number of connections to the Graph API that are kept open and reused during the run
+o365_pool_size = splunk_info.get_config(f"{splunk_paths['app_name'].lower()}.conf", 'main', 'o365_pool_size')
+
+try:
+    o365_pool_size = max(int(o365_pool_size), 1)
+except (TypeError, ValueError):
+    o365_pool_size = 4
+
+# The max number of messages that are checked per run, 0 = no max
+o365_max_messages = splunk_info.get_config(f"{splunk_paths['app_name'].lower()}.conf", 'main', 'o365_max_messages')
+
+try:
+    o365_max_messages = max(int(o365_max_messages), 0)
+except (TypeError, ValueError):
+    o365_max_messages = 5000
+
+# The number of messages of which the attachments are downloaded at the same time
+o365_download_threads = splunk_info.get_config(f"{splunk_paths['app_name'].lower()}.conf", 'main', 'o365_download_threads')
+
+try:
+    o365_download_threads = max(int(o365_download_threads), 1)
+except (TypeError, ValueError):
+    o365_download_threads = 4
+
+# Keep the folder ID's between the runs
+o365_folder_cache = splunk_info.get_config(f"{splunk_paths['app_name'].lower()}.conf", 'main', 'o365_folder_cache')
+
+if o365_folder_cache is not None:
+    o365_folder_cache = make_binary(o365_folder_cache)
+else:
+    o365_folder_cache = 0
+
+# Keep the access token between the runs
+o365_token_cache = splunk_info.get_config(f"{splunk_paths['app_name'].lower()}.conf", 'main', 'o365_token_cache')
+
+if o365_token_cache is not None:
+    o365_token_cache = make_binary(o365_token_cache)
+else:
+    o365_token_cache = 1
+
+# Only get the new and changed messages since the last run
+o365_delta_sync = splunk_info.get_config(f"{splunk_paths['app_name'].lower()}.conf", 'main', 'o365_delta_sync')
+
+if o365_delta_sync is not None:
+    o365_delta_sync = make_binary(o365_delta_sync)
+else:
+    o365_delta_sync = 1
+
 # check if a conf file is used or that the info is past via de CLI
 if args.use_conf_file:
     custom_conf_file = f"{splunk_paths['app_name'].lower()}.conf"
@@ -205,13 +287,128 @@ if client_id is None or tenant_id is None or client_secret is None or user is No
     script_logger.error("Not all the needed o365 fields are configured or accessable.")
     exit(1)
 
+if action.lower() == 'none' and not o365_delta_sync:
+    script_logger.error("The mail action 'none' can only be used with o365_delta_sync = 1; mails will be marked as read but please fix this!")
+    action = 'mark_read'
+
 FOLDER_ENDPOINT = f"{GRAPH_URL}/v1.0/users/{user}/mailFolders"
 MESSAGE_ENDPOINT = f"{GRAPH_URL}/v1.0/users/{user}/messages"
 
+# One session for all the Graph requests of this run, so the connections (and the TLS handshakes)
+# are reused instead of a new connection for every request. The bearer token is added after the login.
+graph_session = requests.Session()
+graph_session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=o365_pool_size, pool_maxsize=max(o365_pool_size, o365_download_threads + 1)))
+graph_session.headers.update({ 'Accept' : 'application/json', 'Connection' : 'keep-alive' })
+
+if proxy_use:
+    graph_session.proxies.update(proxies)
+
+# All the threads wait if Graph throttles a request, and less requests are done at the same time
+graph_throttle = gt.Graph_Throttle(o365_download_threads)
+
+# The ID's of the mail folders, so every folder is only looked up once per run. The key is the
+# lowercase path of the folder (inbox/done/2023), the value the ID with a leading /
+folder_cache = {}
+listed_folders = set()                  # The folders of which all child folders are in the cache
+
+# The delta link of the folder and the messages that need to be tried again
+state_file_name = os.path.normpath(log_root_dir + os.sep + 'o365_state.json')
+
+# The folder ID's of the previous runs, only used after they are checked
+folder_cache_file = os.path.normpath(log_root_dir + os.sep + 'o365_folder_cache.json')
+saved_folder_cache = {}
+
+# The access token is valid for about an hour, so it is kept in a file that only the splunk user can read
+# and the next runs use it until it (almost) expires.
+token_cache_file = os.path.normpath(log_root_dir + os.sep + 'o365_token_cache.json')
+
+def read_token_cache():
+    # Get the token cache of the previous runs, a empty cache if there is none (or it can't be read)
+    token_cache = msal.SerializableTokenCache()
+
+    try:
+        with open(token_cache_file, 'r') as cache_file:
+            token_cache.deserialize(cache_file.read())
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError):
+        script_logger.warning(f"Could not read the token cache file: {token_cache_file}, a new token will be requested")
+
+    return token_cache
+
+def write_token_cache(token_cache):
+    # Save the token cache if there is a new token, the file is only readable for the user that runs the script
+    if not token_cache.has_state_changed:
+        return
+
+    try:
+        cache_descriptor = os.open(token_cache_file + '.tmp', os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        os.chmod(token_cache_file + '.tmp', 0o600)
+
+        with os.fdopen(cache_descriptor, 'w') as cache_file:
+            cache_file.write(token_cache.serialize())
+        os.replace(token_cache_file + '.tmp', token_cache_file)
+    except OSError:
+        script_logger.exception(f"Could not write the token cache file: {token_cache_file}")
+
+if o365_token_cache:
+    token_cache = read_token_cache()
+else:
+    token_cache = None
+
 app = msal.ConfidentialClientApplication(
     client_id=client_id,
     client_credential=client_secret,
-    authority=f'{LOGIN_URL}/{tenant_id}')
+    token_cache=token_cache,
+    authority=f'{LOGIN_URL}/{tenant_id}',
+    validate_authority=(LOGIN_URL == 'https://login.microsoftonline.com'))
+
+def graph_request(method, endpoint, **kwargs):
+    """
+    Perform a request against the GRAPH API with the session of this run. If the request is throttled (HTTP 429/503/504)
+    all the threads wait for the Retry-After and the request is send again, max graph_max_retries times.
+    With stream=True the slot of the graph_throttle is kept until the body is read, use graph_stream_request for that.
+    
+    INPUT
+    method              | string    | The HTTP method
+    endpoint            | string    | The endpoint to talk to
+    kwargs              |           | The other arguments for requests (headers, json, stream, ...)
+
+    OUTPUT:
+    response            | object    | The requests response, of the last try if it kept being throttled
+    """
+    for attempt in range(graph_max_retries + 1):
+        graph_throttle.acquire()
+
+        try:
+            response = graph_session.request(method, endpoint, **kwargs)
+        except Exception:
+            graph_throttle.release()
+            raise
+
+        if response.status_code in (429, 503, 504) and attempt < graph_max_retries:
+            retry_after = get_retry_after(response.headers, attempt)
+            graph_throttle.release(retry_after)
+            script_logger.debug(f"HTTP {response.status_code} recieved for endpoint: {endpoint}, trying again in {retry_after} seconds")
+            response.close()
+            continue
+
+        if not kwargs.get('stream'):
+            graph_throttle.release()
+
+        return response
+
+@contextlib.contextmanager
+def graph_stream_request(method, endpoint, **kwargs):
+    # A streamed request, the body is only downloaded while it is read. So the slot of the graph_throttle
+    # is released when the response is closed and not when the headers are recieved.
+    response = graph_request(method, endpoint, stream=True, **kwargs)
+
+    try:
+        yield response
+    finally:
+        response.close()
+        graph_throttle.release()
 
 def get_request(endpoint, token):
     """
@@ -227,149 +424,533 @@ def get_request(endpoint, token):
     if not token:
         return None
     
-    headers = { 'Authorization': f'Bearer {token}' }
-    
     try:
-        if proxy_use:
-            response = requests.get(endpoint, headers=headers, proxies=proxies)
-        else:
-            response = requests.get(endpoint, headers=headers)
+        response = graph_request('GET', endpoint)
     except Exception as exception:
         script_logger.exception(f"Connection error {type(exception).__name__}; ")
-
+        return None
 
     if response.status_code != 200:
         return None
 
     return json.loads(response.text)['value']
 
-def get_folder_id(folder_name, token, parent_folder_id=None):
+def get_pages(endpoint, token, max_items=0, fallback_endpoint=None, headers=None, links=None):
+    """
+    Perform a get request against the GRAPH API and follow the @odata.nextLink to get all the pages of the response.
+    This is a generator, the next page is only requested after all the items of the previous page are processed.
+    
+    INPUT
+    endpoint            | string    | The endpoint to talk to and get the info from
+    token               | string    | The authentication token for the Graph api
+    max_items           | int       | The max number of items to get, 0 = no max
+    fallback_endpoint   | string    | The endpoint to use if the endpoint is not accepted (HTTP 400/404/410), IE because of the $filter
+    headers             | dict      | Extra headers for the requests
+    links               | dict      | If given the @odata.nextLink and @odata.deltaLink of the last complete page are put in it.
+                                    | The max_items is then only checked at the end of a page, so the nextLink can be used to continue
+
+    OUTPUT:
+    item                | dict      | The items of the value list of every page, one by one
+    """
+    if not token:
+        return
+
+    count = 0
+
+    while endpoint:
+        try:
+            response = graph_request('GET', endpoint, headers=headers)
+        except Exception as exception:
+            script_logger.exception(f"Connection error {type(exception).__name__}; ")
+            return
+
+        if response.status_code in (400, 404, 410) and fallback_endpoint is not None and count == 0:
+            script_logger.warning(f"HTTP {response.status_code} recieved for endpoint: {endpoint}, trying: {fallback_endpoint}")
+            endpoint, fallback_endpoint = fallback_endpoint, None
+            continue
+        elif response.status_code != 200:
+            script_logger.error(f"HTTP {response.status_code} recieved for endpoint: {endpoint}")
+            return
+
+        page = response.json()
+
+        for item in page.get('value', []):
+            yield item
+            count += 1
+
+            if max_items and count >= max_items and links is None:
+                return
+
+        endpoint = page.get('@odata.nextLink')
+
+        if links is not None:
+            links['nextLink'] = endpoint
+            links['deltaLink'] = page.get('@odata.deltaLink')
+
+            if max_items and count >= max_items:
+                return
+
+def read_mailbox_state():
+    # Get the saved state (delta link, messages to retry) of the current mailbox folder from the state file
+    try:
+        with open(state_file_name, 'r') as state_file:
+            return json.load(state_file).get(f"{user}/{mailfolder}", {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        script_logger.warning(f"Could not read the state file: {state_file_name}, starting without state")
+        return {}
+
+def write_mailbox_state(mailbox_state):
+    # Save the state of the current mailbox folder, the other mailboxes and folders in the file are kept as is
+    try:
+        with open(state_file_name, 'r') as state_file:
+            state = json.load(state_file)
+    except (OSError, ValueError):
+        state = {}
+
+    state[f"{user}/{mailfolder}"] = mailbox_state
+
+    try:
+        with open(state_file_name + '.tmp', 'w') as state_file:
+            json.dump(state, state_file, indent=4)
+        os.replace(state_file_name + '.tmp', state_file_name)
+    except OSError:
+        script_logger.exception(f"Could not write the state file: {state_file_name}")
+
+def get_messages(message_ids, token):
+    """
+    Get the info of messages by there ID, the messages that no longer exist are skipped
+    
+    INPUT:
+    message_ids         | list      | The ID's of the messages
+    token               | string    | The authentication token for the Graph api
+
+    OUTPUT:
+    message             | dict      | The info of the messages, one by one
+    """
+    for message_id in message_ids:
+        try:
+            response = graph_request('GET', f"{MESSAGE_ENDPOINT}/{message_id}?$select={message_fields}")
+        except Exception as exception:
+            script_logger.exception(f"Connection error {type(exception).__name__}; ")
+            continue
+
+        if response.status_code == 200:
+            yield response.json()
+        else:
+            script_logger.debug(f"HTTP {response.status_code} recieved for message: {message_id}, skipping it")
+
+def download_attachment(endpoint, file_name):
+    """
+    Download the raw content of a attachment ($value) and write it to disk while it is downloaded
+    
+    INPUT:
+    endpoint            | string    | The endpoint of the attachment
+    file_name           | string    | The file to write the attachment to
+
+    OUTPUT:
+    succes              | bool      | True if the attachment is written to disk, False if not
+    """
+    try:
+        with graph_stream_request('GET', f"{endpoint}/$value") as response:
+            if response.status_code != 200:
+                script_logger.error(f"HTTP {response.status_code} recieved for attachment: {endpoint}")
+                return False
+
+            with open(file_name, 'wb') as attachment_file:
+                for chunk in response.iter_content(chunk_size=65536):
+                    attachment_file.write(chunk)
+
+                # Make sure the attachment is on disk before it is committed and the message is moved/deleted/marked read
+                attachment_store.close(attachment_file)
+    except Exception as exception:
+        script_logger.exception(f"Could not download attachment: {endpoint}, {type(exception).__name__}; ")
+        return False
+
+    return True
+
+def attachment_temp_file(message_id, attachment_id, filename):
+    # The temp file of a attachment, the name is unique for the attachment so attachments with the same name (of other
+    # messages) don't overwrite each other. The Graph ID's are long, so a hash of them is used. The '!' separates the
+    # unique id from the name.
+    unique_id = hashlib.sha1(f"{message_id}/{attachment_id}".encode('utf-8')).hexdigest()[:16]
+    return attachment_store.temp_file(unique_id, filename)
+
+def folder_key(folder_name):
+    # The key of a (nested) folder in the folder cache, the folder names are not case sensitive
+    return '/'.join(name.lower().strip() for name in folder_name.strip('/').split('/'))
+
+def read_folder_cache():
+    # Get the saved folder ID's of the current mailbox from the folder cache file
+    try:
+        with open(folder_cache_file, 'r') as cache_file:
+            return json.load(cache_file).get(user, {})
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError):
+        script_logger.warning(f"Could not read the folder cache file: {folder_cache_file}, starting with a empty cache")
+        return {}
+
+def write_folder_cache():
+    # Save the folder ID's of the current mailbox, the other mailboxes in the file are kept as is
+    try:
+        with open(folder_cache_file, 'r') as cache_file:
+            cache = json.load(cache_file)
+    except (OSError, ValueError):
+        cache = {}
+
+    # the saved ID's that are not used in this run are kept, they are checked when they are used
+    cache[user] = { **saved_folder_cache, **folder_cache }
+
+    try:
+        with open(folder_cache_file + '.tmp', 'w') as cache_file:
+            json.dump(cache, cache_file, indent=4)
+        os.replace(folder_cache_file + '.tmp', folder_cache_file)
+    except OSError:
+        script_logger.exception(f"Could not write the folder cache file: {folder_cache_file}")
+
+def get_saved_folder_id(key, parent_key, token):
+    """
+    Get the ID of a folder from the saved folder cache, the ID is checked with the Graph API the first time it is used
+    
+    INPUT:
+    key                 | string    | The key of the folder
+    parent_key          | string    | The key of the parent folder, empty for a folder in the root of the mailbox
+    token               | string    | The authentication token for the Graph api
+
+    OUTPUT:
+    folder_id           | string    | The folder ID, None if the folder is not (or no longer) in the saved folder cache
+    """
+    if not token or key not in saved_folder_cache:
+        return None
+
+    folder_id = saved_folder_cache.pop(key)
+
+    try:
+        response = graph_request('GET', f"{FOLDER_ENDPOINT}{folder_id}?$select=displayName,parentFolderId")
+    except Exception as exception:
+        script_logger.exception(f"Connection error {type(exception).__name__}; ")
+        return None
+
+    if response.status_code == 200:
+        folder_info = response.json()
+
+        # the folder must still have the same name and parent
+        if folder_info.get('displayName', '').lower().strip() == key.split('/')[-1] and (not parent_key or f"/{folder_info.get('parentFolderId')}" == folder_cache.get(parent_key)):
+            folder_cache[key] = folder_id
+            return folder_id
+
+    script_logger.debug(f"The saved ID of folder '{key}' is no longer valid, HTTP {response.status_code}")
+    return None
+
+def list_child_folders(parent_key, token):
     """
-    Get the folder ID of a given (nested) folder
+    Get all the child folders of a folder and add them to the folder cache
+    
+    INPUT:
+    parent_key          | string    | The key of the parent folder, empty for the root of the mailbox
+    token               | string    | The authentication token for the Graph api
+
+    OUTPUT:
+    folder_data         | list      | The child folders
+    """
+    if parent_key == '':
+        endpoint = f"{FOLDER_ENDPOINT}?includeHiddenFolders=true&$top=100"
+    else:
+        endpoint = f"{FOLDER_ENDPOINT}{folder_cache[parent_key]}/childFolders?$top=100"
+
+    folder_data = list(get_pages(endpoint, token))
+
+    for folder_info in folder_data:
+        key = folder_key(f"{parent_key}/{folder_info['displayName']}")
+
+        if key not in folder_cache:
+            folder_cache[key] = f"/{folder_info['id']}"
+        saved_folder_cache.pop(key, None)
+
+    # a empty list can also be a failed request, so only remember the folders that have child folders
+    if folder_data:
+        listed_folders.add(parent_key)
+
+    return folder_data
+
+def get_folder_id(folder_name, token, create=False):
+    """
+    Get the folder ID of a given (nested) folder. The folders are looked up level by level and kept in the
+    folder cache, so every folder is only looked up once per run.
     
     INPUT:
     folder_name         | string    | The (nested) folder to get the ID for, format: Inbox/done/2023
     token               | string    | The authentication token for the Graph api
-    parent_folder_id    | string    | The ID of the parent folder.
+    create              | bool      | Create the folders that don't exist
 
     OUTPUT:
-    folder_id           | string    | The folder ID of the searched folder
+    folder_id           | string    | The folder ID of the searched folder, None if it doesn't exist
     """
+    parent_key = ''
     folder_id = None
 
-    parent_endpoint = f"{FOLDER_ENDPOINT}?includeHiddenFolders=true$top=1000"
-    child_endpoint = f"{FOLDER_ENDPOINT}{parent_folder_id}/childFolders?$top=1000"
+    for name in folder_name.strip('/').split('/'):
+        key = folder_key(f"{parent_key}/{name}")
+        folder_id = folder_cache.get(key)
 
-    if '/' in folder_name:
-        # look for a nested folder, get the first folder to look for
-        folder_list = folder_name.split('/', 1)
-        
-        if parent_folder_id is None:
-            folder_data = get_request(parent_endpoint, token)
-            
-            if folder_data is not None:
-                for folder_info in folder_data:
-                    if folder_info['displayName'].lower().strip() == folder_list[0].lower().strip():
-                        folder_id = f"/{folder_info['id']}"
-                        return get_folder_id(folder_list[1], token, folder_id)
-        else:
-            folder_data = get_request(child_endpoint, token)
+        if folder_id is None:
+            folder_id = get_saved_folder_id(key, parent_key, token)
+
+        if folder_id is None and parent_key not in listed_folders:
+            list_child_folders(parent_key, token)
+            folder_id = folder_cache.get(key)
+
+        if folder_id is None:
+            if not create:
+                return None
+
+            script_logger.debug(f"The folder '{name}' doesn't exist in '{parent_key}', creating it")
+            folder_id = new_folder(name, parent_key, token)
 
-            for folder_info in folder_data:
-                if folder_info['displayName'].lower().strip() == folder_list[0].lower().strip():
-                    folder_id = f"/{folder_info['id']}"
-                    return get_folder_id(folder_list[1], token, folder_id)
+        parent_key = key
 
+    return folder_id
+
+def new_folder(folder_name, parent_key, token):
+    """
+    Create a folder in the mailbox
+
+    INPUT:
+    folder_name         | string    | The name of the folder to create
+    parent_key          | string    | The key of the parent folder, empty for the root of the mailbox
+    token               | string    | The authentication token for the Graph api
+
+    OUTPUT:
+    folder_id           | string    | The folder_id of the just created folder
+    """
+    content = { 'displayName' : folder_name }
+    headers = { 'Content-Type' : 'application/json' }
+
+    if parent_key == '':
+        # this folder needs to be created in the root of the mailbox
+        F_ENDPOINT = FOLDER_ENDPOINT
     else:
-        # look for a single folder
-        if parent_folder_id is None:
-            folder_data = get_request(parent_endpoint, token)
-            
-            if folder_data is not None:
-                for folder_info in folder_data:
-                    if folder_info['displayName'].lower().strip() == folder_name.lower().strip():
-                        folder_id = f"/{folder_info['id']}"
-                        break
-        else:
-            folder_data = get_request(child_endpoint, token)
-            
-            for folder_info in folder_data:
-                if folder_info['displayName'].lower().strip() == folder_name.lower().strip():
-                    folder_id = f"/{folder_info['id']}"
-                    return folder_id
-        
+        # this folder needs to be created below an already existing folder
+        F_ENDPOINT = f"{FOLDER_ENDPOINT}{folder_cache[parent_key]}/childFolders"
+
+    try:
+        create_request = graph_request('POST', F_ENDPOINT, json=content, headers=headers)
+    except Exception as exception:
+        script_logger.exception(f"Connection error {type(exception).__name__}; ")
+        exit(1)
+
+    if create_request.status_code != 201:
+        script_logger.error(f"Something went wrong creating the folder: {json.loads(create_request.content)['error']['message']}")
+        exit(1)
+    
+    # get the ID of the just created folder, based on the response
+    folder_id = f"/{create_request.json()['id']}"
+    folder_cache[folder_key(f"{parent_key}/{folder_name}")] = folder_id
+
     return folder_id
 
-def create_folder(folder_name, token, parent_folder_id=None, root_folder=1):
+def create_folder(folder_name, token):
     """
     Create a given folder (path) in the mailbox
 
     INPUT:
     folder_name         | string    | The (nested) folder to create. format: Inbox/done/2023
     token               | string    | The authentication token for the Graph api
-    parent_folder_id    | string    | The ID of the parent folder.
-    root_folder         | int       | Number to determine if the folder is a root folder or not
-                                    | 1 = root folder; 0 = non root folder
 
     OUTPUT:
     folder_id           | string    | The folder_id of the either just created folder or the already existing one
     """
-    # First check if the folder doesn't already exists
-    folder_exists = get_folder_id(folder_name, token)
+    return get_folder_id(folder_name, token, create=True)
 
-    if folder_exists is not None:
-        script_logger.debug(f"The folder (path) '{folder_name}' already exists.")
-        return folder_exists
-    else:
-        script_logger.debug(f"The folder (path) '{folder_name}' doesn't exist.")
+def download_attachments(message, token):
+    """
+    Download the allowed attachments of a message, this is done by the threads of the download pool
+    
+    INPUT:
+    message             | dict      | The message info, needs at least the id
+    token               | string    | The authentication token for the Graph api
+
+    OUTPUT:
+    succes              | bool      | True if all the allowed attachments are written to disk
+    """
+    # get the info of the attachments without the content, the content is downloaded as is ($value)
+    attachment_endpoint = f"{MESSAGE_ENDPOINT}/{message['id']}/attachments"
+    attachment_data = get_request(f"{attachment_endpoint}?$select=id,name,contentType,size", token)
+
+    if attachment_data is None:
+        script_logger.error(f"Could not get the attachments of message: {message['id']}, it will be tried again in the next run.")
+        return False
+
+    # loop through the attachments and only allow specific contentTypes, the attachments are only moved
+    # to the attachment_dir when all the attachments of the message are downloaded
+    downloaded = True
+    temp_files = []
+
+    for attachment in attachment_data:
+        if any(ctype in attachment['contentType'].lower() for ctype in allowed_content_types):
+            temp_files.append(attachment_temp_file(message['id'], attachment['id'], attachment['name']))
+
+            if not download_attachment(f"{attachment_endpoint}/{attachment['id']}", temp_files[-1]):
+                downloaded = False
+
+    if not downloaded:
+        for temp_file in temp_files:
+            attachment_store.discard(temp_file)
 
-    # split the folder to create in two to work with
-    folder_list = folder_name.split('/', 1)
-    script_logger.debug(f"Folder to create: '{folder_name}'")
+        script_logger.error(f"Could not download all the attachments of message: {message['id']}, it will be tried again in the next run.")
+        return False
 
-    if parent_folder_id is None:
-        folder_id = get_folder_id(folder_list[0], token)
+    for temp_file in temp_files:
+        attachment_store.commit(temp_file)
+
+    return True
+
+def download_done(future, message, processed_messages, failed_messages):
+    # Put the message of a finished download in the processed or the failed messages
+    try:
+        downloaded = future.result()
+    except Exception as exception:
+        script_logger.exception(f"Could not download the attachments of message: {message['id']}, {type(exception).__name__}; ")
+        downloaded = False
+
+    if downloaded:
+        # only keep what is needed for the action
+        processed_messages.append({ 'id' : message['id'], 'receivedDateTime' : message['receivedDateTime'] })
     else:
-        folder_id = get_folder_id(folder_list[0], token, parent_folder_id)
+        failed_messages.append(message['id'])
+
+def message_action_request(message, token):
+    """
+    Make the request to move, delete or mark the message as read, depending on the configured action.
+    The request is in the format of a request in a Graph JSON $batch.
     
-    if folder_id is not None:
-        # the folder already exists so continue on to the next one if needed
-        if len(folder_list) == 2:
-            # another folder needs to be created
-            return create_folder(folder_list[1], token, folder_id, root_folder=0)
-        else:
-            return folder_id
+    INPUT:
+    message             | dict      | The message info, needs at least the id and receivedDateTime
+    token               | string    | The authentication token for the Graph api
+
+    OUTPUT:
+    request             | dict      | The method, url and (if needed) body and headers of the request, None if the request can't be made
+    """
+    if action.lower() == 'move':
+        # get the message time to prepare a move to a date folder
+        receivedDate = None
+        receivedDate = message['receivedDateTime'][0:10]
+        year = receivedDate[0:4]
+        month = receivedDate[5:7]
+        day = receivedDate[8:10]
+        week = datetime.date(int(year), int(month), int(day)).isocalendar()[1]
+
+        if (month == 1 or month == "01") and week == 52:
+            # with ISO time formatting the first week of the year is the week containing the first Thursday
+            year = int(year) - 1
+
+        if len(str(week)) == 1:
+            # for sorting...
+            week = f"0{week}"
+
+        # prep the "move to folder" and replace the "variables" with the needed values
+        move_to_folder_new = move_to_folder
+        move_to_folder_new = move_to_folder_new.replace("[YEAR]", str(year))
+        move_to_folder_new = move_to_folder_new.replace("[MONTH]", str(month))
+        move_to_folder_new = move_to_folder_new.replace("[DAY]", str(day))
+        move_to_folder_new = move_to_folder_new.replace("[WEEK]", str(week))
+
+        move_folder_id = None
+        move_folder_id = create_folder(move_to_folder_new, token)
+
+        if move_folder_id is None:
+            return None
+
+        return { 'method' : 'POST', 'url' : f"/users/{user}/messages/{message['id']}/move", 'body' : { 'destinationId' : move_folder_id.lstrip('/') }, 'headers' : { 'Content-Type' : 'application/json' } }
+    elif action.lower() == "delete":
+        # delete the message
+        return { 'method' : 'DELETE', 'url' : f"/users/{user}/messages/{message['id']}" }
+    elif action.lower() == "none":
+        # leave the message as is, the delta sync keeps track of the processed messages
+        return None
     else:
-         # the folder doesn't exist, so create it
-        content = f"{{ 'displayName' : '{folder_list[0]}' }}"
-        headers = { 'Authorization' : f'Bearer {token}', 'Accept' : 'application/json', 'Content-Type' : 'application/json' }
+        # Just mark the message as read and continue
+        if action.lower() != "mark_read":
+            script_logger.error(f"Unknown mail action: {action}; mails will be marked as read but please fix this!")
 
-        if root_folder == 1:
-            # this folder needs to be created in the root of the mailbox
-            F_ENDPOINT = FOLDER_ENDPOINT
-        else:
-            # this folder needs to be created below an already existing folder
-            F_ENDPOINT = f"{FOLDER_ENDPOINT}{parent_folder_id}/childFolders"
-        try:
-            if proxy_use:
-                create_request = requests.post(F_ENDPOINT, data=content, headers=headers, proxies=proxies)
-            else:
-                create_request = requests.post(F_ENDPOINT, data=content, headers=headers)
-        except Exception as exception:
-            script_logger.exception(f"Connection error {type(exception).__name__}; ")
+        return { 'method' : 'PATCH', 'url' : f"/users/{user}/messages/{message['id']}", 'body' : { 'isRead' : True }, 'headers' : { 'Content-Type' : 'application/json' } }
 
-        if create_request.status_code != 201:
-            script_logger.error(f"Something went wrong creating the folder: {json.loads(create_request.content)['error']['message']}")
-            exit(1)
-        
-        # get the ID of the just created folder, based on the response
-        folder_id = f"/{create_request.json()['id']}"
-        
-        if len(folder_list) == 2:
-            # We need to create another folder
-            return create_folder(folder_list[1], token, folder_id, root_folder=0)
-        else:
-            return folder_id
+def get_retry_after(headers, attempt):
+    # The seconds to wait before a retry, the Retry-After header of Graph or 1, 2, 4, ... seconds
+    try:
+        return min(int((headers or {}).get('Retry-After', (headers or {}).get('retry-after'))), max_retry_wait)
+    except (TypeError, ValueError):
+        return min(2 ** attempt, max_retry_wait)
+
+def batch_requests(batch_items):
+    """
+    Send requests to the Graph API with JSON $batch, in groups of 20 (the max of Graph). Only the requests in a group
+    that failed with a status that can be retried (429, 5xx) are send again, max batch_max_retries times.
+    
+    INPUT:
+    batch_items         | list      | The requests, dicts with a unique id, method, url and (if needed) body and headers
+
+    OUTPUT:
+    failed_items        | list      | The requests that failed
+    """
+    failed_items = []
+
+    for group_start in range(0, len(batch_items), batch_size):
+        group = batch_items[group_start:group_start + batch_size]
+        wait = 0
+
+        for attempt in range(batch_max_retries + 1):
+            if attempt > 0:
+                script_logger.debug(f"Retry {attempt} of {len(group)} batch request(s) in {wait} seconds")
+                time.sleep(wait)
+
+            try:
+                response = graph_request('POST', f"{GRAPH_URL}/v1.0/$batch", json={ 'requests' : group }, headers={ 'Content-Type' : 'application/json' })
+            except Exception as exception:
+                script_logger.exception(f"Connection error {type(exception).__name__}; ")
+                wait = get_retry_after(None, attempt)
+                continue
+
+            if response.status_code != 200:
+                # the complete batch failed, try all the requests again
+                script_logger.warning(f"HTTP {response.status_code} recieved for the batch request")
+                wait = get_retry_after(response.headers, attempt)
+                continue
+
+            item_responses = { str(item_response.get('id')) : item_response for item_response in response.json().get('responses', []) }
+            retry_items = []
+            wait = 0
+
+            for item in group:
+                item_response = item_responses.get(item['id'])
+
+                if item_response is None:
+                    # no response for this request, try it again
+                    retry_items.append(item)
+                    wait = max(wait, get_retry_after(None, attempt))
+                elif item_response['status'] == 429 or item_response['status'] >= 500:
+                    retry_items.append(item)
+                    wait = max(wait, get_retry_after(item_response.get('headers'), attempt))
+                elif item_response['status'] >= 300:
+                    error = (item_response.get('body') or {}).get('error', {}).get('message')
+                    script_logger.error(f"HTTP {item_response['status']} recieved for {item['method']} {item['url']}. Error message: {error}")
+                    failed_items.append(item)
+
+            group = retry_items
+
+            if not group:
+                break
+
+        for item in group:
+            script_logger.error(f"{item['method']} {item['url']} still failed after {batch_max_retries} retries")
+            failed_items.append(item)
+
+    return failed_items
+
+if o365_folder_cache:
+    saved_folder_cache = read_folder_cache()
 
 scopes = [f'{GRAPH_URL}/.default']
 result = None
@@ -380,114 +961,138 @@ try:
     if not result:
         script_logger.debug("No suitable token exists in cache, getting a new one.")
         result = app.acquire_token_for_client(scopes=scopes)
+    else:
+        script_logger.debug("Using the token from the cache.")
+
+    if token_cache is not None:
+        write_token_cache(token_cache)
 
     if "access_token" in result:
-        # get all the mail folders and search for the one we need
-        all_folders_endpoint = f"{FOLDER_ENDPOINT}?includeHiddenFolders=true"
-        all_folders_data = get_request(all_folders_endpoint, result['access_token'])
+        graph_session.headers.update({ 'Authorization' : f"Bearer {result['access_token']}" })
 
-        if all_folders_data is not None:
+        # get all the mail folders in the root of the mailbox, this also fills the folder cache
+        all_folders_data = list_child_folders('', result['access_token'])
+
+        if all_folders_data:
             # succesfull connection, first find the id of the folder we are looking for
             folder_id = get_folder_id(mailfolder, result['access_token'])
             
             if folder_id is not None:
-                # get the messages from the folder
-                messages_endpoint = f"{FOLDER_ENDPOINT}{folder_id}/messages?$filter=isRead ne true&$top={max_emails_per_fetch}&$select=sender,subject,hasAttachments,receivedDateTime"
-                message_data = get_request(messages_endpoint, result['access_token'])
-                
                 count = 0
+                processed_messages = []
+                failed_messages = []
+                retry_action_ids = set()
+                processed_ids = []
+                seen_ids = set()
+
+                if o365_delta_sync:
+                    # Only get the messages that are new or changed since the last run with the delta link of the last run. Without
+                    # (valid) delta link all the messages of the folder are checked. The messages that failed in the last run are tried first.
+                    # A delta query doesn't support the hasAttachments/subject $filter, only the needed fields are selected and the
+                    # DMARC messages are selected below.
+                    mailbox_state = read_mailbox_state()
+                    delta_link = mailbox_state.get('delta_link')
+                    delta_endpoint = f"{FOLDER_ENDPOINT}{folder_id}/messages/delta?$select={message_fields}"
+                    links = {}
+
+                    # The attachments of the messages of which the move/delete/mark read failed in the last run are already
+                    # downloaded, only the action is done again
+                    retry_action_ids = set(mailbox_state.get('retry_action_ids', []))
+
+                    # The delta also gives the messages that are changed (flagged, categorized, etc.) after they where downloaded, with the
+                    # action none they are still in the folder. The ID's of the last downloaded messages are kept to skip those messages.
+                    processed_ids = mailbox_state.get('processed_ids', [])
+                    seen_ids.update(processed_ids)
+
+                    for message in get_messages(retry_action_ids, result['access_token']):
+                        processed_messages.append({ 'id' : message['id'], 'receivedDateTime' : message['receivedDateTime'] })
+
+                    messages = itertools.chain(
+                        get_messages(mailbox_state.get('retry_ids', []), result['access_token']),
+                        get_pages(delta_link or delta_endpoint, result['access_token'], o365_max_messages, delta_endpoint if delta_link else None, { 'Prefer' : f"odata.maxpagesize={messages_per_page}" }, links))
+                else:
+                    # get the messages from the folder, page by page. The server only gives the unread messages with
+                    # a attachment and a DMARC subject, if the server doesn't accept the subject filter it is done here
+                    subject_filter = ' or '.join("contains(subject,'" + sub.replace("'", "''") + "')" for sub in allowed_mail_subjects)
+                    messages_endpoint = f"{FOLDER_ENDPOINT}{folder_id}/messages?$filter=isRead ne true and hasAttachments eq true and ({subject_filter})&$top={messages_per_page}&$select={message_fields}"
+                    fallback_endpoint = f"{FOLDER_ENDPOINT}{folder_id}/messages?$filter=isRead ne true&$top={messages_per_page}&$select={message_fields}"
+
+                    messages = get_pages(messages_endpoint, result['access_token'], o365_max_messages, fallback_endpoint)
+
+                # The attachments of the messages are downloaded by a pool of threads while the next messages are requested
+                with concurrent.futures.ThreadPoolExecutor(max_workers=o365_download_threads) as executor:
+                    downloads = {}
 
-                for message in message_data:
-                    # check if this is a dmarc message, only allow messages with a specific subject and a attachment
-                    if message['hasAttachments'] == True and any(sub in message['subject'].lower() for sub in allowed_mail_subjects):
-                        attachment_endpoint = f"{MESSAGE_ENDPOINT}/{message['id']}/attachments/"
-                        attachment_data = get_request(attachment_endpoint, result['access_token'])
-
-                        # loop through the attachments and only allow specific contentTypes
-                        for attachment in attachment_data:
-                            if any(ctype in attachment['contentType'].lower() for ctype in allowed_content_types):
-                                raw_data = base64.b64decode(attachment['contentBytes'])
-                                filename = re.sub(r'(\!)', r'_', attachment['name'])
-                                
-                                with open(os.path.normpath(attachment_dir + os.sep + filename), 'wb') as file_path:
-                                    file_path.write(raw_data)
-                                
-                        # check if the mails needs to be moved, deleted or just marked read
-                        if action.lower() == 'move':
-                            # get the message time to prepare a move to a date folder
-                            receivedDate = None
-                            receivedDate = message['receivedDateTime'][0:10]
-                            year = receivedDate[0:4]
-                            month = receivedDate[5:7]
-                            day = receivedDate[8:10]
-                            week = datetime.date(int(year), int(month), int(day)).isocalendar()[1]
-                            
-                            if (month == 1 or month == "01") and week == 52:
-                                # with ISO time formatting the first week of the year is the week containing the first Thursday
-                                year = int(year) - 1
-
-                            if len(str(week)) == 1:
-                                # for sorting...
-                                week = f"0{week}"
-
-                            # prep the "move to folder" and replace the "variables" with the needed values
-                            move_to_folder_new = move_to_folder
-                            move_to_folder_new = move_to_folder_new.replace("[YEAR]", str(year))
-                            move_to_folder_new = move_to_folder_new.replace("[MONTH]", str(month))
-                            move_to_folder_new = move_to_folder_new.replace("[DAY]", str(day))
-                            move_to_folder_new = move_to_folder_new.replace("[WEEK]", str(week))
-                            
-                            move_folder_id = None
-                            move_folder_id = create_folder(move_to_folder_new, result['access_token'])
-                            
-                            move_content = f"{{ 'destinationId' : '{move_folder_id.lstrip('/')}' }}"
-                            move_headers = { 'Authorization' : f"Bearer {result['access_token']}", 'Accept' : 'application/json', 'Content-Type' : 'application/json' }
-                            
-                            try:
-                                if proxy_use:
-                                    move_request = requests.post(f"{MESSAGE_ENDPOINT}/{message['id']}/move", data=move_content, headers=move_headers, proxies=proxies)
-                                else:
-                                    move_request = requests.post(f"{MESSAGE_ENDPOINT}/{message['id']}/move", data=move_content, headers=move_headers)
-                            except Exception as exception:
-                                script_logger.exception(f"Connection error {type(exception).__name__}; ")
-
-                            if move_request.status_code != 201:
-                                script_logger.error(f"HTTP {move_request.status_code} recieved. Error message: {json.loads(move_request.content)['error']['message']}")
-                        elif action.lower() == "delete":
-                            # delete the message
-                            delete_header = { 'Authorization': f"Bearer {result['access_token']}" }
-                            
-                            try:
-                                if proxy_use:
-                                    delete_request = requests.delete(f"{MESSAGE_ENDPOINT}/{message['id']}", headers=delete_header, proxies=proxies)
-                                else:
-                                    delete_request = requests.delete(f"{MESSAGE_ENDPOINT}/{message['id']}", headers=delete_header)
-                            except Exception as exception:
-                                script_logger.exception(f"Connection error {type(exception).__name__}; ")
-
-                            if delete_request.status_code != 204:
-                                script_logger.error(f"HTTP {delete_request.status_code} recieved. Error message: {json.loads(delete_request.content)['error']['message']}")
-                        else:
-                            # Just mark the message as read and continue
-                            if action.lower() != "mark_read":
-                                script_logger.error(f"Unknown mail action: {action}; mails will be marked as read but please fix this!")
-                            
-                            mark_content = f"{{ 'isRead' : 'True' }}"
-                            mark_headers = { 'Authorization' : f"Bearer {result['access_token']}", 'Accept' : 'application/json', 'Content-Type' : 'application/json' }
-
-                            try:
-                                if proxy_use:
-                                    mark_request = requests.patch(f"{MESSAGE_ENDPOINT}/{message['id']}", data=mark_content, headers=mark_headers, proxies=proxies)
-                                else:
-                                    mark_request = requests.patch(f"{MESSAGE_ENDPOINT}/{message['id']}", data=mark_content, headers=mark_headers)
-                            except Exception as exception:
-                                script_logger.exception(f"Connection error {type(exception).__name__}; ")
-
-                            if mark_request.status_code != 200 or mark_request.status_code != 201:
-                                script_logger.error(f"HTTP {mark_request.status_code} recieved. Error message: {json.loads(mark_request.content)}")
-                    count+=1
-
-                script_logger.info(f"Processed {count} messages.")
+                    for message in messages:
+                        # skip the messages that are removed from the folder or already read (delta), or of which only the action is done again
+                        if '@removed' in message or message.get('isRead') == True or message['id'] in retry_action_ids:
+                            continue
+
+                        # a message to retry can also be in the delta, and a changed message can be in the delta again; only do a message once
+                        if message['id'] in seen_ids:
+                            continue
+
+                        seen_ids.add(message['id'])
+                        count+=1
+
+                        # check if this is a dmarc message, only allow messages with a specific subject and a attachment
+                        if message['hasAttachments'] == True and any(sub in message['subject'].lower() for sub in allowed_mail_subjects):
+                            downloads[executor.submit(download_attachments, message, result['access_token'])] = message
+
+                            # don't get the next messages before most of the downloads are done
+                            if len(downloads) >= o365_download_threads * 2:
+                                done, not_done = concurrent.futures.wait(downloads, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                                for future in done:
+                                    download_done(future, downloads.pop(future), processed_messages, failed_messages)
+
+                    for future in concurrent.futures.as_completed(list(downloads)):
+                        download_done(future, downloads.pop(future), processed_messages, failed_messages)
+
+                if graph_throttle.throttled:
+                    script_logger.warning(f"{graph_throttle.throttled} requests where throttled by Graph, {graph_throttle.concurrency} of the {o365_download_threads} download threads are used at the end of the run.")
+
+                # The nextLink of a (not delta) page skips the number of messages of the previous pages, so the messages are only
+                # moved, deleted or marked read after the last page. Otherwise messages would be skipped.
+                action_requests = []
+                action_message_ids = {}
+                failed_action_ids = []
+
+                for message in processed_messages:
+                    action_request = message_action_request(message, result['access_token'])
+
+                    if action_request is not None:
+                        action_request['id'] = str(len(action_requests) + 1)
+                        action_requests.append(action_request)
+                        action_message_ids[action_request['id']] = message['id']
+                    elif action.lower() != 'none':
+                        # the move folder could not be found or created
+                        failed_action_ids.append(message['id'])
+
+                failed_action_ids.extend(action_message_ids[request['id']] for request in batch_requests(action_requests))
+
+                if failed_action_ids and o365_delta_sync:
+                    script_logger.error(f"{len(failed_action_ids)} of the {len(processed_messages)} messages could not be moved/deleted/marked read, this is done again in the next run.")
+                elif failed_action_ids:
+                    script_logger.error(f"{len(failed_action_ids)} of the {len(processed_messages)} messages could not be moved/deleted/marked read, they will be processed again in the next run.")
+
+                if o365_delta_sync:
+                    # Continue with the last link in the next run, the nextLink if the max messages is reached. The state is saved
+                    # after the actions, so the messages of which the action failed are in retry_action_ids
+                    if links.get('deltaLink') or links.get('nextLink'):
+                        mailbox_state['delta_link'] = links.get('deltaLink') or links.get('nextLink')
+
+                    mailbox_state['retry_ids'] = failed_messages
+                    mailbox_state['retry_action_ids'] = failed_action_ids
+                    mailbox_state['processed_ids'] = list(dict.fromkeys(processed_ids + [message['id'] for message in processed_messages]))[-max_processed_ids:]
+                    write_mailbox_state(mailbox_state)
+
+                    if links.get('nextLink'):
+                        script_logger.info(f"The max of {o365_max_messages} messages per run is reached, the other messages will be processed in the next run.")
+                elif o365_max_messages and count >= o365_max_messages:
+                    script_logger.info(f"The max of {o365_max_messages} messages per run is reached, the other messages will be processed in the next run.")
+
+                script_logger.info(f"Processed {count} messages, {len(processed_messages)} DMARC messages.")
         else:
             script_logger.error(f"No folders where found: {all_folders_data}")
     else:
@@ -495,4 +1100,9 @@ try:
     
     
 except Exception as error:
-    script_logger.exception(f"Something went wrong: {error}")
\ No newline at end of file
+    script_logger.exception(f"Something went wrong: {error}")
+finally:
+    graph_session.close()
+
+    if o365_folder_cache:
+        write_folder_cache()
\ No newline at end of file
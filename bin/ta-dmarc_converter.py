@@ -38,6 +38,10 @@ import re, struct
 import inspect
 import time
 import argparse
+import concurrent.futures
+import logging
+import logging.handlers
+import multiprocessing
 
 # add the lib dir to the path to import libs from there
 sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..", "lib"))
@@ -45,8 +49,10 @@ sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), "..
 from splunklib import client as client
 from classes import splunk_info as si
 from classes import custom_logger as c_logger
+from classes import dmarc_parser as dp
+from classes import ptr_cache as pc
 
-__version__ = "5.0.0"
+__version__ = "5.5.3"
 __author__ = 'Arnold Holzel'
 __license__ = 'Apache License 2.0'
 
@@ -129,6 +135,8 @@ if __name__ == '__main__':
     problem_dir = os.path.normpath(log_root_dir + os.sep + "problems")                          # The directory to place attachments in that couldn't be processed
     xml_dir = os.path.normpath(log_root_dir + os.sep + "dmarc_xml")                             # The directory to store the XML's
     app_log_dir = os.path.normpath(log_root_dir + os.sep + "dmarc_splunk")                      # The directory to store the output for Splunk
+    spool_dir = os.path.normpath(log_root_dir + os.sep + "dmarc_spool")                         # The directory for the results of the parser workers
+    ptr_cache_file = os.path.normpath(log_root_dir + os.sep + "ptr_cache.db")                   # The file to store the resolved PTR's in
     splunk_bin_dir = os.path.normpath(str(splunk_paths['splunk_home_dir']) + os.sep + "bin")    # The Splunk bin directory
     
     # Prepare the logger
@@ -150,7 +158,13 @@ if __name__ == '__main__':
     # Set all the values based on the content of the local or default file
     skip_mail_download = splunk_info.get_config(custom_conf_file, "main", "skip_mail_download")
     resolve_ips = splunk_info.get_config(custom_conf_file, "main", "resolve_ips")
+    resolve_cache = splunk_info.get_config(custom_conf_file, "main", "resolve_cache")
+    resolve_concurrency = splunk_info.get_config(custom_conf_file, "main", "resolve_concurrency")
+    resolve_deadline = splunk_info.get_config(custom_conf_file, "main", "resolve_deadline")
+    resolve_cache_size = splunk_info.get_config(custom_conf_file, "main", "resolve_cache_size")
     output = splunk_info.get_config(custom_conf_file, "main", "output")
+    parser_isolation = splunk_info.get_config(custom_conf_file, "main", "parser_isolation")
+    parser_workers = splunk_info.get_config(custom_conf_file, "main", "parser_workers")
     
     # Set the logfile to report everything in
     if output == "json":
@@ -168,10 +182,46 @@ if __name__ == '__main__':
     else:
         resolve = ""
 
+    if resolve_cache is not None:
+        resolve_cache = make_binary(resolve_cache)
+    else:
+        resolve_cache = 1
+
+    # The max number of DNS lookups at the same time and the max seconds all the lookups of a batch may take
+    try:
+        resolve_concurrency = int(resolve_concurrency)
+    except (TypeError, ValueError):
+        resolve_concurrency = 50
+
+    try:
+        resolve_deadline = int(resolve_deadline)
+    except (TypeError, ValueError):
+        resolve_deadline = 300
+
+    # The number of DNS answers the resolver keeps in memory per process
+    try:
+        resolve_cache_size = int(resolve_cache_size)
+    except (TypeError, ValueError):
+        resolve_cache_size = 10000
+
     if skip_mail_download is not None:
         skip_mail_download = make_binary(skip_mail_download)
     else:
         skip_mail_download = 0
+
+    if parser_isolation is not None:
+        parser_isolation = make_binary(parser_isolation)
+    else:
+        parser_isolation = 0
+
+    # The number of processes to parse the XML files with, 0 means one per CPU core
+    try:
+        parser_workers = int(parser_workers)
+    except (TypeError, ValueError):
+        parser_workers = 1
+
+    if parser_workers <= 0:
+        parser_workers = os.cpu_count() or 1
         
     # If mail needs to be downloaded get the needed info from the config file
     if skip_mail_download == 0:
@@ -195,7 +245,7 @@ if __name__ == '__main__':
             sys.exit(0)
      
     ### VERBOSE log of all the directory's that are used and the mail server configuration
-    script_logger.debug(f"script_dir={script_dir}; app_root_dir={app_root_dir}; log_root_dir={log_root_dir}; attachment_dir={attachment_dir}; problem_dir={problem_dir}; xml_dir={xml_dir}; app_log_dir={app_log_dir}; splunk_bin_dir={splunk_bin_dir}")
+    script_logger.debug(f"script_dir={script_dir}; app_root_dir={app_root_dir}; log_root_dir={log_root_dir}; attachment_dir={attachment_dir}; problem_dir={problem_dir}; xml_dir={xml_dir}; app_log_dir={app_log_dir}; spool_dir={spool_dir}; splunk_bin_dir={splunk_bin_dir}")
         
     script_logger.debug(f"skip_mail_download={skip_mail_download}, (0 = download mails from server, 1 =  do not download mails from server)")
      
@@ -205,6 +255,7 @@ if __name__ == '__main__':
     make_sure_path_exists(problem_dir)
     make_sure_path_exists(xml_dir)
     make_sure_path_exists(app_log_dir)
+    make_sure_path_exists(spool_dir)
     make_sure_path_exists(app_local_dir)
 
     # just in case, remove deployment server placeholders
@@ -441,12 +492,124 @@ if __name__ == '__main__':
                 if int(file_age) >= int(max_age) and os.path.isfile(full_file_path) and full_file_path.endswith(".zip"):
                     os.remove(full_file_path)
      
-    for xmlfile in os.listdir(xml_dir):
+    # Remove the expired PTR's from the cache before it is used by the parser(s)
+    if resolve == "--resolve" and resolve_cache == 1:
+        ptr_cache = pc.PTR_Cache(ptr_cache_file, script_logger)
+        script_logger.debug(f"Removed {ptr_cache.purge_expired()} expired PTR(s) from the cache")
+        ptr_cache.close()
+
+    # The files that are processed by a own dmarc-parser.py process
+    isolated_files = []
+
+    if parser_isolation == 1:
+        # Every file is processed by its own dmarc-parser.py process, this is slower but a
+        # file that makes the parser crash can not influence the processing of the other files.
+        script_logger.debug("parser_isolation is enabled, every file will be processed in a separate process.")
+        isolated_files = os.listdir(xml_dir)
+    else:
+        # Process all the files in this process, this saves the startup of a new python, the login
+        # to Splunk, the reading of the config and the setup of the loggers for every file.
+        # The result logger is set up after the roll-over above so it writes to the new file.
+        result_logger = logger.logger_setup(name="result_logger", log_file=parser_log_file, level=10, format="raw")
+
+        parser_options = {
+            'output': str(output),
+            'resolve': 1 if resolve == "--resolve" else 0,
+            'problem_dir': problem_dir,
+            'ptr_cache_file': ptr_cache_file if resolve == "--resolve" and resolve_cache == 1 else None,
+            'resolve_concurrency': resolve_concurrency,
+            'resolve_deadline': resolve_deadline,
+            'resolve_cache_size': resolve_cache_size
+        }
+
+        # If a previous run stopped before the results of the workers where written to the result log
+        # the XML files are already removed, so write the results that are left over first.
+        for spool_file in os.listdir(spool_dir):
+            script_logger.warning(f"Found results of a previous run in: '{spool_file}', writing them to the result log")
+            dp.flush_spool_file(os.path.normpath(spool_dir + os.sep + spool_file), result_logger)
+
+        if parser_workers > 1:
+            # Spread the files over multiple processes, the biggest files first so they don't end up
+            # as the last (and only) file that is still being processed. Every worker writes its results
+            # to a spool file, only this process writes them to the result log.
+            xml_files = [os.path.normpath(xml_dir + os.sep + xmlfile) for xmlfile in os.listdir(xml_dir) if os.path.isfile(os.path.normpath(xml_dir + os.sep + xmlfile))]
+            xml_files.sort(key=os.path.getsize, reverse=True)
+
+            # Resolve the source IP's of all the files at once, the workers get the PTR's from the cache
+            # and don't need to read the files an extra time to resolve them again.
+            worker_options = dict(parser_options)
+
+            if parser_options['resolve'] == 1 and parser_options['ptr_cache_file'] is not None:
+                prefetch_parser = dp.DMARC_Parser(script_logger, None, **parser_options)
+                prefetch_parser.prefetch_ptrs(xml_files)
+                prefetch_parser.log_cache_statistics()
+                worker_options['ptrs_prefetched'] = True
+
+            script_logger.info(f"Start processing {len(xml_files)} file(s) with {parser_workers} workers")
+
+            # The workers send their log records to this process, only this process writes to the script log
+            log_queue = multiprocessing.Queue()
+            log_listener = logging.handlers.QueueListener(log_queue, *script_logger.handlers, respect_handler_level=True)
+            log_listener.start()
+
+            # A ProcessPoolExecutor and not a multiprocessing.Pool, if a worker process dies (IE killed because it
+            # uses too much memory) the Pool waits for ever for the result of that file, the executor raises BrokenProcessPool.
+            pool_broken = False
+
+            try:
+                with concurrent.futures.ProcessPoolExecutor(max_workers=parser_workers, initializer=dp.init_worker, initargs=(log_level, worker_options, log_queue)) as executor:
+                    futures = [executor.submit(dp.parse_worker, xml_file, spool_dir) for xml_file in xml_files]
+
+                    for future in concurrent.futures.as_completed(futures):
+                        try:
+                            xml_file, spool_file, processed = future.result()
+                        except concurrent.futures.process.BrokenProcessPool:
+                            pool_broken = True
+                            continue
+
+                        dp.flush_spool_file(spool_file, result_logger)
+                        script_logger.debug(f"Done processing file: '{os.path.basename(xml_file)}' processed: {processed}")
+
+                        count_xml_files +=1
+            finally:
+                log_listener.stop()
+
+            if pool_broken:
+                # The XML files that are still there are not (completely) processed, the spool files of those files are
+                # not complete and removed. The other spool files are of files that are processed but the result was lost.
+                isolated_files = [os.path.basename(xml_file) for xml_file in xml_files if os.path.isfile(xml_file)]
+
+                for spool_file in os.listdir(spool_dir):
+                    if spool_file[:-len('.spool')] in isolated_files:
+                        os.remove(os.path.normpath(spool_dir + os.sep + spool_file))
+                    else:
+                        dp.flush_spool_file(os.path.normpath(spool_dir + os.sep + spool_file), result_logger)
+                        count_xml_files +=1
+
+                script_logger.error(f"A parser worker process stopped unexpectedly, the {len(isolated_files)} file(s) that are left will be processed with a separate process per file.")
+        else:
+            dmarc_parser = dp.DMARC_Parser(script_logger, result_logger, **parser_options)
+            xml_files = [os.path.normpath(xml_dir + os.sep + xmlfile) for xmlfile in os.listdir(xml_dir)]
+
+            # Resolve the source IP's of all the files at once before the files are processed
+            if parser_options['resolve'] == 1:
+                dmarc_parser.prefetch_ptrs([xml_file for xml_file in xml_files if os.path.isfile(xml_file)])
+
+            for xml_file in xml_files:
+                xmlfile = os.path.basename(xml_file)
+                dmarc_parser.process_file(xml_file)
+                script_logger.debug(f"Done processing file: '{xmlfile}'")
+
+                count_xml_files +=1
+
+            dmarc_parser.log_cache_statistics()
+
+    for xmlfile in isolated_files:
         script_logger.debug(f"Start processing file: '{xmlfile}'")
-        
+            
         # Make sure that the Splunk Python is used to proces the dmarc-parser.py script
         dmarc_parser_script = os.path.normpath(script_dir + os.sep + splunk_paths['app_name'] + os.sep + "dmarc-parser.py")
-        
+
         if resolve not in [None, ""]:
             dmarc_parser_commands = [splunk_command, "cmd", "python", dmarc_parser_script, "--file", os.path.normpath(xml_dir + os.sep + xmlfile), "--logfile", str(parser_log_file), "--output", str(output), str(resolve), "--sessionKey", sessionKey ]
         else:
@@ -456,14 +619,17 @@ if __name__ == '__main__':
         run_dmarc_parser = subprocess.Popen(dmarc_parser_commands)
         run_dmarc_parser_data = run_dmarc_parser.communicate()[0]
         run_dmarc_parser_return_code = run_dmarc_parser.returncode
-        
+
+        if run_dmarc_parser_return_code != 0:
+            script_logger.warning(f"The parser stopped with return code: {run_dmarc_parser_return_code} for file: '{xmlfile}'")
+
         script_logger.debug(f"Done processing file: '{xmlfile}'")
-        
+
         # The dmarc-parser.py script takes care of the removal of the file 
         # so we don't process it again the next time the script runs
-        
+
         count_xml_files +=1
-        
+
     script_logger.info(f"Done processing {count_xml_files} file(s) in the xml directory")
 
     ############################################################################
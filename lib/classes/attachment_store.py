@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+"""
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+##################################################################
+# Description   : Class to store the downloaded attachments of the mail scripts. A attachment is
+#                 written to a temp file in the attach_tmp directory and only moved to the
+#                 attach_raw directory (where the converter picks it up) when all the attachments
+#                 of the message are downloaded, a incomplete download is removed.
+#
+# Version history
+# Date          Version     Author      Type    Description
+# 2026-10-17    1.0.0       Arnold      [NEW]   Initial version, the temp/commit/discard functions of mail-client.py and mail-o365.py
+#
+##################################################################
+import os
+import threading
+
+__author__ = 'Arnold Holzel'
+__version__ = '1.0.0'
+__license__ = 'Apache License 2.0'
+
+class Attachment_Store(object):
+    def __init__(self, attachment_dir, tmp_dir, logger=None):
+        # Example usage:
+        #   attachment_store = Attachment_Store(attachment_dir, attachment_tmp_dir, script_logger)
+        #   attachment_store.cleanup()
+        #
+        #   file_path = attachment_store.open(f"{uid}.{section}", filename)
+        #   ... write the attachment
+        #   attachment_store.close(file_path)
+        #
+        #   attachment_store.commit(file_path.name) when all the attachments of the message are on disk, otherwise
+        #   attachment_store.discard(file_path.name)
+        #
+        # The name of a temp file is the unique id of the attachment (message and part) and the name of the
+        # attachment separated by a '!', so attachments with the same name don't overwrite each other.
+        self.attachment_dir = attachment_dir
+        self.tmp_dir = tmp_dir
+        self.logger = logger
+
+        # Lock for picking a free name in the attachment_dir, the threads of a script save attachments at the same time
+        self.name_lock = threading.Lock()
+
+        for directory in (self.attachment_dir, self.tmp_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+    def cleanup(self):
+        # The temp files that are still in the tmp_dir are from a earlier run that was stopped while downloading, the
+        # messages where not deleted/moved/marked read so the attachments will be downloaded again. Only the files with
+        # a '!' in the name are temp files.
+        for temp_file in os.listdir(self.tmp_dir):
+            if '!' not in temp_file:
+                continue
+
+            try:
+                os.remove(os.path.normpath(self.tmp_dir + os.sep + temp_file))
+            except OSError:
+                pass
+
+    def temp_file(self, unique_id, filename):
+        """
+        Give the temp file of a attachment
+
+        INPUT:
+        unique_id           | string    | A id that is unique for the attachment, without a '!'
+        filename            | string    | The name of the attachment
+
+        OUTPUT:
+        temp_file           | string    | The full path of the temp file
+        """
+        # Replace the '!' for a '_' so is doesn't need to be escaped later on
+        filename = filename.replace('!', '_')
+        return os.path.normpath(self.tmp_dir + os.sep + f"{unique_id}!{filename}")
+
+    def open(self, unique_id, filename):
+        # Open the temp file of a attachment to write it
+        return open(self.temp_file(unique_id, filename), 'wb')
+
+    @staticmethod
+    def close(file_path):
+        # Make sure the attachment is on disk before the message is deleted/moved/marked read
+        file_path.flush()
+        os.fsync(file_path.fileno())
+        file_path.close()
+
+    def commit(self, temp_file):
+        """
+        Move a complete attachment from the tmp_dir to the attachment_dir, if there already is a file
+        with the same name the unique id is put in front of the name so the extension stays the same.
+
+        INPUT:
+        temp_file           | string    | The full path of the temp file
+
+        OUTPUT:
+        attachment_file     | string    | The full path of the attachment in the attachment_dir
+        """
+        unique_id, filename = os.path.basename(temp_file).split('!', 1)
+
+        with self.name_lock:
+            attachment_file = os.path.normpath(self.attachment_dir + os.sep + filename)
+
+            if os.path.exists(attachment_file):
+                attachment_file = os.path.normpath(self.attachment_dir + os.sep + f"{unique_id}_{filename}")
+            counter = 1
+
+            while os.path.exists(attachment_file):
+                counter += 1
+                attachment_file = os.path.normpath(self.attachment_dir + os.sep + f"{unique_id}_{counter}_{filename}")
+
+            os.replace(temp_file, attachment_file)
+
+        if self.logger is not None:
+            self.logger.debug(f"Attachment: {filename} is stored as: {attachment_file}")
+
+        return attachment_file
+
+    def discard(self, temp_file):
+        # Remove a (partial) attachment of a message that is not done, it will be downloaded again the next run
+        try:
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        except OSError:
+            if self.logger is not None:
+                self.logger.warning(f"Could not remove the partial attachment: {temp_file}")
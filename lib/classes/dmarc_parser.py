@@ -0,0 +1,677 @@
+#!/usr/bin/env python
+"""
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+##################################################################
+# Description   : Class to parse DMARC RUA XML files into json or key=value events.
+#                 This used to live in the dmarc-parser.py script, it is moved here so
+#                 the ta-dmarc_converter.py script can process a whole directory of
+#                 reports in one process instead of starting a new python per report.
+#
+# Version history
+# Date          Version     Author      Type    Description
+# 2026-10-17    1.0.0       Arnold      [NEW]   Initial version, code moved from dmarc-parser.py
+# 2026-10-17    1.1.0       Arnold      [ADD]   Worker functions to parse files in a multiprocessing pool
+# 2026-10-17    1.2.0       Arnold      [MOD]   Use iterparse to process the records one by one instead of reading
+#                                               the whole file in memory
+# 2026-10-17    1.3.0       Arnold      [MOD]   Build the report level output once per report instead of a deepcopy
+#                                               of a nested defaultdict for every record
+# 2026-10-17    1.4.0       Arnold      [ADD]   Keep the PTR's of the source IP's in the on disk PTR_Cache
+# 2026-10-17    1.5.0       Arnold      [ADD]   Resolve all the source IP's of one or more reports at the same time
+#                                               with dns.asyncresolver before the records are written
+# 2026-10-17    1.6.0       Arnold      [MOD]   Use one resolver per process with a dns.resolver.LRUCache
+# 2026-10-17    1.6.1       Arnold      [FIX]   The workers send there log records to the main process instead of
+#                                               all writing to (and rotating) the same log file
+# 2026-10-17    1.6.2       Arnold      [FIX]   ptrs_prefetched option so the workers don't read every file again to
+#                                               resolve the source IP's the main process already resolved
+#
+##################################################################
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import shutil
+
+import xml.etree.ElementTree as ET
+
+from .ptr_cache import PTR_Cache
+
+__author__ = 'Arnold Holzel'
+__version__ = '1.6.2'
+__license__ = 'Apache License 2.0'
+
+def del_none(d):
+    for key, value in list(d.items()):
+        if value is None:
+            del d[key]
+        elif isinstance(value, dict):
+            del_none(value)
+    return d
+
+def get_kv_dict(d, out=None):
+    # always start with a new dict, otherwise the keys of the previous record (or file)
+    # would end up in the output of the current one.
+    if out is None:
+        out = dict()
+
+    for k, v in d.items():
+        if isinstance(v, dict):
+            get_kv_dict(v, out)
+        else:
+            out[k] = v.strip()
+
+    return out
+
+# The parser of a worker process in the multiprocessing pool, set by init_worker()
+worker_parser = None
+
+class Spool_Writer(object):
+    # Stand-in for the result logger in a worker process. The results are written to a spool file
+    # per XML file, the main process copies the spool file to the result log. This way only one
+    # process writes to the result log and lines of different workers can't get mixed up.
+    def __init__(self, spool):
+        self.spool = spool
+
+    def info(self, line):
+        self.spool.write(line + '\n')
+
+def init_worker(log_level, parser_options, log_queue):
+    # Initializer for the worker processes of the process pool, every worker gets its own parser
+    # parser_options are the keyword arguments for the DMARC_Parser class. The log records of the worker
+    # are send to log_queue, the main process writes them to the script log so only one process writes
+    # to (and rotates) that file.
+    global worker_parser
+    from multiprocessing.util import Finalize
+
+    script_logger = logging.getLogger('dmarc_parser_worker')
+    script_logger.propagate = False
+    script_logger.setLevel(log_level)
+    script_logger.handlers = [logging.handlers.QueueHandler(log_queue)]
+    worker_parser = DMARC_Parser(script_logger, None, **parser_options)
+
+    # log the DNS cache statistics of this worker when the pool is closed
+    Finalize(None, worker_parser.log_cache_statistics, exitpriority=10)
+
+def parse_worker(xml_file, spool_dir):
+    """
+    Parse a single XML file in a worker process and write the results to a spool file.
+
+    INPUT:
+    xml_file            | string    | The full path to the XML file to process
+    spool_dir           | string    | The directory to write the spool file in
+
+    OUTPUT:
+    result              | tuple     | (xml_file, spool_file, processed)
+    """
+    spool_file = os.path.normpath(spool_dir + os.sep + os.path.basename(xml_file) + '.spool')
+    processed = False
+
+    try:
+        with open(spool_file, 'w', encoding='utf-8') as spool:
+            worker_parser.result_logger = Spool_Writer(spool)
+            processed = worker_parser.process_file(xml_file)
+    except Exception:
+        worker_parser.script_logger.exception(f"A exception occured with file='{xml_file}', traceback=")
+
+    return xml_file, spool_file, processed
+
+def flush_spool_file(spool_file, result_logger):
+    # Copy the content of a spool file to the result log and remove the spool file
+    with open(spool_file, 'r', encoding='utf-8') as spool:
+        for line in spool:
+            result_logger.info(line.rstrip('\n'))
+
+    os.remove(spool_file)
+
+class DMARC_Parser(object):
+    def __init__(self, script_logger, result_logger, output='json', resolve=0, resolve_timeout=2, problem_dir=None, ptr_cache_file=None, resolve_concurrency=50, resolve_deadline=300, resolve_cache_size=10000, ptrs_prefetched=False):
+        # Example usage:
+        #   dmarc_parser = DMARC_Parser(script_logger, result_logger, output='json', resolve=1, problem_dir='/path/to/problems', ptr_cache_file='/path/to/ptr_cache.db')
+        #   dmarc_parser.prefetch_ptrs(xml_files)       # optional, otherwise this is done per file
+        #   for xml_file in xml_files:
+        #       dmarc_parser.process_file(xml_file)
+        self.script_logger      = script_logger
+        self.result_logger      = result_logger
+        self.output             = output
+        self.resolve            = int(resolve)
+        self.resolve_timeout    = resolve_timeout
+        self.problem_dir        = problem_dir
+        self.resolve_concurrency= int(resolve_concurrency)
+        self.resolve_deadline   = float(resolve_deadline)
+
+        # The resolvers and the DNS cache they share, created on first use by get_resolver()
+        self.resolve_cache_size = int(resolve_cache_size)
+        self.dns_cache          = None
+        self.resolver           = None
+        self.async_resolver     = None
+
+        # The PTR's resolved by prefetch_ptrs() and the files they are resolved for. ptrs_prefetched is set
+        # when the PTR's of all files are already resolved into the PTR cache (by the main process for the
+        # workers), then the files are not read an extra time to resolve them again.
+        self.ptr_results        = {}
+        self.prefetched_files   = set()
+        self.ptrs_prefetched    = ptrs_prefetched
+
+        # Keep the PTR's on disk so the next reports (and runs) don't need to do the same lookups again
+        if ptr_cache_file is not None:
+            self.ptr_cache      = PTR_Cache(ptr_cache_file, script_logger)
+        else:
+            self.ptr_cache      = None
+
+    def move_to_problem_dir(self, xml_file):
+        # Move a file that cannot be processed to the problem directory so it can be reviewed
+        try:
+            if not os.path.exists(self.problem_dir):
+                os.makedirs(self.problem_dir)
+
+            new_problem_file = os.path.normpath(self.problem_dir + os.sep + os.path.basename(xml_file))
+            shutil.move(xml_file, new_problem_file)
+
+            self.script_logger.warning("The file is moved to the problem directory please review the file to fix the problem")
+        except Exception:
+            self.script_logger.exception("Could not move file to the problem directory, please remove the file manually")
+
+    def check_xml_file(self, xml_file):
+        # In theory all files have a extention, but "in the wild" I have seen reports where
+        # all the dots (.) where replaced with spaces ( ) so the files don't have a extention anymore
+        if not xml_file.endswith('.xml'):
+            # do a very crude check if this is a xml file, read the first line and see if it starts with a <
+            self.script_logger.warning(f"file='{xml_file}' doesn't have a .xml extention")
+
+            with open(xml_file) as unknown_file:
+                content = unknown_file.read(1)
+
+            if content != '<':
+                self.script_logger.warning(f"file='{xml_file}' doesn't look like a xml file, it will be moved to the problem dir.")
+                self.move_to_problem_dir(xml_file)
+                return False
+            else:
+                self.script_logger.debug(f"file='{xml_file}' seems to be a XML file, so continue processing it.")
+
+        return True
+
+    def process_file(self, xml_file):
+        """
+        Check, parse and remove a single DMARC RUA XML file.
+
+        INPUT:
+        xml_file            | string    | The full path to the XML file to process
+
+        OUTPUT:
+        processed           | bool      | True if the file is processed and removed, False if it is moved to the problem dir
+        """
+        self.script_logger.debug(f"Start processing file='{xml_file}' resolve dns: {self.resolve}")
+
+        if not self.check_xml_file(xml_file):
+            return False
+
+        # Get all the info from the report
+        self.script_logger.debug(f"Start getting the data from file='{os.path.basename(os.path.normpath(xml_file))}'")
+
+        if not self.process_dmarc_xml(xml_file):
+            return False
+
+        # Remove the original file so we don't process it again the next time the script runs
+        try:
+            self.script_logger.debug(f"Delete file='{xml_file}' now")
+            os.remove(xml_file)
+        except Exception:
+            self.script_logger.exception(f"Unable to delete file='{xml_file}'")
+
+        return True
+
+    def get_resolver(self, use_async=False):
+        """
+        Give the resolver of this parser, it is created on first use so /etc/resolv.conf is only read once
+        per process. The normal and the async resolver share the same LRUCache.
+
+        INPUT:
+        use_async           | bool      | True for the dns.asyncresolver, False for the dns.resolver
+
+        OUTPUT:
+        resolver            | Resolver  | The (async) resolver with the timeouts and the cache set
+        """
+        from dns import resolver, asyncresolver
+
+        if self.dns_cache is None:
+            self.dns_cache = resolver.LRUCache(max_size=self.resolve_cache_size)
+
+        if use_async:
+            if self.async_resolver is None:
+                self.async_resolver = asyncresolver.Resolver()
+                self.async_resolver.timeout = float(self.resolve_timeout)
+                self.async_resolver.lifetime = float(self.resolve_timeout)
+                self.async_resolver.cache = self.dns_cache
+
+            return self.async_resolver
+
+        if self.resolver is None:
+            self.resolver = resolver.Resolver()
+            self.resolver.timeout = float(self.resolve_timeout)
+            self.resolver.lifetime = float(self.resolve_timeout)
+            self.resolver.cache = self.dns_cache
+
+        return self.resolver
+
+    def log_cache_statistics(self):
+        # Log the hits and misses of the DNS cache, this can be used to set the resolve_cache_size
+        if self.dns_cache is None:
+            return
+
+        statistics = self.dns_cache.get_statistics_snapshot()
+        self.script_logger.info(f"DNS cache statistics: hits={statistics.hits} misses={statistics.misses} size={len(self.dns_cache.data)} max_size={self.dns_cache.max_size}")
+
+    def resolve_ip(self, source_ip):
+        """
+        Get the PTR of a source IP, from the PTR cache if possible otherwise with a DNS lookup.
+
+        INPUT:
+        source_ip           | string    | The IP to get the PTR for
+
+        OUTPUT:
+        hostname            | string    | The PTR of the IP or the name of the error (NXDOMAIN/NoAnswer/....)
+        """
+        if source_ip in self.ptr_results:
+            return self.ptr_results[source_ip]
+
+        if self.ptr_cache is not None and source_ip is not None:
+            hostname = self.ptr_cache.get(source_ip)
+
+            if hostname is not None:
+                return hostname
+
+        from dns import reversename
+        errors              = ''
+        ttl                 = None
+        resolver            = self.get_resolver()
+
+        try:
+            addr = reversename.from_address(source_ip)
+            answer = resolver.resolve(addr, 'PTR')
+        except Exception as exception:
+            # catch the exeption and give that back (NXDOMAIN/NoAnswer/....)
+            errors = str(type(exception).__name__)
+            self.script_logger.debug(f"There was a problem with the dns query for {source_ip}")
+
+            if errors.lower() == 'timeout':
+                try:
+                    addr = reversename.from_address(source_ip)
+                    answer = resolver.resolve(addr, 'PTR')
+                    errors = ''
+                except Exception as exception:
+                    # catch the exeption and give that back (NXDOMAIN/NoAnswer/....)
+                    errors = str(type(exception).__name__)
+
+        if not errors:
+            for rr in answer:
+                hostname = str(rr)
+
+            ttl = answer.rrset.ttl
+        else:
+            hostname = errors
+
+        if self.ptr_cache is not None and source_ip is not None:
+            self.ptr_cache.set(source_ip, hostname, ttl)
+
+        return hostname
+
+    def collect_source_ips(self, xml_file):
+        # Get all the unique source IP's of a report, if the XML has a problem the IP's
+        # found before the problem are returned, the problem is dealt with when the file is parsed.
+        source_ips = set()
+
+        try:
+            for record in self.iter_records(xml_file, {}):
+                for row in record.iter('row'):
+                    source_ip = row.findtext('source_ip',None)
+
+                    if source_ip is not None:
+                        source_ips.add(source_ip)
+        except Exception:
+            self.script_logger.debug(f"Could not get all the source IP's from file='{xml_file}'")
+
+        return source_ips
+
+    async def resolve_ptrs_async(self, source_ips):
+        """
+        Resolve the PTR's of a list of IP's at the same time, with max resolve_concurrency lookups running
+        at once. Lookups that are not done within resolve_deadline seconds are stopped and get 'Timeout'.
+
+        INPUT:
+        source_ips          | list      | The IP's to resolve
+
+        OUTPUT:
+        results             | dict      | IP: (hostname or error name, TTL or None)
+        """
+        from dns import reversename
+
+        resolver            = self.get_resolver(use_async=True)
+        semaphore           = asyncio.Semaphore(self.resolve_concurrency)
+        results             = {}
+
+        async def lookup(source_ip):
+            async with semaphore:
+                # try a second time if the first lookup times out, just like a single lookup
+                for attempt in range(2):
+                    try:
+                        answer = await resolver.resolve(reversename.from_address(source_ip), 'PTR')
+
+                        for rr in answer:
+                            hostname = str(rr)
+
+                        results[source_ip] = (hostname, answer.rrset.ttl)
+                        return
+                    except Exception as exception:
+                        errors = str(type(exception).__name__)
+
+                        if errors.lower() != 'timeout' or attempt == 1:
+                            results[source_ip] = (errors, None)
+                            return
+
+        lookups = [asyncio.ensure_future(lookup(source_ip)) for source_ip in source_ips]
+        done, pending = await asyncio.wait(lookups, timeout=self.resolve_deadline)
+
+        if pending:
+            self.script_logger.warning(f"{len(pending)} PTR lookup(s) where not done within {self.resolve_deadline} seconds, they get the value Timeout")
+
+            for lookup_task in pending:
+                lookup_task.cancel()
+
+            await asyncio.gather(*pending, return_exceptions=True)
+
+        return results
+
+    def prefetch_ptrs(self, xml_files):
+        """
+        Resolve the PTR's of all the source IP's in one or more reports before the records are written,
+        the lookups run at the same time instead of one after the other for every row.
+
+        INPUT:
+        xml_files           | list      | The full paths of the XML files to resolve the source IP's for
+        """
+        self.ptr_results = {}
+        self.prefetched_files = set(xml_files)
+
+        source_ips = set()
+
+        for xml_file in xml_files:
+            source_ips.update(self.collect_source_ips(xml_file))
+
+        # only the IP's that are not in the PTR cache need to be resolved
+        to_resolve = []
+
+        for source_ip in source_ips:
+            hostname = self.ptr_cache.get(source_ip) if self.ptr_cache is not None else None
+
+            if hostname is not None:
+                self.ptr_results[source_ip] = hostname
+            else:
+                to_resolve.append(source_ip)
+
+        self.script_logger.debug(f"Found {len(source_ips)} unique source IP's in {len(xml_files)} file(s), {len(to_resolve)} need a DNS lookup")
+
+        if not to_resolve:
+            return
+
+        try:
+            results = asyncio.run(self.resolve_ptrs_async(to_resolve))
+        except Exception:
+            # The lookups will be done one by one when the records are written
+            self.script_logger.exception("Problem resolving the source IP's at the same time, they will be resolved one by one")
+            return
+
+        for source_ip in to_resolve:
+            hostname, ttl = results.get(source_ip, ('Timeout', None))
+            self.ptr_results[source_ip] = hostname
+
+            # lookups that where stopped because of the deadline are not cached
+            if self.ptr_cache is not None and source_ip in results:
+                self.ptr_cache.set(source_ip, hostname, ttl)
+
+    def iter_records(self, xml_file, report_data):
+        """
+        Walk through the XML file with iterparse and yield every record element as soon as it is complete.
+        The feedback level info (version, report_metadata and policy_published) is stored in report_data
+        when it is found, this comes before the records in a RUA report. Every record is removed from the
+        tree after it is processed, so the memory use doesn't grow with the number of records in the report.
+
+        INPUT:
+        xml_file            | string    | The full path to the XML file to process
+        report_data         | dict      | Dict that will be filled with the feedback level elements
+
+        OUTPUT:
+        record              | Element   | The complete record element
+        """
+        elements = []
+
+        for event, element in ET.iterparse(xml_file, events=('start', 'end')):
+            if event == 'start':
+                elements.append(element)
+                continue
+
+            elements.pop()
+
+            if not elements:
+                continue
+
+            parent = elements[-1]
+
+            if parent.tag == 'feedback' and element.tag in ['version', 'report_metadata', 'policy_published']:
+                # these can only occure once, keep the element (it is small) to get the info from later on
+                report_data[element.tag] = element
+            elif element.tag == 'record' and any(ancestor.tag == 'feedback' for ancestor in elements):
+                yield element
+
+                # the record is processed, remove it from the tree to free the memory
+                element.clear()
+                parent.remove(element)
+
+    def repair_xml_file(self, xml_file, exception):
+        # some files are not correctly constructed and that will give a ParseError
+        # remove the problem line from the file so it can be processed again.
+        line_number = exception.position[0] if getattr(exception, 'position', None) else False
+
+        if not line_number:
+            return
+
+        repaired_file = f"{xml_file}.repair"
+
+        with open(xml_file, 'rb') as source_file, open(repaired_file, 'wb') as target_file:
+            for current_line, line in enumerate(source_file, start=1):
+                if current_line == line_number:
+                    self.script_logger.debug(f"Problem line: {line}")
+                    continue
+
+                target_file.write(line)
+
+        os.replace(repaired_file, xml_file)
+
+    def process_dmarc_xml(self, xml_file):
+        script_logger = self.script_logger
+        records_done = 0
+
+        # resolve all the source IP's of the report before the records are written
+        if self.resolve == 1 and not self.ptrs_prefetched and xml_file not in self.prefetched_files:
+            self.prefetch_ptrs([xml_file])
+
+        try:
+            # the report level data is filled in per file, so start with a fresh dict for every file
+            report_data = {}
+            report_fragment = None
+
+            for record in self.iter_records(xml_file, report_data):
+                if report_fragment is None:
+                    # the report level info comes before the first record, so it is complete now
+                    report_fragment = self.build_report_fragment(xml_file, report_data)
+
+                self.write_record(report_fragment, record)
+                records_done += 1
+        except EnvironmentError:
+            script_logger.exception(f"Cannot open file='{xml_file}' traceback=")
+            return False
+        except ET.ParseError as exception:
+            script_logger.exception(f"Problem with the xml tree: {type(exception).__name__}")
+
+            try:
+                self.repair_xml_file(xml_file, exception)
+
+                # parse the file again, the records before the problem line are already written so skip those.
+                script_logger.debug(f"Reading the XML file content again, skipping the first {records_done} record(s).")
+                report_data = {}
+                report_fragment = None
+
+                for record_number, record in enumerate(self.iter_records(xml_file, report_data)):
+                    if report_fragment is None:
+                        report_fragment = self.build_report_fragment(xml_file, report_data)
+
+                    if record_number >= records_done:
+                        self.write_record(report_fragment, record)
+            except Exception:
+                script_logger.exception(f"A exception occured with file='{xml_file}', traceback=")
+                self.move_to_problem_dir(xml_file)
+                return False
+        except Exception:
+            script_logger.exception(f"A exception occured with file='{xml_file}', traceback=")
+            self.move_to_problem_dir(xml_file)
+            return False
+
+        return True
+
+    def build_report_fragment(self, xml_file, report_data):
+        """
+        Build the part of the output that is the same for every record of a report, this is done once per
+        report instead of once per record. For json this is the start of the json string up to the record,
+        for kv these are the key=value pairs of the feedback level fields.
+
+        INPUT:
+        xml_file            | string    | The full path to the XML file that is processed
+        report_data         | dict      | The feedback level elements found by iter_records()
+
+        OUTPUT:
+        report_fragment     | dict      | json: the json string of the feedback without the closing brackets
+                                        | kv: dict with the key=value pairs of the feedback level fields
+        """
+        version = report_data.get('version')
+        report_metadata = report_data.get('report_metadata')
+        policy_published = report_data.get('policy_published')
+
+        if report_metadata is None:
+            report_metadata = ET.Element('report_metadata')
+
+        if policy_published is None:
+            policy_published = ET.Element('policy_published')
+
+        # the order of the keys is the order of the fields in the output, so don't change it.
+        feedback = {
+            'version': version.text if version is not None else None,
+            'file_name': str(os.path.basename(os.path.normpath(xml_file))),
+            'report_metadata': {
+                'org_name': report_metadata.findtext('org_name',None),
+                'email': report_metadata.findtext('email',None),
+                'extra_contact_info': report_metadata.findtext('extra_contact_info',None),
+                'report_id': report_metadata.findtext('report_id',None),
+                'date_range': {
+                    'begin': report_metadata.findtext('date_range/begin',None),
+                    'end': report_metadata.findtext('date_range/end',None)
+                }
+            },
+            'policy_published': {
+                'domain': policy_published.findtext('domain',None),
+                'adkim': policy_published.findtext('adkim',None),
+                'aspf': policy_published.findtext('aspf',None),
+                'p': policy_published.findtext('p',None),
+                'sp': policy_published.findtext('sp',None),
+                'pct': policy_published.findtext('pct',None)
+            }
+        }
+
+        # remove the empty values from the dict
+        feedback = del_none(feedback)
+
+        # {"feedback": {..., "policy_published": {...}}} minus the last 2 brackets, the record is added to this.
+        json_feedback = json.dumps({'feedback': feedback})
+
+        return { 'json': json_feedback[:-2], 'kv': get_kv_dict(feedback) }
+
+    def write_record(self, report_fragment, record):
+        script_logger = self.script_logger
+        result_logger = self.result_logger
+
+        # find al the possible items that a record can have. if an item is not found a None value will be set, this
+        # will later on be removed. The order of the keys is the order of the fields in the output.
+        record_data = {}
+
+        # find the identifiers per record.
+        for identifiers in record.findall('identifiers'):
+            record_data['identifiers'] = {
+                'header_from': identifiers.findtext('header_from',None),
+                'envelope_from': identifiers.findtext('envelope_from',None),
+                'envelope_to': identifiers.findtext('envelope_to',None)
+            }
+
+        for dkim in record.findall('./auth_results/dkim'):
+            record_data.setdefault('auth_results', {})['dkim'] = {
+                'domain': dkim.findtext('domain',None),
+                'selector': dkim.findtext('selector',None),
+                'result': dkim.findtext('result',None),
+                'human_result': dkim.findtext('human_result',None)
+            }
+
+        for spf in record.findall('./auth_results/spf'):
+            record_data.setdefault('auth_results', {})['spf'] = {
+                'domain': spf.findtext('domain',None),
+                'scope': spf.findtext('scope',None),
+                'result': spf.findtext('result',None)
+            }
+
+        # a record can have multiple rows, loop through all of them.
+        for row in record.iter('row'):
+
+            source_ip = row.findtext('source_ip',None)
+
+            if self.resolve == 1:
+                hostname            = self.resolve_ip(source_ip)
+            else:
+                hostname            = '-'
+
+            record_data['row'] = {
+                'source_ip': str(source_ip),
+                'source_hostname': str(hostname).lower(),
+                'count': row.findtext('count',None),
+                'policy_evaluated': {
+                    'disposition': row.findtext('policy_evaluated/disposition',None),
+                    'dkim': row.findtext('policy_evaluated/dkim',None),
+                    'spf': row.findtext('policy_evaluated/spf',None),
+                    'reason': {
+                        'type': row.findtext('policy_evaluated/reason/type',None)
+                    }
+                }
+            }
+
+        # remove the empty values from the dict
+        record_data                 = del_none(record_data)
+
+        if self.output == 'json':
+            # add the json of the record to the (already created) json of the feedback
+            if record_data:
+                jsondata            = f"{report_fragment['json']}, \"record\": {json.dumps(record_data)}}}}}"
+            else:
+                jsondata            = f"{report_fragment['json']}}}}}"
+
+            result_logger.info(jsondata)
+        elif self.output == 'kv':
+            # create a 1 dimensional dict with the keys and values of the feedback and the record
+            kvdata                  = get_kv_dict(record_data, dict(report_fragment['kv']))
+            kv                      = ', '.join(f'{k}="{v}"' for k,v in kvdata.items())
+            result_logger.info(kv)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+"""
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+##################################################################
+# Description   : Class to limit the number of requests to the Microsoft Graph API that are done
+#                 at the same time by the threads of a script. If Graph throttles a request
+#                 (HTTP 429/503) all threads wait for the Retry-After and the number of requests
+#                 at the same time is halved, it slowly goes up again when there is no throttling.
+#
+# Version history
+# Date          Version     Author      Type    Description
+# 2026-10-17    1.0.0       Arnold      [NEW]   Initial version
+#
+##################################################################
+import threading
+import time
+
+__author__ = 'Arnold Holzel'
+__version__ = '1.0.0'
+__license__ = 'Apache License 2.0'
+
+class Graph_Throttle(object):
+    def __init__(self, max_concurrency, increase_after=20, max_wait=60):
+        # Example usage:
+        #   graph_throttle = Graph_Throttle(4)
+        #
+        #   graph_throttle.acquire()
+        #   response = session.get(....)
+        #   if response.status_code == 429:
+        #       graph_throttle.release(int(response.headers['Retry-After']))
+        #       ... try again
+        #   else:
+        #       graph_throttle.release()
+        #
+        # The concurrency is halved (min 1) once per throttle period and goes up by one after
+        # increase_after requests in a row that are not throttled, up to max_concurrency.
+        self.max_concurrency = max(int(max_concurrency), 1)
+        self.concurrency = self.max_concurrency
+        self.increase_after = increase_after
+        self.max_wait = max_wait
+        self.active = 0
+        self.resume_at = 0
+        self.successes = 0
+        self.throttled = 0
+        self.condition = threading.Condition()
+
+    def acquire(self):
+        # Wait until the throttle period is over and there is room for one more request
+        with self.condition:
+            while True:
+                wait = self.resume_at - time.monotonic()
+
+                if wait > 0:
+                    self.condition.wait(wait)
+                elif self.active < self.concurrency:
+                    self.active += 1
+                    return
+                else:
+                    self.condition.wait()
+
+    def release(self, retry_after=None):
+        """
+        Tell that a request is done
+
+        INPUT:
+        retry_after         | int       | The seconds to wait if the request is throttled, None if it is not throttled
+        """
+        with self.condition:
+            self.active -= 1
+            now = time.monotonic()
+
+            if retry_after is not None:
+                self.throttled += 1
+                self.successes = 0
+
+                # The requests that were already running when the throttling started don't lower the concurrency again
+                if now >= self.resume_at:
+                    self.concurrency = max(self.concurrency // 2, 1)
+
+                self.resume_at = max(self.resume_at, now + min(max(retry_after, 0), self.max_wait))
+            else:
+                self.successes += 1
+
+                if self.successes >= self.increase_after and self.concurrency < self.max_concurrency:
+                    self.concurrency += 1
+                    self.successes = 0
+
+            self.condition.notify_all()
@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+"""
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+##################################################################
+# Description   : Helpers for the mail scripts to get the attachments out of the mails
+#                 without first loading and decoding the complete mail.
+#                 - Transfer_Decoder decodes a base64/quoted-printable body in chunks
+#                 - parse_bodystructure/find_attachment_parts read a IMAP BODYSTRUCTURE
+#                 - MIME_Stream_Parser gets the parts out of a mail that is read line by line
+#
+# Version history
+# Date          Version     Author      Type    Description
+# 2026-10-17    1.0.0       Arnold      [NEW]   Initial version
+# 2026-10-17    1.1.0       Arnold      [ADD]   MIME_Stream_Parser
+# 2026-10-17    1.1.1       Arnold      [FIX]   get_filename joins the RFC 2231 continuations (filename*0*, filename*1*, ...)
+# 2026-10-17    1.1.2       Arnold      [FIX]   Transfer_Decoder decodes a damaged base64 body lenient and keeps the defects instead of raising a error
+#
+##################################################################
+import binascii
+import email.header
+import email.parser
+import email.utils
+import re
+import urllib.parse
+
+__author__ = 'Arnold Holzel'
+__version__ = '1.1.2'
+__license__ = 'Apache License 2.0'
+
+class Transfer_Decoder(object):
+    def __init__(self, encoding):
+        # Example usage:
+        #   decoder = Transfer_Decoder('base64')
+        #   for chunk in chunks:
+        #       file.write(decoder.decode(chunk))
+        #   file.write(decoder.flush())
+        #
+        # The chunks can be cut at any place, the part that can't be decoded yet is kept
+        # until the next chunk. Like the email package the decoding is lenient, a damaged
+        # body doesn't raise a error but is put in defects.
+        self.encoding = (encoding or '7bit').strip().lower()
+        self.buffer = b''
+        self.padding = False
+        self.defects = []
+
+    def decode(self, chunk):
+        """
+        Decode the next chunk of the body
+
+        INPUT:
+        chunk               | bytes     | The next (still encoded) part of the body
+
+        OUTPUT:
+        decoded             | bytes     | The decoded data, can be empty if there is not enough data yet
+        """
+        if self.encoding == 'base64':
+            # Remove all the line breaks (and other junk) and only decode complete groups of 4 characters. The padding (=)
+            # is also removed and added again in flush, so a '=' in the middle of the data doesn't break the decoding.
+            data = re.sub(rb'[^A-Za-z0-9+/=]', b'', chunk)
+
+            if (self.padding and data.strip(b'=')) or (b'=' in data and data[data.find(b'='):].strip(b'=')):
+                self.add_defect('base64 padding in the middle of the data')
+
+            self.padding = self.padding or b'=' in data
+            data = data.replace(b'=', b'')
+
+            self.buffer += data
+            cut = len(self.buffer) - (len(self.buffer) % 4)
+            data, self.buffer = self.buffer[:cut], self.buffer[cut:]
+
+            return binascii.a2b_base64(data) if data else b''
+        elif self.encoding == 'quoted-printable':
+            # Only decode complete lines, a soft line break or =XX can be split over two chunks
+            self.buffer += chunk
+            cut = self.buffer.rfind(b'\n') + 1
+            data, self.buffer = self.buffer[:cut], self.buffer[cut:]
+
+            return binascii.a2b_qp(data) if data else b''
+        else:
+            # 7bit, 8bit and binary are not encoded
+            return chunk
+
+    def flush(self):
+        # Decode what is left at the end of the body
+        data, self.buffer = self.buffer, b''
+
+        if not data:
+            return b''
+        elif self.encoding == 'base64':
+            # Add the padding of a incomplete last group, a single character left can't be decoded
+            if len(data) % 4 == 1:
+                self.add_defect('base64 data with a invalid length')
+                return b''
+
+            return binascii.a2b_base64(data + b'=' * (-len(data) % 4))
+        elif self.encoding == 'quoted-printable':
+            return binascii.a2b_qp(data)
+        else:
+            return data
+
+    def add_defect(self, defect):
+        # Only keep every kind of defect once
+        if defect not in self.defects:
+            self.defects.append(defect)
+
+class MIME_Stream_Parser(object):
+    def __init__(self, open_part, close_part=None):
+        # Example usage:
+        #   def open_part(headers):
+        #       if headers.get_filename() ....
+        #           return open(..., 'wb')
+        #       return None
+        #
+        #   parser = MIME_Stream_Parser(open_part)
+        #   for line in lines:
+        #       parser.feed_line(line)
+        #   parser.close()
+        #
+        # open_part is called with the headers (a email.message.Message without body) of every
+        # part that isn't a multipart, it returns a file to write the decoded body of the part to
+        # or None to skip the part. close_part is called with that file at the end of the part,
+        # by default the file is closed. Only the line that is fed and a few bytes of the decoder
+        # are kept in memory, not the complete mail or part.
+        self.open_part = open_part
+        self.close_part = close_part
+        self.headers = None                 # The headers of the mail itself
+        self.boundaries = []                # The boundaries of the multiparts we are in
+        self.header_lines = []
+        self.in_headers = True
+        self.output = None
+        self.decoder = None
+        self.first_line = True
+        self.defects = []                   # The defects of the decoded parts
+
+    def end_headers(self):
+        headers = email.parser.BytesHeaderParser().parsebytes(b'\r\n'.join(self.header_lines) + b'\r\n\r\n')
+        self.header_lines = []
+        self.in_headers = False
+
+        if self.headers is None:
+            self.headers = headers
+
+        if headers.get_content_maintype() == 'multipart':
+            boundary = headers.get_boundary()
+
+            if boundary:
+                # Skip the preamble until the first boundary
+                self.boundaries.append(boundary.encode('utf-8', 'replace'))
+                self.output = None
+                return
+        elif headers.get_content_type() == 'message/rfc822':
+            # A attached mail, the body are the headers and parts of that mail
+            self.in_headers = True
+            return
+
+        self.output = self.open_part(headers)
+        self.decoder = Transfer_Decoder(headers.get('Content-Transfer-Encoding'))
+        self.first_line = True
+
+    def end_part(self):
+        if self.output is not None:
+            self.output.write(self.decoder.flush())
+            self.defects.extend(defect for defect in self.decoder.defects if defect not in self.defects)
+
+            if self.close_part is not None:
+                self.close_part(self.output)
+            else:
+                self.output.close()
+
+        self.output = None
+        self.decoder = None
+
+    def feed_line(self, line):
+        """
+        Process the next line of the mail
+
+        INPUT:
+        line                | bytes     | The next line of the mail, without the line break
+        """
+        # A boundary of one of the multiparts we are in
+        if self.boundaries and line.startswith(b'--'):
+            stripped = line.rstrip()
+
+            for level in range(len(self.boundaries) - 1, -1, -1):
+                boundary = self.boundaries[level]
+
+                if stripped == b'--' + boundary:
+                    # The next part of this multipart starts
+                    self.end_part()
+                    del self.boundaries[level + 1:]
+                    self.in_headers = True
+                    return
+                elif stripped == b'--' + boundary + b'--':
+                    # The end of this multipart, skip the epilogue until a boundary of a outer multipart
+                    self.end_part()
+                    del self.boundaries[level:]
+                    self.in_headers = False
+                    return
+
+        if self.in_headers:
+            if line.strip() == b'':
+                self.end_headers()
+            else:
+                self.header_lines.append(line)
+        elif self.output is not None:
+            # The line break before a boundary belongs to the boundary, so only write it when the next line is there
+            if not self.first_line:
+                self.output.write(self.decoder.decode(b'\r\n'))
+
+            self.output.write(self.decoder.decode(line))
+            self.first_line = False
+
+    def close(self):
+        # The end of the mail
+        if self.in_headers and self.header_lines:
+            self.end_headers()
+
+        self.end_part()
+
+def parse_bodystructure(fetch_data):
+    """
+    Parse the BODYSTRUCTURE of a IMAP FETCH response to nested lists
+
+    INPUT:
+    fetch_data          | list      | The fetch response of one message, strings as bytes and literals as (bytes, literal bytes) tuples
+
+    OUTPUT:
+    bodystructure       | list      | The BODYSTRUCTURE, strings are decoded, NIL is None and numbers are int
+    """
+    # Put the literals back in the response as a token so the strings in a literal don't need to be quoted
+    tokens = []
+
+    for item in fetch_data:
+        if isinstance(item, tuple):
+            tokens.extend(re.findall(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+', re.sub(rb'\{\d+\}$', b'', item[0])))
+            tokens.append(('literal', item[1]))
+        else:
+            tokens.extend(re.findall(rb'\(|\)|"(?:[^"\\]|\\.)*"|[^\s()"]+', item))
+
+    # Start at the BODYSTRUCTURE
+    start = [n for n, token in enumerate(tokens) if isinstance(token, bytes) and token.upper() == b'BODYSTRUCTURE']
+
+    if not start:
+        return None
+
+    stack = [[]]
+
+    for token in tokens[start[0] + 1:]:
+        if isinstance(token, tuple):
+            stack[-1].append(token[1].decode('utf-8', 'replace'))
+        elif token == b'(':
+            stack.append([])
+        elif token == b')':
+            if len(stack) == 1:
+                break
+            item = stack.pop()
+            stack[-1].append(item)
+            if len(stack) == 1:
+                break
+        elif token.startswith(b'"'):
+            stack[-1].append(re.sub(rb'\\(.)', rb'\1', token[1:-1]).decode('utf-8', 'replace'))
+        elif token.upper() == b'NIL':
+            stack[-1].append(None)
+        elif token.isdigit():
+            stack[-1].append(int(token))
+        else:
+            stack[-1].append(token.decode('utf-8', 'replace'))
+
+    return stack[0][0] if stack[0] else None
+
+def get_params(params):
+    # A IMAP parameter list ("NAME" "value" "NAME2" "value2") as a dict with lowercase keys
+    if not isinstance(params, list):
+        return {}
+
+    return {str(params[n]).lower(): params[n + 1] for n in range(0, len(params) - 1, 2)}
+
+def join_rfc2231_continuations(params, key):
+    # A RFC 2231 parameter that is split over more parameters: filename*0*=utf-8''report, filename*1*=.xml.gz
+    # the encoded (*) segments are joined as bytes so a character can be split over two segments
+    segments = []
+
+    for name, value in params.items():
+        match = re.match(re.escape(key) + r'\*(\d+)(\*?)$', name)
+
+        if match and value is not None:
+            segments.append((int(match.group(1)), match.group(2) == '*', str(value)))
+
+    if not segments:
+        return None
+
+    charset = None
+    data = b''
+
+    for number, encoded, value in sorted(segments):
+        if encoded:
+            if number == 0 and value.count("'") >= 2:
+                charset, language, value = value.split("'", 2)
+            data += urllib.parse.unquote_to_bytes(value)
+        else:
+            data += value.encode('utf-8', 'replace')
+
+    return data.decode(charset or 'utf-8', 'replace')
+
+def get_filename(disposition_params, content_params):
+    # The filename of a part, from the Content-Disposition or the name of the Content-Type
+    for params in (disposition_params, content_params):
+        for key in ('filename', 'name'):
+            if params.get(key):
+                return str(email.header.make_header(email.header.decode_header(params[key])))
+
+            # RFC 2231 encoded filename: filename*=utf-8''report.xml.gz
+            if params.get(key + '*'):
+                charset, language, value = email.utils.decode_rfc2231(params[key + '*'])
+                return urllib.parse.unquote(value, encoding=charset or 'utf-8', errors='replace')
+
+            filename = join_rfc2231_continuations(params, key)
+
+            if filename:
+                return filename
+
+    return None
+
+def find_attachment_parts(bodystructure, section=''):
+    """
+    Get all the (non multipart) parts of a message with there section number, type and filename
+
+    INPUT:
+    bodystructure       | list      | The parsed BODYSTRUCTURE of a message (or of a part of it)
+    section             | string    | The section number of the part, empty for the message itself
+
+    OUTPUT:
+    parts               | list      | dicts with: section, content_type, encoding, size, filename, disposition
+    """
+    parts = []
+
+    if isinstance(bodystructure[0], list):
+        # multipart: the sub parts followed by the subtype
+        n = 0
+        for sub_part in bodystructure:
+            if not isinstance(sub_part, list):
+                break
+            n += 1
+            parts.extend(find_attachment_parts(sub_part, f"{section}.{n}" if section else str(n)))
+
+        return parts
+
+    content_type = f"{bodystructure[0]}/{bodystructure[1]}".lower()
+
+    # The place of the disposition depends on the type of part
+    if content_type == 'message/rfc822':
+        disposition_index = 11
+    elif content_type.startswith('text/'):
+        disposition_index = 9
+    else:
+        disposition_index = 8
+
+    disposition = None
+    disposition_params = {}
+
+    if len(bodystructure) > disposition_index and isinstance(bodystructure[disposition_index], list):
+        disposition = str(bodystructure[disposition_index][0]).lower()
+        disposition_params = get_params(bodystructure[disposition_index][1])
+
+    parts.append({
+        'section': section or '1',
+        'content_type': content_type,
+        'encoding': str(bodystructure[5] or '7bit').lower(),
+        'size': bodystructure[6],
+        'filename': get_filename(disposition_params, get_params(bodystructure[2])),
+        'disposition': disposition
+    })
+
+    # A attached mail, the parts of that mail are numbered <section>.1, <section>.2, ...
+    if content_type == 'message/rfc822' and len(bodystructure) > 8 and isinstance(bodystructure[8], list):
+        if isinstance(bodystructure[8][0], list):
+            parts.extend(find_attachment_parts(bodystructure[8], section or '1'))
+        else:
+            parts.extend(find_attachment_parts(bodystructure[8], f"{section or '1'}.1"))
+
+    return parts
@@ -0,0 +1,137 @@
+#!/usr/bin/env python
+"""
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+##################################################################
+# Description   : Class to store the PTR records of the source IP's of the DMARC reports on disk
+#                 so they can be reused by the next reports, parser processes and runs.
+#                 Failed lookups (NXDOMAIN, NoAnswer, Timeout, ...) are also stored but for a
+#                 shorter time.
+#
+# Version history
+# Date          Version     Author      Type    Description
+# 2026-10-17    1.0.0       Arnold      [NEW]   Initial version
+#
+##################################################################
+import os
+import sqlite3
+import time
+
+__author__ = 'Arnold Holzel'
+__version__ = '1.0.0'
+__license__ = 'Apache License 2.0'
+
+max_ttl = 604800                    # Max seconds a PTR answer is kept, even if the TTL of the answer is higher
+negative_ttl = {                    # Seconds a failed lookup is kept, per error. Errors not in this list are not cached
+    'NXDOMAIN': 3600,
+    'NoAnswer': 3600,
+    'NoNameservers': 300,
+    'Timeout': 300
+}
+
+class PTR_Cache(object):
+    def __init__(self, cache_file, logger=None):
+        # Example usage:
+        #   ptr_cache = PTR_Cache('/path/to/ptr_cache.db')
+        #   hostname = ptr_cache.get('192.0.2.1')
+        #   if hostname is None:
+        #       hostname = ..... do the lookup
+        #       ptr_cache.set('192.0.2.1', hostname, ttl)
+        #
+        # The sqlite connection is made on first use, so the object can be created before
+        # a multiprocessing pool starts its workers and every process gets its own connection.
+        self.cache_file = cache_file
+        self.logger = logger
+        self.connection = None
+
+    def connect(self):
+        if self.connection is None:
+            if not os.path.exists(os.path.dirname(self.cache_file)):
+                os.makedirs(os.path.dirname(self.cache_file))
+
+            # WAL makes it possible for multiple parser processes to read while one of them writes
+            self.connection = sqlite3.connect(self.cache_file, timeout=30)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS ptr_cache (ip TEXT PRIMARY KEY, hostname TEXT NOT NULL, expires INTEGER NOT NULL)')
+            self.connection.commit()
+
+        return self.connection
+
+    def get(self, ip):
+        """
+        Get the cached PTR of a IP
+
+        INPUT:
+        ip                  | string    | The IP to get the PTR for
+
+        OUTPUT:
+        hostname            | string    | The cached hostname or error (NXDOMAIN/NoAnswer/...), None if not (or no longer) cached
+        """
+        try:
+            row = self.connect().execute('SELECT hostname FROM ptr_cache WHERE ip = ? AND expires > ?', (ip, int(time.time()))).fetchone()
+        except sqlite3.Error:
+            if self.logger is not None:
+                self.logger.exception(f"Problem reading the PTR cache file='{self.cache_file}'")
+            return None
+
+        if row is None:
+            return None
+
+        return row[0]
+
+    def set(self, ip, hostname, ttl=None):
+        """
+        Store the PTR (or the error of the lookup) of a IP
+
+        INPUT:
+        ip                  | string    | The IP the PTR is for
+        hostname            | string    | The hostname or the name of the error (NXDOMAIN/NoAnswer/...)
+        ttl                 | int       | The TTL of the DNS answer, None for a failed lookup
+        """
+        if ttl is None:
+            if hostname not in negative_ttl:
+                return
+
+            ttl = negative_ttl[hostname]
+
+        ttl = min(int(ttl), max_ttl)
+
+        if ttl <= 0:
+            return
+
+        try:
+            connection = self.connect()
+            connection.execute('INSERT OR REPLACE INTO ptr_cache (ip, hostname, expires) VALUES (?, ?, ?)', (ip, str(hostname), int(time.time()) + ttl))
+            connection.commit()
+        except sqlite3.Error:
+            if self.logger is not None:
+                self.logger.exception(f"Problem writing to the PTR cache file='{self.cache_file}'")
+
+    def purge_expired(self):
+        # Remove the expired entries so the cache file doesn't keep growing
+        try:
+            connection = self.connect()
+            removed = connection.execute('DELETE FROM ptr_cache WHERE expires <= ?', (int(time.time()),)).rowcount
+            connection.commit()
+        except sqlite3.Error:
+            if self.logger is not None:
+                self.logger.exception(f"Problem cleaning up the PTR cache file='{self.cache_file}'")
+            return 0
+
+        return removed
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+##################################################################
+# Description   : Unit tests for lib/classes/attachment_store.py
+#                 Run with: python -m unittest discover -s tests
+#
+##################################################################
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.normpath(os.path.dirname(os.path.abspath(__file__)) + os.sep + '..' + os.sep + 'lib'))
+
+from classes import attachment_store as ast
+
+class Attachment_Store_Test(unittest.TestCase):
+    def setUp(self):
+        self.root_dir = tempfile.mkdtemp()
+        self.attachment_dir = os.path.join(self.root_dir, 'attach_raw')
+        self.tmp_dir = os.path.join(self.root_dir, 'attach_tmp')
+        self.store = ast.Attachment_Store(self.attachment_dir, self.tmp_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.root_dir)
+
+    def save(self, unique_id, filename, data):
+        file_path = self.store.open(unique_id, filename)
+        file_path.write(data)
+        self.store.close(file_path)
+        return self.store.commit(file_path.name)
+
+    def test_same_name(self):
+        first = self.save('1.2', 'report.xml.gz', b'first')
+        second = self.save('2.2', 'report.xml.gz', b'second')
+        third = self.save('2.2', 'report.xml.gz', b'third')
+
+        self.assertEqual([os.path.basename(name) for name in (first, second, third)], ['report.xml.gz', '2.2_report.xml.gz', '2.2_2_report.xml.gz'])
+        with open(second, 'rb') as attachment_file:
+            self.assertEqual(attachment_file.read(), b'second')
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+
+    def test_exclamation_mark_in_name(self):
+        self.assertEqual(os.path.basename(self.save('1.2', 'a!b!c.zip', b'data')), 'a_b_c.zip')
+
+    def test_discard(self):
+        file_path = self.store.open('1.2', 'report.xml.gz')
+        file_path.close()
+        self.store.discard(file_path.name)
+        self.store.discard(file_path.name)
+
+        self.assertEqual(os.listdir(self.tmp_dir), [])
+        self.assertEqual(os.listdir(self.attachment_dir), [])
+
+    def test_cleanup_only_temp_files(self):
+        for name in ('placeholder', '1.2!report.xml.gz'):
+            open(os.path.join(self.tmp_dir, name), 'w').close()
+
+        self.store.cleanup()
+        self.assertEqual(os.listdir(self.tmp_dir), ['placeholder'])
+
+if __name__ == '__main__':
+    unittest.main()
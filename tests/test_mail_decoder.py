@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+"""
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+##################################################################
+# Description   : Unit tests for lib/classes/mail_decoder.py
+#                 Run with: python -m unittest discover -s tests
+#
+##################################################################
+import base64
+import binascii
+import email.message
+import io
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.normpath(os.path.dirname(os.path.abspath(__file__)) + os.sep + '..' + os.sep + 'lib'))
+
+from classes import mail_decoder as md
+
+def split_chunks(data, sizes):
+    # Cut data in chunks with the given sizes (repeated until all data is used)
+    chunks = []
+    offset = 0
+    n = 0
+
+    while offset < len(data):
+        chunks.append(data[offset:offset + sizes[n % len(sizes)]])
+        offset += sizes[n % len(sizes)]
+        n += 1
+
+    return chunks
+
+def decode_chunks(encoding, chunks):
+    decoder = md.Transfer_Decoder(encoding)
+    return b''.join(decoder.decode(chunk) for chunk in chunks) + decoder.flush()
+
+class Transfer_Decoder_Test(unittest.TestCase):
+    def setUp(self):
+        generator = random.Random(2026)
+        self.data = bytes(generator.getrandbits(8) for _ in range(5000))
+
+    def test_base64_every_chunk_boundary(self):
+        encoded = base64.encodebytes(self.data).replace(b'\n', b'\r\n')
+
+        for cut in range(1, 200):
+            self.assertEqual(decode_chunks('base64', [encoded[:cut], encoded[cut:]]), self.data, f"cut at {cut}")
+
+    def test_base64_small_chunks(self):
+        encoded = base64.encodebytes(self.data).replace(b'\n', b'\r\n')
+
+        for sizes in ([1], [3], [5, 7], [76], [77, 1, 2]):
+            self.assertEqual(decode_chunks('base64', split_chunks(encoded, sizes)), self.data, f"chunk sizes {sizes}")
+
+    def test_base64_missing_padding(self):
+        for length in (1, 2, 3, 4, 5):
+            encoded = base64.b64encode(self.data[:length]).rstrip(b'=')
+            self.assertEqual(decode_chunks('base64', [encoded]), self.data[:length])
+
+    def test_base64_damaged(self):
+        # A '=' in the middle of the data doesn't raise a error (like the email package), it is put in the defects
+        decoder = md.Transfer_Decoder('base64')
+        self.assertEqual(decoder.decode(b'QUJDRA=E') + decoder.flush(), b'ABCD\x01')
+        self.assertEqual(decoder.defects, ['base64 padding in the middle of the data'])
+
+        decoder = md.Transfer_Decoder('base64')
+        self.assertEqual(decoder.decode(b'QUJDR') + decoder.flush(), b'ABC')
+        self.assertEqual(decoder.defects, ['base64 data with a invalid length'])
+
+        # The padding split over two chunks is not a defect
+        decoder = md.Transfer_Decoder('base64')
+        self.assertEqual(decoder.decode(b'QUJDRA=') + decoder.decode(b'=\r\n') + decoder.flush(), b'ABCD')
+        self.assertEqual(decoder.defects, [])
+
+    def test_quoted_printable_every_chunk_boundary(self):
+        text = ('Café = résumé ' * 20 + '\n' + 'x' * 200 + '\n').encode('utf-8')
+        encoded = binascii.b2a_qp(text).replace(b'\n', b'\r\n')
+
+        # The soft line breaks (=) and the =XX escapes are cut in every possible place
+        self.assertIn(b'=\r\n', encoded)
+        self.assertIn(b'=C3=A9', encoded)
+
+        for cut in range(1, len(encoded)):
+            self.assertEqual(decode_chunks('quoted-printable', [encoded[:cut], encoded[cut:]]), binascii.a2b_qp(encoded), f"cut at {cut}")
+
+    def test_quoted_printable_small_chunks(self):
+        encoded = binascii.b2a_qp(self.data[:1000]).replace(b'\n', b'\r\n')
+
+        for sizes in ([1], [2], [3, 5], [76]):
+            self.assertEqual(decode_chunks('quoted-printable', split_chunks(encoded, sizes)), binascii.a2b_qp(encoded), f"chunk sizes {sizes}")
+
+    def test_not_encoded(self):
+        for encoding in (None, '7bit', '8bit', 'binary'):
+            self.assertEqual(decode_chunks(encoding, split_chunks(self.data, [3, 100])), self.data)
+
+class Bodystructure_Test(unittest.TestCase):
+    def test_nested_multipart_sections(self):
+        # multipart/mixed: text, multipart/alternative (text, html), gzip attachment and a attached
+        # mail (message/rfc822) that is a multipart with a text and a zip attachment
+        fetch_data = [
+            b'1 (UID 42 BODYSTRUCTURE ('
+            b'("text" "plain" ("charset" "us-ascii") NIL NIL "7bit" 12 1 NIL NIL NIL NIL)'
+            b'(("text" "plain" ("charset" "utf-8") NIL NIL "quoted-printable" 20 1 NIL NIL NIL NIL)'
+            b'("text" "html" ("charset" "utf-8") NIL NIL "quoted-printable" 40 2 NIL NIL NIL NIL) "alternative" ("boundary" "b2") NIL NIL NIL)'
+            b'("application" "gzip" ("name" "report.xml.gz") NIL NIL "base64" 1000 NIL ("attachment" ("filename" "report.xml.gz")) NIL NIL)'
+            b'("message" "rfc822" NIL NIL NIL "7bit" 3000 (NIL "Fwd" NIL NIL NIL NIL NIL NIL NIL NIL)'
+            b'(("text" "plain" ("charset" "us-ascii") NIL NIL "7bit" 10 1 NIL NIL NIL NIL)'
+            b'("application" "zip" ("name" "fwd.zip") NIL NIL "base64" 2000 NIL ("attachment" ("filename" "fwd.zip")) NIL NIL) "mixed" ("boundary" "b3") NIL NIL NIL)'
+            b' 60 NIL ("attachment" ("filename" "forward.eml")) NIL NIL)'
+            b' "mixed" ("boundary" "b1") NIL NIL NIL))'
+        ]
+
+        parts = md.find_attachment_parts(md.parse_bodystructure(fetch_data))
+
+        self.assertEqual(
+            [(part['section'], part['content_type'], part['filename'], part['disposition']) for part in parts],
+            [
+                ('1', 'text/plain', None, None),
+                ('2.1', 'text/plain', None, None),
+                ('2.2', 'text/html', None, None),
+                ('3', 'application/gzip', 'report.xml.gz', 'attachment'),
+                ('4', 'message/rfc822', 'forward.eml', 'attachment'),
+                ('4.1', 'text/plain', None, None),
+                ('4.2', 'application/zip', 'fwd.zip', 'attachment'),
+            ]
+        )
+        self.assertEqual(parts[3]['encoding'], 'base64')
+        self.assertEqual(parts[3]['size'], 1000)
+
+    def test_single_part_message(self):
+        fetch_data = [b'1 (UID 7 BODYSTRUCTURE ("application" "gzip" ("name" "report.xml.gz") NIL NIL "base64" 100 NIL ("attachment" NIL) NIL NIL))']
+        parts = md.find_attachment_parts(md.parse_bodystructure(fetch_data))
+
+        self.assertEqual([(part['section'], part['filename'], part['disposition']) for part in parts], [('1', 'report.xml.gz', 'attachment')])
+
+    def test_attached_mail_not_multipart(self):
+        # The body of a attached mail that is not a multipart is section <section>.1
+        fetch_data = [
+            b'1 (UID 8 BODYSTRUCTURE (("text" "plain" NIL NIL NIL "7bit" 5 1 NIL NIL NIL NIL)'
+            b'("message" "rfc822" NIL NIL NIL "7bit" 300 (NIL NIL NIL NIL NIL NIL NIL NIL NIL NIL)'
+            b'("application" "gzip" ("name" "inner.xml.gz") NIL NIL "base64" 100 NIL NIL NIL NIL) 5 NIL ("inline" NIL) NIL NIL)'
+            b' "mixed" ("boundary" "b1") NIL NIL NIL))'
+        ]
+        parts = md.find_attachment_parts(md.parse_bodystructure(fetch_data))
+
+        self.assertEqual([(part['section'], part['content_type']) for part in parts], [('1', 'text/plain'), ('2', 'message/rfc822'), ('2.1', 'application/gzip')])
+
+    def test_literal_filename(self):
+        # A filename that the server sends as a literal ({n} followed by the bytes)
+        fetch_data = [
+            (b'1 (UID 9 BODYSTRUCTURE (("text" "plain" NIL NIL NIL "7bit" 5 1 NIL NIL NIL NIL)("application" "zip" NIL NIL NIL "base64" 100 NIL ("attachment" ("filename" {16}', b'my "report".zip'),
+            b')) NIL NIL) "mixed" ("boundary" "b1") NIL NIL NIL))'
+        ]
+        parts = md.find_attachment_parts(md.parse_bodystructure(fetch_data))
+
+        self.assertEqual([(part['section'], part['filename']) for part in parts], [('1', None), ('2', 'my "report".zip')])
+
+    def test_no_bodystructure(self):
+        self.assertIsNone(md.parse_bodystructure([b'1 (UID 10 FLAGS (\\Seen))']))
+
+class MIME_Stream_Parser_Test(unittest.TestCase):
+    def make_mail(self):
+        # A mail with a nested multipart and a attached mail with a attachment of its own
+        inner = email.message.EmailMessage()
+        inner['Subject'] = 'Forwarded report'
+        inner.set_content('inner text')
+        inner.add_attachment(b'inner zip data' * 50, maintype='application', subtype='zip', filename='inner.zip')
+
+        mail = email.message.EmailMessage()
+        mail['Subject'] = 'Report Domain: example.test'
+        mail.set_content('plain text')
+        mail.add_alternative('<p>html text</p>', subtype='html')
+        mail.make_mixed()
+        mail.add_attachment(os.urandom(3000), maintype='application', subtype='gzip', filename='report.xml.gz')
+        mail.add_attachment(binascii.b2a_qp('résumé = '.encode('utf-8') * 30), maintype='text', subtype='plain', cte='quoted-printable', filename='notes.txt')
+        mail.attach(self.rfc822_part(inner))
+
+        return mail
+
+    def rfc822_part(self, inner):
+        part = email.message.EmailMessage()
+        part.set_content(inner)
+        part['Content-Disposition'] = 'attachment; filename="forward.eml"'
+        return part
+
+    def parse(self, mail):
+        parts = []
+
+        def open_part(headers):
+            output = io.BytesIO()
+            parts.append((headers.get_content_type(), headers.get_filename(), output))
+            return output
+
+        parser = md.MIME_Stream_Parser(open_part, lambda output: None)
+
+        for line in mail.as_bytes().replace(b'\r\n', b'\n').split(b'\n'):
+            parser.feed_line(line)
+        parser.close()
+
+        return parser, [(content_type, filename, output.getvalue()) for content_type, filename, output in parts]
+
+    def test_nested_parts(self):
+        mail = self.make_mail()
+        parser, parts = self.parse(mail)
+
+        # The parts of the attached mail come after the parts of the mail itself
+        self.assertEqual(parser.headers.get_content_type(), 'multipart/mixed')
+        self.assertEqual(
+            [(content_type, filename) for content_type, filename, data in parts],
+            [('text/plain', None), ('text/html', None), ('application/gzip', 'report.xml.gz'), ('text/plain', 'notes.txt'), ('text/plain', None), ('application/zip', 'inner.zip')]
+        )
+
+        attachments = {part.get_filename(): part.get_payload(decode=True) for part in mail.walk() if part.get_filename() and not part.is_multipart()}
+        inner = [part for part in mail.walk() if part.get_content_type() == 'message/rfc822'][0].get_payload()[0]
+        attachments.update({part.get_filename(): part.get_payload(decode=True) for part in inner.walk() if part.get_filename()})
+
+        for content_type, filename, data in parts:
+            if filename:
+                self.assertEqual(data, attachments[filename], filename)
+
+    def test_skipped_parts(self):
+        mail = self.make_mail()
+        written = []
+
+        def open_part(headers):
+            if headers.get_filename() == 'report.xml.gz':
+                written.append(io.BytesIO())
+                return written[-1]
+            return None
+
+        parser = md.MIME_Stream_Parser(open_part, lambda output: None)
+
+        for line in mail.as_bytes().replace(b'\r\n', b'\n').split(b'\n'):
+            parser.feed_line(line)
+        parser.close()
+
+        self.assertEqual(len(written), 1)
+        self.assertEqual(written[0].getvalue(), [part for part in mail.walk() if part.get_filename() == 'report.xml.gz'][0].get_payload(decode=True))
+
+class Get_Filename_Test(unittest.TestCase):
+    def test_plain_and_encoded_word(self):
+        self.assertEqual(md.get_filename({'filename': 'report.xml.gz'}, {}), 'report.xml.gz')
+        self.assertEqual(md.get_filename({'filename': '=?utf-8?q?r=C3=A9port.xml.gz?='}, {}), 'réport.xml.gz')
+
+    def test_content_type_name(self):
+        self.assertEqual(md.get_filename({}, {'name': 'report.zip'}), 'report.zip')
+        self.assertEqual(md.get_filename({'filename': 'disposition.zip'}, {'name': 'content_type.zip'}), 'disposition.zip')
+        self.assertIsNone(md.get_filename({}, {}))
+
+    def test_rfc2231(self):
+        self.assertEqual(md.get_filename({'filename*': "utf-8''r%C3%A9port.xml.gz"}, {}), 'réport.xml.gz')
+
+    def test_rfc2231_continuations(self):
+        params = {
+            'filename*0*': "utf-8''google.com%21example.",
+            'filename*1*': 'test%21r%C3',
+            'filename*2*': '%A9port.xml.gz'
+        }
+        self.assertEqual(md.get_filename(params, {}), 'google.com!example.test!réport.xml.gz')
+
+    def test_rfc2231_continuations_not_encoded(self):
+        # Out of order and a mix of encoded and not encoded segments
+        params = {
+            'filename*2': '.xml.gz',
+            'filename*0': 'a_very_long_name_of_a_',
+            'filename*1*': 'dmarc%20report'
+        }
+        self.assertEqual(md.get_filename(params, {}), 'a_very_long_name_of_a_dmarc report.xml.gz')
+        self.assertEqual(md.get_filename({}, {'name*0': 'report', 'name*1': '.zip'}), 'report.zip')
+
+    def test_rfc2231_continuations_from_bodystructure(self):
+        fetch_data = [
+            b'1 (UID 11 BODYSTRUCTURE ("application" "gzip" NIL NIL NIL "base64" 100 NIL '
+            b'("attachment" ("FILENAME*0*" "utf-8\'\'long%20" "FILENAME*1*" "name.xml.gz")) NIL NIL))'
+        ]
+        parts = md.find_attachment_parts(md.parse_bodystructure(fetch_data))
+
+        self.assertEqual(parts[0]['filename'], 'long name.xml.gz')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,524 @@
+#!/usr/bin/python
+"""
+Copyright 2026- Arnold Holzel
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+##################################################################
+# Author        : Arnold Holzel
+# Creation date : 2026-10-17
+# Description   : Generator of synthetic DMARC RUA (aggregate report, version 1.0) files to test and
+#                 benchmark the XML parser and the ta-dmarc_converter.py pipeline. The same seed and
+#                 options always give the same corpus.
+#
+#                 Part of the reports can get one of the problems that are seen "in the wild" and that
+#                 the app can handle:
+#                 - bad_line          : one line that breaks the XML, this is removed by the ParseError repair
+#                 - concatenated      : more than one <?xml ...> document in one file
+#                 - multi_feedback    : more than one <feedback> in one document
+#                 - no_extension      : the XML file has no .xml extension (ta-dmarc_converter.py skips these in a zip)
+#                 - spaces            : all the dots in the file name are replaced with spaces
+#                 - not_xml           : the file is not a XML file at all (goes to the problem dir)
+#
+#                 The files are written as .xml, .xml.gz or .zip (or a mix of them), <output_dir>.manifest.json
+#                 has the options and the number of reports, records and rows per file. With --parse the XML
+#                 files are parsed with the DMARC_Parser class and with --converter the files are processed
+#                 by ta-dmarc_converter.py (skip_mail_download = 1) in a scratch $SPLUNK_HOME, both report
+#                 the files/s, events/s and MB/s. --converter needs the splunk python modules, so start it with:
+#                 $SPLUNK_HOME/bin/splunk cmd python tools/dmarc_corpus.py --output_dir /tmp/corpus --converter
+#
+# Version history
+# Change log is in the CHANGELOG.md file in the readme dir of the app
+#
+##################################################################
+
+import argparse
+import gzip
+import io
+import ipaddress
+import json
+import logging
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+
+__version__ = "1.0.0"
+__author__ = 'Arnold Holzel'
+__license__ = 'Apache License 2.0'
+
+app_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+malformation_types = ['bad_line', 'concatenated', 'multi_feedback', 'no_extension', 'spaces', 'not_xml']
+
+# Lines that make the XML invalid, every line is invalid on its own so removing it repairs the file
+bad_lines = [
+    '    <comment>AT&T forwarded mail</comment>',
+    '    <extra>broken</extr>',
+    '    <<record>'
+    ]
+
+reporters = ['google.com', 'yahoo.com', 'outlook.com', 'mail.ru', 'comcast.net', 'fastmail.com', 'protection.outlook.com',
+             'qq.com', 'gmx.net', 'web.de', 'zoho.com', 'mimecast.com', 'proofpoint.com', 'cloudmark.com', 'seznam.cz']
+
+dkim_results = ['pass', 'pass', 'pass', 'fail', 'neutral', 'none', 'policy', 'temperror', 'permerror']
+spf_results = ['pass', 'pass', 'pass', 'fail', 'softfail', 'neutral', 'none', 'temperror', 'permerror']
+reason_types = ['forwarded', 'sampled_out', 'trusted_forwarder', 'mailing_list', 'local_policy', 'other']
+
+def parse_range(value):
+    """
+    Parse a number or a range of numbers (min-max) of the command line
+
+    INPUT:
+    value               | string    | 10 or 1-100
+
+    OUTPUT:
+    number_range        | tuple     | (min, max)
+    """
+    low, _, high = value.partition('-')
+
+    try:
+        number_range = (int(low), int(high or low))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a number or a range like 1-100")
+
+    if number_range[0] < 0 or number_range[0] > number_range[1]:
+        raise argparse.ArgumentTypeError(f"'{value}' is not a valid range")
+
+    return number_range
+
+def make_ip_pool(generator, size, ipv6_rate):
+    # The source IP's of the corpus, the number of different IP's is the cardinality of the source_ip field
+    pool = []
+
+    for number in range(max(size, 1)):
+        if generator.random() < ipv6_rate:
+            pool.append(str(ipaddress.IPv6Address((0x2001_0db8 << 96) | (number << 16) | generator.getrandbits(16))))
+        else:
+            pool.append(str(ipaddress.IPv4Address(generator.choice([0x0A000000, 0xAC100000, 0xC0A80000, 0x64400000]) | (number & 0x000FFFFF))))
+
+    return pool
+
+class Corpus_Generator(object):
+    def __init__(self, seed=1, records=(100, 100), rows=(1, 1), dkim=(1, 1), spf=(1, 1), ips=1000, ipv6_rate=0.1, domains=5,
+                 malformation_rate=0.0, malformations=None, wrapper='mixed'):
+        # Example usage:
+        #   corpus = Corpus_Generator(seed=1, records=(10, 500), malformation_rate=0.05)
+        #   for file_info in corpus.write('/tmp/corpus', 100):
+        #       print(file_info['file_name'], file_info['records'])
+        #
+        # records, rows, dkim and spf are (min, max) tuples per report (records) or per record (the others),
+        # ips is the number of different source IP's and domains the number of policy domains.
+        self.generator = random.Random(seed)
+        self.records = records
+        self.rows = rows
+        self.dkim = dkim
+        self.spf = spf
+        self.ip_pool = make_ip_pool(self.generator, ips, ipv6_rate)
+        self.domains = [f'example{number}.test' for number in range(max(domains, 1))]
+        self.malformation_rate = malformation_rate
+        self.malformations = malformations or [malformation for malformation in malformation_types if malformation != 'not_xml']
+        self.wrapper = wrapper
+        self.start_time = 1760000000
+
+    def between(self, number_range):
+        return self.generator.randint(*number_range)
+
+    def record_lines(self, domain):
+        # One <record> with the rows, identifiers and auth_results
+        generator = self.generator
+        lines = ['  <record>']
+
+        for _ in range(self.between(self.rows)):
+            dkim_pass = generator.random() < 0.8
+            spf_pass = generator.random() < 0.8
+            disposition = 'none' if dkim_pass or spf_pass else generator.choice(['none', 'quarantine', 'reject'])
+
+            lines += ['    <row>',
+                      f'      <source_ip>{generator.choice(self.ip_pool)}</source_ip>',
+                      f'      <count>{max(1, int(generator.paretovariate(1.2)))}</count>',
+                      '      <policy_evaluated>',
+                      f'        <disposition>{disposition}</disposition>',
+                      f'        <dkim>{"pass" if dkim_pass else "fail"}</dkim>',
+                      f'        <spf>{"pass" if spf_pass else "fail"}</spf>']
+
+            if generator.random() < 0.05:
+                lines += ['        <reason>', f'          <type>{generator.choice(reason_types)}</type>', '        </reason>']
+
+            lines += ['      </policy_evaluated>', '    </row>']
+
+        lines += ['    <identifiers>', f'      <header_from>{domain}</header_from>']
+
+        if generator.random() < 0.5:
+            lines.append(f'      <envelope_from>{generator.choice(["", "bounce."])}{domain}</envelope_from>')
+
+        if generator.random() < 0.2:
+            lines.append(f'      <envelope_to>{generator.choice(reporters)}</envelope_to>')
+
+        lines += ['    </identifiers>', '    <auth_results>']
+
+        for _ in range(self.between(self.dkim)):
+            lines += ['      <dkim>',
+                      f'        <domain>{generator.choice([domain, domain, "mailer.test", "esp.test"])}</domain>',
+                      f'        <selector>s{generator.randint(1, 3)}</selector>',
+                      f'        <result>{generator.choice(dkim_results)}</result>']
+
+            if generator.random() < 0.1:
+                lines.append('        <human_result>signature verification failed</human_result>')
+
+            lines.append('      </dkim>')
+
+        for _ in range(self.between(self.spf)):
+            lines += ['      <spf>',
+                      f'        <domain>{generator.choice([domain, "bounce." + domain, "esp.test"])}</domain>',
+                      f'        <scope>{generator.choice(["mfrom", "mfrom", "helo"])}</scope>',
+                      f'        <result>{generator.choice(spf_results)}</result>',
+                      '      </spf>']
+
+        lines += ['    </auth_results>', '  </record>']
+        return lines
+
+    def report(self, number, reporter, domain, begin):
+        """
+        Make one aggregate report, one element per line like most reporters do
+
+        OUTPUT:
+        lines               | list      | The lines of the report, without the <?xml declaration
+        records             | int       | The number of records in the report
+        rows                | int       | The number of rows in all records of the report
+        """
+        lines = ['<feedback>',
+                 '  <version>1.0</version>',
+                 '  <report_metadata>',
+                 f'    <org_name>{reporter}</org_name>',
+                 f'    <email>noreply-dmarc-support@{reporter}</email>',
+                 f'    <extra_contact_info>https://{reporter}/dmarc</extra_contact_info>',
+                 f'    <report_id>{self.generator.getrandbits(64)}{number}</report_id>',
+                 '    <date_range>',
+                 f'      <begin>{begin}</begin>',
+                 f'      <end>{begin + 86399}</end>',
+                 '    </date_range>',
+                 '  </report_metadata>',
+                 '  <policy_published>',
+                 f'    <domain>{domain}</domain>',
+                 f'    <adkim>{self.generator.choice(["r", "s"])}</adkim>',
+                 f'    <aspf>{self.generator.choice(["r", "s"])}</aspf>',
+                 f'    <p>{self.generator.choice(["none", "quarantine", "reject"])}</p>',
+                 '    <sp>none</sp>',
+                 '    <pct>100</pct>',
+                 '    <fo>1</fo>',
+                 '  </policy_published>']
+        records = self.between(self.records)
+        rows = 0
+
+        for _ in range(records):
+            record = self.record_lines(domain)
+            rows += record.count('    <row>')
+            lines += record
+
+        lines.append('</feedback>')
+        return lines, records, rows
+
+    def make_file(self, number):
+        """
+        Make the content and name of one report file
+
+        INPUT:
+        number              | int       | The number of the file in the corpus
+
+        OUTPUT:
+        file_info           | dict      | file_name, wrapper, malformation, records, rows, reports and data (bytes)
+        """
+        generator = self.generator
+        reporter = generator.choice(reporters)
+        domain = generator.choice(self.domains)
+        begin = self.start_time + (number % 30) * 86400
+        malformation = generator.choice(self.malformations) if self.malformations and generator.random() < self.malformation_rate else None
+        wrapper = generator.choice(['xml', 'gz', 'zip']) if self.wrapper == 'mixed' else self.wrapper
+        declaration = '<?xml version="1.0" encoding="UTF-8" ?>'
+
+        lines, records, rows = self.report(number, reporter, domain, begin)
+        lines.insert(0, declaration)
+        reports = 1
+
+        if malformation == 'bad_line':
+            # not before the first record, the report level info must stay complete
+            first_record = lines.index('  <record>')
+            lines.insert(generator.randint(first_record, len(lines) - 2), generator.choice(bad_lines))
+        elif malformation in ('concatenated', 'multi_feedback'):
+            for _ in range(generator.randint(1, 2)):
+                extra_lines, extra_records, extra_rows = self.report(number, reporter, domain, begin)
+
+                if malformation == 'concatenated':
+                    extra_lines.insert(0, declaration)
+
+                lines += extra_lines
+                records += extra_records
+                rows += extra_rows
+                reports += 1
+
+        if malformation == 'not_xml':
+            data = (f'This message could not be delivered to {domain}.\r\n' * generator.randint(5, 50)).encode()
+            records = rows = reports = 0
+        else:
+            data = ('\n'.join(lines) + '\n').encode('utf-8')
+
+        # receiver!policy-domain!begin!end!unique-id.xml
+        base_name = f'{reporter}!{domain}!{begin}!{begin + 86399}!{number}'
+        xml_name = base_name if malformation == 'no_extension' else f'{base_name}.xml'
+
+        if malformation == 'spaces':
+            xml_name = xml_name.replace('.', ' ')
+
+        if wrapper == 'gz':
+            # the name of the xml file is the name of the .gz file without the .gz
+            file_name = f'{xml_name}.gz'
+            gzip_file = io.BytesIO()
+
+            with gzip.GzipFile(fileobj=gzip_file, mode='wb', mtime=0) as gzip_archive:
+                gzip_archive.write(data)
+
+            data = gzip_file.getvalue()
+        elif wrapper == 'zip':
+            file_name = f'{base_name}.zip'
+            zip_file = io.BytesIO()
+
+            with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zip_archive:
+                zip_archive.writestr(zipfile.ZipInfo(xml_name, date_time=(2026, 1, 1, 0, 0, 0)), data, zipfile.ZIP_DEFLATED)
+
+            data = zip_file.getvalue()
+        else:
+            file_name = xml_name
+
+        return { 'file_name' : file_name, 'wrapper' : wrapper, 'malformation' : malformation, 'reports' : reports, 'records' : records, 'rows' : rows, 'data' : data }
+
+    def write(self, output_dir, files):
+        """
+        Write the corpus files to a directory
+
+        INPUT:
+        output_dir          | string    | The directory to write the files in, is created if needed
+        files               | int       | The number of files to write
+
+        OUTPUT:
+        file_info           | dict      | Per file that is written: the make_file() info without the data
+        """
+        os.makedirs(output_dir, exist_ok=True)
+
+        for number in range(files):
+            file_info = self.make_file(number)
+
+            with open(os.path.join(output_dir, file_info['file_name']), 'wb') as corpus_file:
+                corpus_file.write(file_info.pop('data'))
+
+            yield file_info
+
+class Event_Counter(object):
+    # Result logger for the DMARC_Parser that only counts the events and there size
+    def __init__(self):
+        self.events = 0
+        self.bytes = 0
+
+    def info(self, line):
+        self.events += 1
+        self.bytes += len(line) + 1
+
+def parse_benchmark(output_dir, manifest, output):
+    """
+    Parse a copy of the XML files of the corpus with the DMARC_Parser class, without DNS lookups
+
+    INPUT:
+    output_dir          | string    | The directory with the corpus
+    manifest            | list      | The file info of the corpus files
+    output              | string    | json or kv
+
+    OUTPUT:
+    result              | dict      | files, events, problem files, seconds and the size of the XML files
+    """
+    sys.path.insert(0, os.path.join(app_dir, 'lib'))
+    from classes.dmarc_parser import DMARC_Parser
+
+    script_logger = logging.getLogger('dmarc_corpus')
+    script_logger.addHandler(logging.NullHandler())
+    script_logger.propagate = False
+    event_counter = Event_Counter()
+    scratch_dir = tempfile.mkdtemp(prefix='ta-dmarc-corpus-')
+
+    try:
+        problem_dir = os.path.join(scratch_dir, 'problem')
+        os.makedirs(problem_dir)
+        xml_files = []
+
+        for file_info in manifest:
+            xml_file = os.path.join(scratch_dir, file_info['file_name'])
+            shutil.copy2(os.path.join(output_dir, file_info['file_name']), xml_file)
+            xml_files.append(xml_file)
+
+        xml_bytes = sum(os.path.getsize(xml_file) for xml_file in xml_files)
+        dmarc_parser = DMARC_Parser(script_logger, event_counter, output=output, resolve=0, problem_dir=problem_dir)
+        start = time.monotonic()
+
+        for xml_file in xml_files:
+            dmarc_parser.process_file(xml_file)
+
+        elapsed = time.monotonic() - start
+
+        return { 'files' : len(xml_files), 'events' : event_counter.events, 'event_bytes' : event_counter.bytes,
+                 'problem_files' : len(os.listdir(problem_dir)), 'seconds' : elapsed, 'bytes' : xml_bytes }
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def converter_benchmark(output_dir, manifest, settings):
+    """
+    Process the corpus with ta-dmarc_converter.py in a scratch $SPLUNK_HOME, the mail download is skipped
+
+    INPUT:
+    output_dir          | string    | The directory with the corpus
+    manifest            | list      | The file info of the corpus files
+    settings            | list      | Extra key = value settings for the [main] stanza of local/ta-dmarc.conf
+
+    OUTPUT:
+    result              | dict      | files, events, problem files, seconds, return code and the size of the corpus files
+    """
+    scratch_dir = tempfile.mkdtemp(prefix='ta-dmarc-corpus-')
+
+    try:
+        test_app_dir = os.path.join(scratch_dir, 'etc', 'apps', 'TA-dmarc')
+
+        for sub_dir in ('bin', 'lib', 'default'):
+            shutil.copytree(os.path.join(app_dir, sub_dir), os.path.join(test_app_dir, sub_dir), ignore=shutil.ignore_patterns('__pycache__'))
+
+        os.makedirs(os.path.join(test_app_dir, 'local'))
+
+        # No DNS lookups by default, these make the results depend on the network. --setting resolve_ips=1 turns them on
+        conf_settings = { 'skip_mail_download' : '1', 'resolve_ips' : '0' }
+
+        for setting in settings:
+            key, _, value = setting.partition('=')
+            conf_settings[key.strip()] = value.strip()
+
+        with open(os.path.join(test_app_dir, 'local', 'ta-dmarc.conf'), 'w') as conf_file:
+            conf_file.write('[main]\n' + ''.join(f'{key} = {value}\n' for key, value in conf_settings.items()))
+
+        # The .gz and .zip files are unpacked from the attachment dir, the plain XML files start in the XML dir
+        attachment_dir = os.path.join(test_app_dir, 'logs', 'attach_raw')
+        xml_dir = os.path.join(test_app_dir, 'logs', 'dmarc_xml')
+        os.makedirs(attachment_dir)
+        os.makedirs(xml_dir)
+        corpus_bytes = 0
+
+        for file_info in manifest:
+            shutil.copy2(os.path.join(output_dir, file_info['file_name']), xml_dir if file_info['wrapper'] == 'xml' else attachment_dir)
+            corpus_bytes += os.path.getsize(os.path.join(output_dir, file_info['file_name']))
+
+        start = time.monotonic()
+        converter = subprocess.run([sys.executable, os.path.join(test_app_dir, 'bin', 'ta-dmarc_converter.py'), '--sessionKey', 'benchmark'],
+                                   env=dict(os.environ, SPLUNK_HOME=scratch_dir), capture_output=True, text=True)
+        elapsed = time.monotonic() - start
+
+        # The events are written to logs/dmarc_splunk/output(_json).log (and the rotated .log.1 - .log.5), the files that can't be processed are kept in logs/problems
+        events = 0
+        event_dir = os.path.join(test_app_dir, 'logs', 'dmarc_splunk')
+        problem_dir = os.path.join(test_app_dir, 'logs', 'problems')
+
+        for file_name in os.listdir(event_dir) if os.path.isdir(event_dir) else []:
+            if file_name.startswith('output') and '.log' in file_name:
+                with open(os.path.join(event_dir, file_name), 'rb') as event_file:
+                    events += sum(1 for _ in event_file)
+
+        problem_files = len(os.listdir(problem_dir)) if os.path.isdir(problem_dir) else 0
+
+        return { 'files' : len(manifest), 'events' : events, 'problem_files' : problem_files, 'seconds' : elapsed,
+                 'bytes' : corpus_bytes, 'returncode' : converter.returncode, 'stderr' : converter.stderr }
+    finally:
+        shutil.rmtree(scratch_dir, ignore_errors=True)
+
+def print_result(name, result):
+    seconds = max(result['seconds'], 0.001)
+    print(f"{name}: {result['files']} files, {result['events']} events, {result['problem_files']} problem file(s) in {seconds:.2f} seconds; "
+          f"{result['files'] / seconds:.1f} files/s, {result['events'] / seconds:.1f} events/s, {result['bytes'] / seconds / 1024 / 1024:.2f} MB/s")
+
+if __name__ == '__main__':
+    options = argparse.ArgumentParser(description='Generate a synthetic DMARC RUA corpus', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    options.add_argument('--output_dir', required=True, help='The directory to write the corpus to')
+    options.add_argument('--files', type=int, default=100, help='The number of report files')
+    options.add_argument('--records', type=parse_range, default='100', help='The number of records per report, a number or a range like 10-1000')
+    options.add_argument('--rows', type=parse_range, default='1', help='The number of rows per record')
+    options.add_argument('--dkim', type=parse_range, default='1', help='The number of DKIM results per record')
+    options.add_argument('--spf', type=parse_range, default='1', help='The number of SPF results per record')
+    options.add_argument('--ips', type=int, default=1000, help='The number of different source IP\'s in the corpus')
+    options.add_argument('--ipv6_rate', type=float, default=0.1, help='The part of the source IP\'s that is IPv6 (0.0 - 1.0)')
+    options.add_argument('--domains', type=int, default=5, help='The number of different policy domains')
+    options.add_argument('--malformation_rate', type=float, default=0.0, help='The part of the files that gets a malformation (0.0 - 1.0)')
+    options.add_argument('--malformations', default=','.join(malformation_types[:-1]), help=f"Comma separated list of the malformations to use: {', '.join(malformation_types)}")
+    options.add_argument('--wrapper', choices=['xml', 'gz', 'zip', 'mixed'], default='mixed', help='Write the reports as .xml, .xml.gz, .zip or a mix of them')
+    options.add_argument('--seed', type=int, default=1, help='The seed, the same seed and options give the same corpus')
+    options.add_argument('--parse', action='store_true', help='Parse the XML files with the DMARC_Parser class and report the speed (only with --wrapper xml)')
+    options.add_argument('--output', choices=['json', 'kv'], default='json', help='The output format for --parse')
+    options.add_argument('--converter', action='store_true', help='Process the corpus with ta-dmarc_converter.py and report the speed')
+    options.add_argument('--setting', action='append', default=[], help='Extra key = value setting for ta-dmarc.conf for --converter, can be used more than once')
+    args = options.parse_args()
+
+    malformations = [malformation.strip() for malformation in args.malformations.split(',') if malformation.strip()]
+    unknown = [malformation for malformation in malformations if malformation not in malformation_types]
+
+    if unknown:
+        options.error(f"Unknown malformation(s): {', '.join(unknown)}")
+
+    if args.parse and args.wrapper != 'xml':
+        options.error("--parse only works with --wrapper xml, use --converter for the .gz and .zip files")
+
+    if os.path.isdir(args.output_dir) and os.listdir(args.output_dir):
+        options.error(f"The output dir '{args.output_dir}' is not empty")
+
+    corpus = Corpus_Generator(args.seed, args.records, args.rows, args.dkim, args.spf, args.ips, args.ipv6_rate, args.domains,
+                              args.malformation_rate, malformations, args.wrapper)
+    manifest = list(corpus.write(args.output_dir, args.files))
+
+    # the manifest is written next to the corpus, not in it, so the output dir only contains report files
+    manifest_file = os.path.normpath(args.output_dir) + '.manifest.json'
+
+    with open(manifest_file, 'w') as manifest_handle:
+        json.dump({ 'version' : __version__, 'options' : { key : value for key, value in vars(args).items() if key not in ('output_dir', 'parse', 'converter', 'setting', 'output') }, 'files' : manifest }, manifest_handle, indent=2)
+
+    malformed = {}
+
+    for file_info in manifest:
+        if file_info['malformation']:
+            malformed[file_info['malformation']] = malformed.get(file_info['malformation'], 0) + 1
+
+    print(f"Wrote {len(manifest)} files with {sum(file_info['reports'] for file_info in manifest)} reports, {sum(file_info['records'] for file_info in manifest)} records and "
+          f"{sum(file_info['rows'] for file_info in manifest)} rows to {args.output_dir} (manifest: {manifest_file})")
+
+    if malformed:
+        print("Malformations: " + ', '.join(f"{malformation}={count}" for malformation, count in sorted(malformed.items())))
+
+    if args.parse:
+        print_result('DMARC_Parser', parse_benchmark(args.output_dir, manifest, args.output))
+
+    if args.converter:
+        result = converter_benchmark(args.output_dir, manifest, args.setting)
+        print_result('ta-dmarc_converter.py', result)
+
+        if result['returncode'] != 0:
+            print(result['stderr'][-2000:], file=sys.stderr)
@@ -0,0 +1,275 @@
+#!/usr/bin/python
+"""
+Copyright 2026- Arnold Holzel
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+##################################################################
+# Author        : Arnold Holzel
+# Creation date : 2026-10-17
+# Description   : Benchmark of the mail scripts (mail-client.py over IMAP and POP3 and mail-o365.py)
+#                 against the local mock servers in this directory.
+#
+#                 A synthetic maildir with DMARC report mails (and some other mails) is made, or a
+#                 existing maildir is used. For every protocol and run a copy of the app (bin, lib and
+#                 default) is made in a scratch $SPLUNK_HOME/etc/apps/TA-dmarc, with the extra settings in
+#                 local/ta-dmarc.conf, the mock server is started with a fresh copy of the maildir and the
+#                 script is started. The messages/s and bytes/s are reported per protocol.
+#
+#                 The scripts need the splunk python modules, so start this with:
+#                 $SPLUNK_HOME/bin/splunk cmd python tools/mail_benchmark.py --messages 500
+#
+# Version history
+# Change log is in the CHANGELOG.md file in the readme dir of the app
+#
+##################################################################
+
+import argparse
+import email.message
+import email.utils
+import gzip
+import io
+import mailbox
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.realpath(__file__)))
+
+import mock_graph
+import mock_mailserver
+
+__version__ = "1.0.0"
+__author__ = 'Arnold Holzel'
+__license__ = 'Apache License 2.0'
+
+app_dir = os.path.normpath(os.path.join(os.path.dirname(os.path.realpath(__file__)), '..'))
+
+def dmarc_report(number, records, reporter, domain):
+    # A simple aggregate report with random source IP's
+    begin = int(time.time()) - 86400
+    rows = ''.join(f'<record><row><source_ip>192.0.2.{random.randint(1, 254)}</source_ip><count>{random.randint(1, 50)}</count>'
+                   f'<policy_evaluated><disposition>none</disposition><dkim>pass</dkim><spf>pass</spf></policy_evaluated></row>'
+                   f'<identifiers><header_from>{domain}</header_from></identifiers><auth_results><dkim><domain>{domain}</domain>'
+                   f'<result>pass</result><selector>s1</selector></dkim><spf><domain>{domain}</domain><result>pass</result></spf>'
+                   f'</auth_results></record>' for _ in range(records))
+
+    return (f'<?xml version="1.0" encoding="UTF-8" ?><feedback><report_metadata><org_name>{reporter}</org_name>'
+            f'<email>noreply-dmarc@{reporter}</email><report_id>{number}</report_id><date_range><begin>{begin}</begin>'
+            f'<end>{begin + 86399}</end></date_range></report_metadata><policy_published><domain>{domain}</domain>'
+            f'<adkim>r</adkim><aspf>r</aspf><p>none</p><sp>none</sp><pct>100</pct></policy_published>{rows}</feedback>').encode()
+
+def make_maildir(maildir_path, messages, records, noise, seed=1):
+    """
+    Make a maildir with synthetic DMARC report mails, half with a .xml.gz and half with a .zip attachment
+
+    INPUT:
+    maildir_path        | string    | The maildir to make
+    messages            | int       | The number of DMARC report mails
+    records             | int       | The number of records in every report
+    noise               | float     | The number of other (non DMARC) mails per DMARC mail
+    seed                | int       | The seed for the random data, the same seed gives the same maildir
+
+    OUTPUT:
+    attachment_bytes    | int       | The size of all the DMARC attachments together
+    """
+    random.seed(seed)
+    maildir = mailbox.Maildir(maildir_path, create=True)
+    domain = 'example.test'
+    attachment_bytes = 0
+    other_mails = 0
+
+    for number in range(messages):
+        reporter = f'reporter{number % 25}.test'
+        report = dmarc_report(number, records, reporter, domain)
+        message = email.message.EmailMessage()
+        message['From'] = f'noreply-dmarc@{reporter}'
+        message['To'] = f'dmarc@{domain}'
+        message['Subject'] = f'Report Domain: {domain} Submitter: {reporter} Report-ID: <{number}>'
+        message['Date'] = email.utils.formatdate(time.time() - random.randint(0, 86400))
+        message['Message-ID'] = email.utils.make_msgid(domain=reporter)
+        message.set_content('This is an aggregate report from ' + reporter)
+
+        if number % 2:
+            zip_file = io.BytesIO()
+
+            with zipfile.ZipFile(zip_file, 'w', zipfile.ZIP_DEFLATED) as zip_archive:
+                zip_archive.writestr(f'{reporter}!{domain}!{number}.xml', report)
+
+            attachment = zip_file.getvalue()
+            message.add_attachment(attachment, maintype='application', subtype='zip', filename=f'{reporter}!{domain}!{number}.zip')
+        else:
+            attachment = gzip.compress(report)
+            message.add_attachment(attachment, maintype='application', subtype='gzip', filename=f'{reporter}!{domain}!{number}.xml.gz')
+
+        attachment_bytes += len(attachment)
+        maildir.add(message)
+
+        # The other mails that should be skipped by the scripts
+        while other_mails < (number + 1) * noise:
+            other = email.message.EmailMessage()
+            other['From'] = 'colleague@example.test'
+            other['To'] = f'dmarc@{domain}'
+            other['Subject'] = f'Lunch meeting {other_mails}'
+            other['Date'] = email.utils.formatdate()
+            other.set_content('See you at noon.\n' * 20)
+            maildir.add(other)
+            other_mails += 1
+
+    return attachment_bytes
+
+def make_app(scratch_dir, settings):
+    """
+    Make a fresh copy of the app in <scratch_dir>/etc/apps/TA-dmarc with the settings in local/ta-dmarc.conf
+
+    INPUT:
+    scratch_dir         | string    | The directory to use as SPLUNK_HOME
+    settings            | list      | key = value lines for the [main] stanza
+
+    OUTPUT:
+    test_app_dir        | string    | The directory of the copy of the app
+    """
+    test_app_dir = os.path.join(scratch_dir, 'etc', 'apps', 'TA-dmarc')
+    shutil.rmtree(test_app_dir, ignore_errors=True)
+
+    for sub_dir in ('bin', 'lib', 'default'):
+        shutil.copytree(os.path.join(app_dir, sub_dir), os.path.join(test_app_dir, sub_dir), ignore=shutil.ignore_patterns('__pycache__'))
+
+    os.makedirs(os.path.join(test_app_dir, 'local'))
+
+    with open(os.path.join(test_app_dir, 'local', 'ta-dmarc.conf'), 'w') as conf_file:
+        conf_file.write('[main]\n' + ''.join(f'{setting}\n' for setting in settings))
+
+    return test_app_dir
+
+def start_server(server):
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server.server_address[1]
+
+def run_protocol(protocol, args, scratch_dir):
+    """
+    Run the mail script once for a protocol against a new mock server
+
+    INPUT:
+    protocol            | string    | imap, pop3 or o365
+    args                | object    | The arguments of this script
+    scratch_dir         | string    | The directory to use as SPLUNK_HOME
+
+    OUTPUT:
+    result              | dict      | The elapsed time, return code, files and bytes written and the server statistics
+    """
+    test_app_dir = make_app(scratch_dir, args.setting)
+    env = dict(os.environ, SPLUNK_HOME=scratch_dir)
+
+    if protocol == 'o365':
+        cert_file, key_file = mock_graph.make_certificate(scratch_dir)
+        server = mock_graph.Mock_Graph_Server(('127.0.0.1', 0), mock_graph.load_maildir(args.maildir), cert_file, key_file,
+                                              args.latency, args.throttle_every, args.retry_after, args.max_page)
+        url = f"https://localhost:{start_server(server)}"
+        env['REQUESTS_CA_BUNDLE'] = cert_file
+        command = [os.path.join(test_app_dir, 'bin', 'TA-dmarc', 'mail-o365.py'), '-c', 'benchmark', '-t', 'benchmark', '-s', 'benchmark',
+                   '-u', 'dmarc@example.test', '-f', 'Inbox', '-a', args.action, '-m', 'Inbox/done', '--login_url', url, '--graph_url', url]
+    else:
+        handler = mock_mailserver.IMAP_Handler if protocol == 'imap' else mock_mailserver.POP3_Handler
+        server = mock_mailserver.Mock_Server(('127.0.0.1', 0), handler, mock_mailserver.load_maildir(args.maildir), None,
+                                             args.latency, args.bandwidth, args.max_connections)
+        command = [os.path.join(test_app_dir, 'bin', 'TA-dmarc', 'mail-client.py'), '-s', '127.0.0.1', '-p', str(start_server(server)),
+                   '-y', protocol.upper(), '-u', 'dmarc@example.test', '-x', 'benchmark', '-f', 'INBOX']
+
+    start = time.monotonic()
+    script = subprocess.run([sys.executable, *command, '--sessionKey', 'benchmark'], env=env, capture_output=True, text=True)
+    elapsed = time.monotonic() - start
+    server.shutdown()
+    server.server_close()
+
+    attachment_dir = os.path.join(test_app_dir, 'logs', 'attach_raw')
+    files = [os.path.join(attachment_dir, file_name) for file_name in os.listdir(attachment_dir)] if os.path.isdir(attachment_dir) else []
+
+    return {
+        'elapsed' : elapsed,
+        'returncode' : script.returncode,
+        'stderr' : script.stderr,
+        'files' : len(files),
+        'file_bytes' : sum(os.path.getsize(file_path) for file_path in files),
+        'stats' : dict(server.stats)
+        }
+
+def human_bytes(value):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if value < 1024 or unit == 'GB':
+            return f"{value:.1f} {unit}"
+        value /= 1024
+
+if __name__ == '__main__':
+    options = argparse.ArgumentParser(description='Benchmark the mail scripts against the local mock servers', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    options.add_argument('--protocols', default='imap,pop3,o365', help='Comma separated list of the protocols to test: imap, pop3 and/or o365')
+    options.add_argument('--maildir', help='Use this maildir instead of a synthetic one, all messages with a attachment should be DMARC reports')
+    options.add_argument('--messages', type=int, default=200, help='The number of DMARC mails in the synthetic maildir')
+    options.add_argument('--records', type=int, default=50, help='The number of records per report in the synthetic maildir')
+    options.add_argument('--noise', type=float, default=0.2, help='The number of other (non DMARC) mails per DMARC mail in the synthetic maildir')
+    options.add_argument('--runs', type=int, default=1, help='The number of runs per protocol')
+    options.add_argument('--latency', type=float, default=0.0, help='Seconds the mock servers wait before every command or request')
+    options.add_argument('--bandwidth', type=int, default=0, help='Max bytes per second per IMAP/POP3 connection, 0 = no max')
+    options.add_argument('--max_connections', type=int, default=0, help='Max IMAP/POP3 connections at the same time, 0 = no max')
+    options.add_argument('--throttle_every', type=int, default=0, help='Throttle (HTTP 429) every Nth Graph request, 0 = no throttling')
+    options.add_argument('--retry_after', type=int, default=1, help='The Retry-After seconds of a throttled Graph request')
+    options.add_argument('--max_page', type=int, default=1000, help='The max number of items per Graph page')
+    options.add_argument('--action', default='mark_read', help='The mailserver action of mail-o365.py: move, delete, mark_read or none')
+    options.add_argument('--setting', action='append', default=[], help='Extra key = value setting for the [main] stanza of local/ta-dmarc.conf, can be used more than once')
+    options.add_argument('--keep', action='store_true', help='Keep the scratch directory with the logs of the last run')
+    args = options.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix='ta-dmarc-benchmark-')
+
+    try:
+        if args.maildir is None:
+            args.maildir = os.path.join(scratch_dir, 'maildir')
+            make_maildir(args.maildir, args.messages, args.records, args.noise)
+
+        dmarc_messages = sum(1 for message in mailbox.Maildir(args.maildir, factory=None, create=False) if message.is_multipart())
+        print(f"Maildir {args.maildir}: {dmarc_messages} messages with a attachment")
+        print(f"{'protocol':<10}{'run':>4}{'rc':>4}{'seconds':>10}{'files':>8}{'messages/s':>12}{'bytes/s':>14}{'wire bytes/s':>15}  server")
+
+        for protocol in [protocol.strip().lower() for protocol in args.protocols.split(',') if protocol.strip()]:
+            if protocol not in ('imap', 'pop3', 'o365'):
+                print(f"Unknown protocol {protocol}, skipped")
+                continue
+
+            for run in range(1, args.runs + 1):
+                result = run_protocol(protocol, args, scratch_dir)
+                stats = result['stats']
+                elapsed = max(result['elapsed'], 0.001)
+                server_info = ', '.join(f"{key}={stats[key]}" for key in ('connections', 'commands', 'requests', 'batches', 'throttled', 'refused') if key in stats)
+
+                print(f"{protocol:<10}{run:>4}{result['returncode']:>4}{elapsed:>10.2f}{result['files']:>8}{result['files'] / elapsed:>12.1f}"
+                      f"{human_bytes(result['file_bytes'] / elapsed) + '/s':>14}{human_bytes(stats.get('bytes_sent', 0) / elapsed) + '/s':>15}  {server_info}")
+
+                if result['returncode'] != 0:
+                    print(result['stderr'][-2000:], file=sys.stderr)
+    finally:
+        if args.keep:
+            print(f"Scratch directory: {scratch_dir}")
+        else:
+            shutil.rmtree(scratch_dir, ignore_errors=True)
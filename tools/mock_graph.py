@@ -0,0 +1,531 @@
+#!/usr/bin/python
+"""
+Copyright 2026- Arnold Holzel
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+##################################################################
+# Author        : Arnold Holzel
+# Creation date : 2026-10-17
+# Description   : Local HTTPS server that acts like the parts of the Microsoft login and Graph API
+#                 that mail-o365.py uses (token, mailFolders, messages with $filter and delta,
+#                 attachments, move/PATCH/DELETE and $batch), to test and benchmark mail-o365.py
+#                 without a o365 tenant. The messages are read from a maildir and only changed in
+#                 memory. NOT for production use, there is no real authentication.
+#
+#                 Latency (per request) and throttling (every Nth request gets a HTTP 429 with a
+#                 Retry-After header) can be set to simulate a busy tenant.
+#
+#                 Start mail-o365.py with --login_url and --graph_url set to the url of this server
+#                 and REQUESTS_CA_BUNDLE set to the certificate file, the user and secret can be anything.
+#
+# Version history
+# Change log is in the CHANGELOG.md file in the readme dir of the app
+#
+##################################################################
+
+import argparse
+import datetime
+import email
+import email.policy
+import email.utils
+import http.server
+import json
+import mailbox
+import os
+import re
+import ssl
+import subprocess
+import threading
+import time
+import urllib.parse
+import uuid
+
+__version__ = "1.0.0"
+__author__ = 'Arnold Holzel'
+__license__ = 'Apache License 2.0'
+
+class Graph_Store(object):
+    def __init__(self):
+        # The folders and messages of the mailbox. Every change gets a sequence number so the
+        # delta query can return the messages that are changed (or removed) since a deltaLink.
+        self.lock = threading.RLock()
+        self.folders = {}
+        self.messages = {}
+        self.order = []
+        self.removed = {}
+        self.delta_tokens = {}
+        self.counter = 0
+        self.inbox = self.add_folder('Inbox')
+
+    def next_sequence(self):
+        self.counter += 1
+        return self.counter
+
+    def add_folder(self, name, parent=None):
+        folder_id = 'F' + uuid.uuid4().hex
+        self.folders[folder_id] = { 'id' : folder_id, 'displayName' : name, 'parent' : parent }
+        return folder_id
+
+    def add_message(self, subject, attachments, sender='noreply@example.test', received=None, is_read=False, folder=None):
+        """
+        Add a message to the store
+
+        INPUT:
+        subject             | string    | The subject of the message
+        attachments         | list      | (name, content type, bytes) tuples
+        sender              | string    | The mail address of the sender
+        received            | string    | The receivedDateTime (ISO 8601), default: now
+        is_read             | bool      | Is the message read
+        folder              | string    | The ID of the folder, default: the Inbox
+
+        OUTPUT:
+        message_id          | string    | The ID of the new message
+        """
+        message_id = 'M' + uuid.uuid4().hex
+        self.messages[message_id] = {
+            'id' : message_id,
+            'subject' : subject,
+            'isRead' : is_read,
+            'hasAttachments' : bool(attachments),
+            'receivedDateTime' : received or datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'sender' : { 'emailAddress' : { 'address' : sender } },
+            'folder' : folder or self.inbox,
+            'attachments' : [{ 'id' : 'A' + uuid.uuid4().hex, 'name' : name, 'contentType' : content_type, 'data' : data } for name, content_type, data in attachments],
+            'sequence' : self.next_sequence()
+            }
+        self.order.append(message_id)
+        return message_id
+
+    def remove_message(self, message):
+        # Remember the removed message for the delta query of the folder
+        self.removed.setdefault(message['folder'], []).append((message['id'], self.next_sequence()))
+        del self.messages[message['id']]
+
+def load_maildir(maildir_path):
+    """
+    Read all the messages of a maildir (new and cur) in a Graph_Store
+
+    INPUT:
+    maildir_path        | string    | The maildir, with the cur, new and tmp directory's
+
+    OUTPUT:
+    store               | object    | The Graph_Store with the messages in the Inbox, sorted on the maildir key
+    """
+    store = Graph_Store()
+    maildir = mailbox.Maildir(maildir_path, factory=None, create=False)
+
+    for key in sorted(maildir.keys()):
+        message = email.message_from_bytes(maildir.get_bytes(key), policy=email.policy.default)
+        attachments = [(part.get_filename(), part.get_content_type(), part.get_payload(decode=True) or b'') for part in message.iter_attachments()]
+
+        try:
+            received = email.utils.parsedate_to_datetime(message['Date']).astimezone(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+        except (TypeError, ValueError):
+            received = None
+
+        sender = email.utils.parseaddr(str(message.get('From', '')))[1] or 'noreply@example.test'
+        store.add_message(str(message.get('Subject', '')), attachments, sender, received, 'S' in maildir.get_message(key).get_flags())
+
+    return store
+
+def make_certificate(cert_dir):
+    """
+    Make a self signed certificate for localhost with the openssl command, if it isn't there yet
+
+    INPUT:
+    cert_dir            | string    | The directory for the certificate and key
+
+    OUTPUT:
+    cert_file           | string    | The certificate (also the CA bundle for the client)
+    key_file            | string    | The private key
+    """
+    cert_file = os.path.join(cert_dir, 'mock_graph_cert.pem')
+    key_file = os.path.join(cert_dir, 'mock_graph_key.pem')
+
+    if not (os.path.exists(cert_file) and os.path.exists(key_file)):
+        subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-keyout', key_file, '-out', cert_file, '-days', '30',
+                        '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost,IP:127.0.0.1'], check=True, capture_output=True)
+
+    return cert_file, key_file
+
+def graph_error(status, code, message):
+    return status, { 'error' : { 'code' : code, 'message' : message } }, None, None
+
+class Graph_Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        # No access log on the console
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.count('connections')
+
+    def send(self, status, body=None, headers=None, raw=None):
+        if raw is None:
+            raw = json.dumps(body).encode() if body is not None else b''
+            content_type = 'application/json'
+        else:
+            content_type = 'application/octet-stream'
+
+        self.send_response(status)
+
+        if raw:
+            self.send_header('Content-Type', content_type)
+
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+        self.server.count('bytes_sent', len(raw))
+
+    def do_GET(self):
+        self.dispatch('GET')
+
+    def do_POST(self):
+        self.dispatch('POST')
+
+    def do_PATCH(self):
+        self.dispatch('PATCH')
+
+    def do_DELETE(self):
+        self.dispatch('DELETE')
+
+    def dispatch(self, method):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        data = self.rfile.read(length) if length else b''
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(url.path)
+        query = dict(urllib.parse.parse_qsl(url.query, keep_blank_values=True))
+        server.count('requests')
+
+        # The login part: the openid configuration and the token endpoint
+        tenant = re.match(r'^/([^/]+)/v2\.0/\.well-known/openid-configuration$', path)
+
+        if tenant:
+            base = f'https://{self.headers["Host"]}/{tenant.group(1)}'
+            return self.send(200, { 'authorization_endpoint' : f'{base}/oauth2/v2.0/authorize', 'token_endpoint' : f'{base}/oauth2/v2.0/token', 'issuer' : f'{base}/v2.0' })
+
+        if re.match(r'^/[^/]+/oauth2/v2\.0/token$', path):
+            server.count('tokens')
+            return self.send(200, { 'access_token' : 'mock' + uuid.uuid4().hex, 'token_type' : 'Bearer', 'expires_in' : 3600 })
+
+        if not self.headers.get('Authorization', '').startswith('Bearer '):
+            return self.send(*graph_error(401, 'InvalidAuthenticationToken', 'Access token is empty.')[:2])
+
+        if server.throttled():
+            return self.send(*graph_error(429, 'TooManyRequests', 'Too many requests')[:2], { 'Retry-After' : str(server.retry_after) })
+
+        status, body, headers, raw = self.graph(method, path, query, data)
+        self.send(status, body, headers, raw)
+
+    def graph(self, method, path, query, data):
+        """
+        Handle one Graph request, also used for the requests in a $batch
+
+        OUTPUT:
+        status              | int       | The HTTP status
+        body                | dict      | The JSON body, None if there is no (JSON) body
+        headers             | dict      | Extra response headers
+        raw                 | bytes     | The raw body of a $value request, None for JSON
+        """
+        server = self.server
+        store = server.store
+
+        if path == '/v1.0/$batch' and method == 'POST':
+            server.count('batches')
+            batch_requests = json.loads(data)['requests']
+
+            if len(batch_requests) > 20:
+                return graph_error(400, 'BadRequest', 'The number of requests in the batch exceeds the limit of 20')
+
+            responses = []
+
+            for request in batch_requests:
+                request_url = urllib.parse.urlsplit(request['url'])
+
+                if server.throttled():
+                    responses.append({ 'id' : request['id'], 'status' : 429, 'headers' : { 'Retry-After' : str(server.retry_after) }, 'body' : graph_error(429, 'TooManyRequests', 'Too many requests')[1] })
+                    continue
+
+                status, body, headers, raw = self.graph(request['method'], '/v1.0' + urllib.parse.unquote(request_url.path),
+                                                        dict(urllib.parse.parse_qsl(request_url.query)), json.dumps(request.get('body', {})).encode())
+                responses.append({ 'id' : request['id'], 'status' : status, 'headers' : headers or {}, 'body' : body })
+
+            return 200, { 'responses' : responses }, None, None
+
+        user = re.match(r'^/v1\.0/users/([^/]+)(/.*)$', path)
+
+        if not user:
+            return graph_error(400, 'BadRequest', f'Unsupported path {path}')
+
+        base_url = f'https://{self.headers["Host"]}/v1.0/users/{user.group(1)}'
+        rest = user.group(2)
+
+        with store.lock:
+            # Folders and child folders
+            child_folders = re.match(r'^/mailFolders(?:/([^/]+)/childFolders)?$', rest)
+
+            if child_folders:
+                parent = child_folders.group(1)
+
+                if parent and parent not in store.folders:
+                    return graph_error(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+
+                if method == 'POST':
+                    name = json.loads(data)['displayName']
+                    folder_id = store.add_folder(name, parent)
+                    return 201, { 'id' : folder_id, 'displayName' : name }, None, None
+
+                folders = [{ 'id' : folder['id'], 'displayName' : folder['displayName'] } for folder in store.folders.values() if folder['parent'] == parent]
+                return self.page(folders, query, f'{base_url}{rest}')
+
+            folder = re.match(r'^/mailFolders/([^/]+)$', rest)
+
+            if folder:
+                folder = store.folders.get(folder.group(1))
+
+                if not folder:
+                    return graph_error(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+
+                return 200, { 'id' : folder['id'], 'displayName' : folder['displayName'], 'parentFolderId' : folder['parent'] or 'root' }, None, None
+
+            # The messages of a folder, with a $filter or as a delta query
+            folder_messages = re.match(r'^/mailFolders/([^/]+)/messages(/delta)?$', rest)
+
+            if folder_messages:
+                folder_id = folder_messages.group(1)
+
+                if folder_id not in store.folders:
+                    return graph_error(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+
+                messages = [store.messages[message_id] for message_id in store.order if message_id in store.messages and store.messages[message_id]['folder'] == folder_id]
+
+                if folder_messages.group(2):
+                    return self.delta(folder_id, messages, query, f'{base_url}{rest}')
+
+                message_filter = query.get('$filter', '')
+
+                if 'isRead ne true' in message_filter:
+                    messages = [message for message in messages if not message['isRead']]
+
+                if 'hasAttachments eq true' in message_filter:
+                    messages = [message for message in messages if message['hasAttachments']]
+
+                subjects = [subject.replace("''", "'").lower() for subject in re.findall(r"contains\(subject,\s*'((?:[^']|'')*)'\)", message_filter)]
+
+                if subjects:
+                    messages = [message for message in messages if any(subject in message['subject'].lower() for subject in subjects)]
+
+                return self.page([self.message_json(message) for message in messages], query, f'{base_url}{rest}')
+
+            message = re.match(r'^/messages/([^/]+)(/.*)?$', rest)
+
+            if not message:
+                return graph_error(400, 'BadRequest', f'Unsupported path {rest}')
+
+            sub_path = message.group(2) or ''
+            message = store.messages.get(message.group(1))
+
+            if not message:
+                return graph_error(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+
+            if sub_path == '/attachments' and method == 'GET':
+                attachments = [{ '@odata.type' : '#microsoft.graph.fileAttachment', 'id' : attachment['id'], 'name' : attachment['name'],
+                                 'contentType' : attachment['contentType'], 'size' : len(attachment['data'])} for attachment in message['attachments']]
+                return 200, { 'value' : attachments }, None, None
+
+            attachment_value = re.match(r'^/attachments/([^/]+)/\$value$', sub_path)
+
+            if attachment_value and method == 'GET':
+                for attachment in message['attachments']:
+                    if attachment['id'] == attachment_value.group(1):
+                        server.count('attachment_bytes', len(attachment['data']))
+                        return 200, None, None, attachment['data']
+
+                return graph_error(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+
+            if sub_path == '/move' and method == 'POST':
+                destination = json.loads(data)['destinationId']
+
+                if destination not in store.folders:
+                    return graph_error(404, 'ErrorItemNotFound', 'The specified object was not found in the store.')
+
+                # Like Exchange, a moved message gets a new ID
+                store.remove_message(message)
+                message = dict(message, id='M' + uuid.uuid4().hex, folder=destination, sequence=store.next_sequence())
+                store.messages[message['id']] = message
+                store.order.append(message['id'])
+                return 201, self.message_json(message), None, None
+
+            if sub_path == '' and method == 'PATCH':
+                message.update({ key : value for key, value in json.loads(data).items() if key == 'isRead' })
+                message['sequence'] = store.next_sequence()
+                return 200, self.message_json(message), None, None
+
+            if sub_path == '' and method == 'DELETE':
+                store.remove_message(message)
+                return 204, None, None, None
+
+            if sub_path == '' and method == 'GET':
+                return 200, self.message_json(message), None, None
+
+        return graph_error(400, 'BadRequest', f'Unsupported request {method} {rest}')
+
+    def page_size(self, query, default=10):
+        # $top or the odata.maxpagesize preference, never more than the max_page of the server
+        size = query.get('$top')
+
+        if not size:
+            max_page_size = re.search(r'odata\.maxpagesize=(\d+)', self.headers.get('Prefer', ''))
+            size = max_page_size.group(1) if max_page_size else default
+
+        return max(min(int(size), self.server.max_page), 1)
+
+    def page(self, items, query, url):
+        # One page of items with a @odata.nextLink to the next page
+        size = self.page_size(query)
+        skip = int(query.get('$skip', 0))
+        body = { 'value' : items[skip:skip + size] }
+
+        if skip + size < len(items):
+            body['@odata.nextLink'] = url + '?' + urllib.parse.urlencode(dict(query, **{ '$skip' : str(skip + size) }))
+
+        return 200, body, None, None
+
+    def delta(self, folder_id, messages, query, url):
+        # The first delta query returns all messages of the folder, page by page, the last page has a
+        # @odata.deltaLink that returns the messages that are changed or removed since that page.
+        store = self.server.store
+        token = query.get('$deltatoken') or query.get('$skiptoken')
+
+        if token:
+            state = store.delta_tokens.get(token)
+
+            if state is None:
+                return graph_error(410, 'SyncStateNotFound', 'The sync state generation is not found.')
+
+            if state[0] == 'delta':
+                since = state[1]
+                snapshot = [message['id'] for message in sorted(store.messages.values(), key=lambda message: message['sequence']) if message['sequence'] > since and message['folder'] == folder_id]
+                snapshot += [message_id for message_id, sequence in store.removed.get(folder_id, []) if sequence > since]
+                offset, start = 0, store.counter
+            else:
+                snapshot, offset, start = state[1:]
+        else:
+            snapshot = [message['id'] for message in sorted(messages, key=lambda message: message['sequence'])]
+            offset, start = 0, store.counter
+
+        size = self.page_size(query)
+        items = []
+
+        for message_id in snapshot[offset:offset + size]:
+            message = store.messages.get(message_id)
+
+            if message is None or message['folder'] != folder_id:
+                items.append({ 'id' : message_id, '@removed' : { 'reason' : 'deleted' } })
+            else:
+                items.append(self.message_json(message))
+
+        token = uuid.uuid4().hex
+        body = { 'value' : items }
+
+        if offset + size < len(snapshot):
+            store.delta_tokens[token] = ('page', snapshot, offset + size, start)
+            body['@odata.nextLink'] = url + '?' + urllib.parse.urlencode({ '$skiptoken' : token })
+        else:
+            store.delta_tokens[token] = ('delta', start)
+            body['@odata.deltaLink'] = url + '?' + urllib.parse.urlencode({ '$deltatoken' : token })
+
+        return 200, body, None, None
+
+    def message_json(self, message):
+        return { key : message[key] for key in ('id', 'subject', 'isRead', 'hasAttachments', 'receivedDateTime', 'sender') }
+
+class Mock_Graph_Server(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, store, cert_file, key_file, latency=0.0, throttle_every=0, retry_after=1, max_page=1000):
+        # Example usage:
+        #   cert_file, key_file = make_certificate('/tmp')
+        #   server = Mock_Graph_Server(('127.0.0.1', 0), load_maildir('/tmp/maildir'), cert_file, key_file, latency=0.02)
+        #   threading.Thread(target=server.serve_forever, daemon=True).start()
+        #   graph_url = f"https://localhost:{server.server_address[1]}"
+        #
+        # latency is the seconds to wait before every request, every throttle_every-th request (also in a
+        # $batch) gets a HTTP 429 with the retry_after seconds and max_page is the max items per page.
+        super().__init__(address, Graph_Handler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_file, key_file)
+        self.socket = context.wrap_socket(self.socket, server_side=True)
+        self.store = store
+        self.latency = latency
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.max_page = max_page
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.stats_lock:
+            self.stats[name] = self.stats.get(name, 0) + value
+
+    def throttled(self):
+        # Count the request and tell if it must be throttled
+        if not self.throttle_every:
+            return False
+
+        with self.stats_lock:
+            self.stats['throttle_count'] = self.stats.get('throttle_count', 0) + 1
+
+            if self.stats['throttle_count'] % self.throttle_every:
+                return False
+
+            self.stats['throttled'] = self.stats.get('throttled', 0) + 1
+            return True
+
+if __name__ == '__main__':
+    options = argparse.ArgumentParser(description='Local Microsoft Graph server for a maildir, for testing only', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    options.add_argument('--maildir', required=True, help='The maildir with the messages')
+    options.add_argument('--host', default='127.0.0.1', help='The address to listen on')
+    options.add_argument('--port', type=int, default=8443, help='The HTTPS port')
+    options.add_argument('--cert_dir', default=os.path.dirname(os.path.realpath(__file__)), help='The directory for the self signed certificate')
+    options.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before every request')
+    options.add_argument('--throttle_every', type=int, default=0, help='Throttle (HTTP 429) every Nth request, 0 = no throttling')
+    options.add_argument('--retry_after', type=int, default=1, help='The Retry-After seconds of a throttled request')
+    options.add_argument('--max_page', type=int, default=1000, help='The max number of items per page')
+    args = options.parse_args()
+
+    cert_file, key_file = make_certificate(args.cert_dir)
+    server = Mock_Graph_Server((args.host, args.port), load_maildir(args.maildir), cert_file, key_file, args.latency, args.throttle_every, args.retry_after, args.max_page)
+    print(f"Graph server on https://localhost:{server.server_address[1]} with {len(server.store.messages)} messages, CA bundle: {cert_file}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"Statistics: {server.stats}")
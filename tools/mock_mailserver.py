@@ -0,0 +1,621 @@
+#!/usr/bin/python
+"""
+Copyright 2026- Arnold Holzel
+
+Permission is hereby granted, free of charge, to any person obtaining a copy
+of this software and associated documentation files (the "Software"), to deal
+in the Software without restriction, including without limitation the rights to
+use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies
+of the Software, and to permit persons to whom the Software is furnished to do
+so, subject to the following conditions:
+
+The above copyright notice and this permission notice shall be included in
+all copies or substantial portions of the Software.
+
+THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+SOFTWARE.
+"""
+##################################################################
+# Author        : Arnold Holzel
+# Creation date : 2026-10-17
+# Description   : Local IMAP4rev1 and POP3 server to test and benchmark mail-client.py
+#                 without a real mailbox. The messages are read from a maildir, the changes
+#                 (flags, deletes) are only made in memory so the maildir can be used again.
+#                 Only the commands that mail-client.py uses are supported, NOT for production use.
+#
+#                 Latency (per command), bandwidth (bytes per second per connection) and a max
+#                 number of connections (the next connections are refused) can be set to
+#                 simulate a slow or throttling mail server.
+#
+# Version history
+# Change log is in the CHANGELOG.md file in the readme dir of the app
+#
+##################################################################
+
+import argparse
+import datetime
+import email
+import email.header
+import email.utils
+import hashlib
+import mailbox
+import re
+import socketserver
+import threading
+import time
+
+__version__ = "1.0.0"
+__author__ = 'Arnold Holzel'
+__license__ = 'Apache License 2.0'
+
+class Mailbox(object):
+    def __init__(self, uidvalidity=1):
+        # The messages of the mailbox, shared by the IMAP and POP3 server.
+        # Every message is a dict with: uid, flags (set), raw (bytes with CRLF line breaks) and date
+        self.lock = threading.RLock()
+        self.uidvalidity = uidvalidity
+        self.uidnext = 1
+        self.messages = []
+
+    def add(self, raw, date=None, flags=()):
+        with self.lock:
+            self.messages.append({ 'uid' : self.uidnext, 'flags' : set(flags), 'raw' : raw, 'date' : date or datetime.date.today() })
+            self.uidnext += 1
+
+def load_maildir(maildir_path, uidvalidity=1):
+    """
+    Read all the messages of a maildir (new and cur) in a Mailbox
+
+    INPUT:
+    maildir_path        | string    | The maildir, with the cur, new and tmp directory's
+    uidvalidity         | int       | The UIDVALIDITY of the IMAP folder
+
+    OUTPUT:
+    mail_box            | object    | The Mailbox with the messages, sorted on the maildir key
+    """
+    mail_box = Mailbox(uidvalidity)
+    maildir = mailbox.Maildir(maildir_path, factory=None, create=False)
+
+    for key in sorted(maildir.keys()):
+        message = maildir.get_message(key)
+        raw = message.as_bytes().replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+
+        try:
+            date = email.utils.parsedate_to_datetime(message['Date']).date()
+        except (TypeError, ValueError):
+            date = None
+
+        # maildir flag S = seen
+        mail_box.add(raw, date, ['\\Seen'] if 'S' in message.get_flags() else [])
+
+    return mail_box
+
+def tokenize(data):
+    # Split a IMAP command in atoms, quoted strings ('STR', value) and lists (nested python lists)
+    tokens = []
+    stack = [tokens]
+    i = 0
+
+    while i < len(data):
+        char = data[i]
+
+        if char == ' ':
+            i += 1
+        elif char == '(':
+            new_list = []
+            stack[-1].append(new_list)
+            stack.append(new_list)
+            i += 1
+        elif char == ')':
+            stack.pop()
+            i += 1
+        elif char == '"':
+            j = i + 1
+            value = ''
+
+            while data[j] != '"':
+                if data[j] == '\\':
+                    j += 1
+                value += data[j]
+                j += 1
+
+            stack[-1].append(('STR', value))
+            i = j + 1
+        else:
+            # BODY.PEEK[HEADER.FIELDS (A B)]<0.100> is one atom
+            atom = re.match(r'[^ ()\[]*(\[[^\]]*\](<[^>]*>)?)?[^ ()]*', data[i:]).group(0)
+            stack[-1].append(atom)
+            i += len(atom)
+
+    return tokens
+
+def parse_set(sequence_set, maximum):
+    # A IMAP sequence set (1:5,7,9:*) as a python set
+    result = set()
+
+    for part in sequence_set.split(','):
+        if ':' in part:
+            start, end = [maximum if value == '*' else int(value) for value in part.split(':')]
+            result.update(range(min(start, end), max(start, end) + 1))
+        else:
+            result.add(maximum if part == '*' else int(part))
+
+    return result
+
+def header_fields(raw, fields):
+    # Only the given (uppercase) header fields of a message
+    headers = raw.partition(b'\r\n\r\n')[0]
+    lines = []
+    wanted = False
+
+    for line in headers.split(b'\r\n'):
+        if line[:1] in (b' ', b'\t'):
+            if wanted:
+                lines.append(line)
+            continue
+
+        wanted = line.split(b':', 1)[0].decode('ascii', 'replace').upper() in fields
+
+        if wanted:
+            lines.append(line)
+
+    return b'\r\n'.join(lines) + b'\r\n\r\n'
+
+def bodystructure(part):
+    # The IMAP BODYSTRUCTURE of a email.message.Message
+    if part.is_multipart():
+        sub_parts = ''.join(bodystructure(sub_part) for sub_part in part.get_payload())
+        return f'({sub_parts} "{part.get_content_subtype().upper()}")'
+
+    params = ' '.join(f'"{key.upper()}" "{value}"' for key, value in part.get_params()[1:]) if part.get_params() else ''
+    params = f'({params})' if params else 'NIL'
+    payload = part.get_payload(decode=False)
+    size = len(payload.encode() if isinstance(payload, str) else payload)
+    encoding = part.get('Content-Transfer-Encoding', '7BIT').upper()
+    disposition = part.get('Content-Disposition')
+
+    if disposition:
+        disposition_params = ' '.join(f'"{key.upper()}" "{value}"' for key, value in part.get_params(header='Content-Disposition')[1:])
+        disposition = f'("{disposition.split(";", 1)[0].strip().upper()}" ' + (f'({disposition_params}))' if disposition_params else 'NIL)')
+    else:
+        disposition = 'NIL'
+
+    maintype, subtype = part.get_content_maintype().upper(), part.get_content_subtype().upper()
+    lines = f' {payload.count(chr(10))}' if maintype == 'TEXT' and isinstance(payload, str) else ''
+
+    return f'("{maintype}" "{subtype}" {params} NIL NIL "{encoding}" {size}{lines} NIL {disposition} NIL NIL)'
+
+def get_part(raw, section):
+    # The (still transfer encoded) body of a part of the message, section 1.2 = second part of the first part
+    part = email.message_from_bytes(raw)
+
+    for number in section.split('.'):
+        number = int(number)
+
+        if part.is_multipart():
+            part = part.get_payload()[number - 1]
+        elif number != 1:
+            return b''
+
+    part_bytes = part.as_bytes()
+
+    if b'\r\n\r\n' in part_bytes:
+        return part_bytes.partition(b'\r\n\r\n')[2]
+
+    return part_bytes.partition(b'\n\n')[2].replace(b'\r\n', b'\n').replace(b'\n', b'\r\n')
+
+class Mail_Handler(socketserver.StreamRequestHandler):
+    # The parts that the IMAP and POP3 handler share: connection limit, latency, bandwidth and statistics
+    def setup(self):
+        super().setup()
+
+        with self.server.stats_lock:
+            self.server.active_connections += 1
+            self.server.stats['connections'] = self.server.stats.get('connections', 0) + 1
+            self.refused = self.server.max_connections and self.server.active_connections > self.server.max_connections
+
+            if self.refused:
+                self.server.stats['refused'] = self.server.stats.get('refused', 0) + 1
+
+    def finish(self):
+        with self.server.stats_lock:
+            self.server.active_connections -= 1
+
+        super().finish()
+
+    def count(self, name):
+        with self.server.stats_lock:
+            self.server.stats[name] = self.server.stats.get(name, 0) + 1
+
+    def send(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+
+        self.wfile.write(data)
+
+        with self.server.stats_lock:
+            self.server.stats['bytes_sent'] = self.server.stats.get('bytes_sent', 0) + len(data)
+
+        if self.server.bandwidth:
+            time.sleep(len(data) / self.server.bandwidth)
+
+    def wait(self):
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+class IMAP_Handler(Mail_Handler):
+    def handle(self):
+        if self.refused:
+            self.send('* BYE [UNAVAILABLE] too many connections\r\n')
+            return
+
+        self.send('* OK mock IMAP4rev1 ready\r\n')
+
+        while True:
+            line = self.rfile.readline()
+
+            if not line:
+                return
+
+            line = line.decode('utf-8', 'replace').rstrip('\r\n')
+
+            # a literal of the client is added to the command as a quoted string
+            while line.endswith('}'):
+                literal = re.search(r'\{(\d+)\}$', line)
+                self.send('+ go ahead\r\n')
+                value = self.rfile.read(int(literal.group(1))).decode('utf-8', 'replace')
+                line = line[:literal.start()] + '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"' + self.rfile.readline().decode('utf-8', 'replace').rstrip('\r\n')
+
+            self.wait()
+            tag, _, rest = line.partition(' ')
+            command, _, arguments = rest.partition(' ')
+            command = command.upper()
+            self.count('commands')
+            self.count(command)
+
+            try:
+                if command == 'UID':
+                    command, _, arguments = arguments.partition(' ')
+                    self.count(f"UID {command.upper()}")
+                    result = self.dispatch(tag, command.upper(), arguments, True)
+                else:
+                    result = self.dispatch(tag, command, arguments, False)
+            except Exception as exception:
+                self.send(f'{tag} BAD {type(exception).__name__}: {exception}\r\n')
+                continue
+
+            if result == 'BYE':
+                return
+
+    def dispatch(self, tag, command, arguments, uid):
+        mail_box = self.server.mailbox
+
+        if command in ('CAPABILITY', 'NOOP'):
+            if command == 'CAPABILITY':
+                self.send('* CAPABILITY IMAP4rev1 UIDPLUS\r\n')
+        elif command == 'LOGIN':
+            user, password = tokenize(arguments)
+
+            if self.server.password and password[1] != self.server.password:
+                self.send(f'{tag} NO [AUTHENTICATIONFAILED] invalid credentials\r\n')
+                return
+        elif command == 'LOGOUT':
+            self.send('* BYE logging out\r\n')
+            self.send(f'{tag} OK LOGOUT completed\r\n')
+            return 'BYE'
+        elif command in ('SELECT', 'EXAMINE'):
+            with mail_box.lock:
+                self.send(f'* {len(mail_box.messages)} EXISTS\r\n* 0 RECENT\r\n')
+                self.send(f'* OK [UIDVALIDITY {mail_box.uidvalidity}] UIDs valid\r\n')
+                self.send(f'* OK [UIDNEXT {mail_box.uidnext}] next UID\r\n')
+                self.send('* FLAGS (\\Answered \\Flagged \\Deleted \\Seen \\Draft)\r\n')
+            self.send(f'{tag} OK [READ-WRITE] {command} completed\r\n')
+            return
+        elif command == 'STATUS':
+            with mail_box.lock:
+                unseen = sum(1 for message in mail_box.messages if '\\Seen' not in message['flags'])
+                self.send(f'* STATUS "{tokenize(arguments)[0]}" (MESSAGES {len(mail_box.messages)} RECENT 0 UIDNEXT {mail_box.uidnext} UIDVALIDITY {mail_box.uidvalidity} UNSEEN {unseen})\r\n')
+        elif command == 'SEARCH':
+            tokens = tokenize(arguments)
+
+            if tokens and tokens[0] == 'CHARSET':
+                tokens = tokens[2:]
+
+            with mail_box.lock:
+                found = [message['uid'] if uid else n + 1 for n, message in enumerate(mail_box.messages) if self.match_all(tokens, n, message)]
+
+            self.send('* SEARCH' + ''.join(f' {number}' for number in found) + '\r\n')
+        elif command == 'FETCH':
+            sequence_set, _, items = arguments.partition(' ')
+            self.fetch(sequence_set, items, uid)
+        elif command == 'STORE':
+            sequence_set, mode, flags = arguments.split(' ', 2)
+            flags = set(flags.strip('()').split())
+
+            with mail_box.lock:
+                for n, message in self.select_set(sequence_set, uid):
+                    if mode.startswith('+'):
+                        message['flags'] |= flags
+                    elif mode.startswith('-'):
+                        message['flags'] -= flags
+                    else:
+                        message['flags'] = set(flags)
+
+                    if '.SILENT' not in mode.upper():
+                        self.send(f'* {n + 1} FETCH (UID {message["uid"]} FLAGS ({" ".join(sorted(message["flags"]))}))\r\n')
+        elif command in ('EXPUNGE', 'CLOSE'):
+            with mail_box.lock:
+                n = 0
+
+                while n < len(mail_box.messages):
+                    if '\\Deleted' in mail_box.messages[n]['flags']:
+                        del mail_box.messages[n]
+
+                        if command == 'EXPUNGE':
+                            self.send(f'* {n + 1} EXPUNGE\r\n')
+                    else:
+                        n += 1
+        else:
+            self.send(f'{tag} BAD unknown command\r\n')
+            return
+
+        self.send(f'{tag} OK {command} completed\r\n')
+
+    def select_set(self, sequence_set, uid):
+        mail_box = self.server.mailbox
+
+        if not mail_box.messages:
+            return []
+
+        if uid:
+            wanted = parse_set(sequence_set, mail_box.messages[-1]['uid'])
+            return [(n, message) for n, message in enumerate(mail_box.messages) if message['uid'] in wanted]
+
+        wanted = parse_set(sequence_set, len(mail_box.messages))
+        return [(n, message) for n, message in enumerate(mail_box.messages) if n + 1 in wanted]
+
+    def match_all(self, tokens, n, message):
+        tokens = list(tokens)
+
+        while tokens:
+            if not self.match_one(tokens, n, message):
+                return False
+
+        return True
+
+    def match_one(self, tokens, n, message):
+        token = tokens.pop(0)
+
+        if isinstance(token, list):
+            return self.match_all(token, n, message)
+
+        token = token.upper()
+
+        if token == 'ALL':
+            return True
+        elif token == 'OR':
+            first = self.match_one(tokens, n, message)
+            second = self.match_one(tokens, n, message)
+            return first or second
+        elif token == 'NOT':
+            return not self.match_one(tokens, n, message)
+        elif token in ('DELETED', 'UNDELETED', 'SEEN', 'UNSEEN'):
+            flag = '\\Deleted' if token.endswith('DELETED') else '\\Seen'
+            return (flag in message['flags']) != token.startswith('UN')
+        elif token == 'UID':
+            return message['uid'] in parse_set(tokens.pop(0), self.server.mailbox.messages[-1]['uid'])
+        elif token == 'SINCE':
+            return message['date'] >= datetime.datetime.strptime(tokens.pop(0), '%d-%b-%Y').date()
+        elif token == 'SUBJECT':
+            needle = tokens.pop(0)
+            needle = needle[1] if isinstance(needle, tuple) else needle
+            subject = email.message_from_bytes(header_fields(message['raw'], {'SUBJECT'})).get('Subject', '')
+            subject = str(email.header.make_header(email.header.decode_header(subject)))
+            return needle.lower() in subject.lower()
+        elif re.match(r'^[\d:*,]+$', token):
+            return n + 1 in parse_set(token, len(self.server.mailbox.messages))
+
+        raise ValueError(f"unsupported search key {token}")
+
+    def fetch(self, sequence_set, items, uid):
+        mail_box = self.server.mailbox
+        tokens = tokenize(items)
+
+        if len(tokens) == 1 and isinstance(tokens[0], list):
+            tokens = tokens[0]
+
+        tokens = [token.upper() if isinstance(token, str) else token for token in tokens]
+
+        with mail_box.lock:
+            selected = self.select_set(sequence_set, uid)
+
+        for n, message in selected:
+            items_out = []
+            seen = False
+
+            if uid and 'UID' not in tokens:
+                items_out.append(f'UID {message["uid"]}')
+
+            for token in tokens:
+                if token == 'UID':
+                    items_out.append(f'UID {message["uid"]}')
+                elif token == 'FLAGS':
+                    items_out.append(f'FLAGS ({" ".join(sorted(message["flags"]))})')
+                elif token == 'RFC822.SIZE':
+                    items_out.append(f'RFC822.SIZE {len(message["raw"])}')
+                elif token == 'BODYSTRUCTURE':
+                    items_out.append('BODYSTRUCTURE ' + bodystructure(email.message_from_bytes(message['raw'])))
+                elif token in ('RFC822', 'BODY[]', 'BODY.PEEK[]'):
+                    items_out.append(('RFC822' if token == 'RFC822' else 'BODY[]', message['raw']))
+                    seen = seen or 'PEEK' not in token
+                elif token.startswith('BODY'):
+                    body_item = re.match(r'BODY(\.PEEK)?\[([^\]]*)\](<(\d+)\.(\d+)>)?', token)
+                    section = body_item.group(2)
+
+                    if section.startswith('HEADER.FIELDS'):
+                        data = header_fields(message['raw'], set(section[section.index('(') + 1:section.index(')')].split()))
+                    elif section == 'HEADER':
+                        data = message['raw'].partition(b'\r\n\r\n')[0] + b'\r\n\r\n'
+                    else:
+                        data = get_part(message['raw'], section)
+
+                    name = f'BODY[{section}]'
+
+                    if body_item.group(3):
+                        offset, length = int(body_item.group(4)), int(body_item.group(5))
+                        data = data[offset:offset + length]
+                        name += f'<{offset}>'
+
+                    items_out.append((name, data))
+                    seen = seen or not body_item.group(1)
+
+            if seen:
+                with mail_box.lock:
+                    message['flags'].add('\\Seen')
+
+            response = f'* {n + 1} FETCH ('.encode()
+
+            for number, item in enumerate(items_out):
+                if number:
+                    response += b' '
+
+                if isinstance(item, tuple):
+                    response += item[0].encode() + b' {' + str(len(item[1])).encode() + b'}\r\n' + item[1]
+                else:
+                    response += item.encode()
+
+            self.send(response + b')\r\n')
+
+class POP3_Handler(Mail_Handler):
+    def send_multiline(self, data):
+        # dot stuffing and the end of the response
+        lines = [b'.' + line if line.startswith(b'.') else line for line in data.split(b'\r\n')]
+        self.send(b'\r\n'.join(lines) + b'\r\n.\r\n')
+
+    def handle(self):
+        if self.refused:
+            self.send('-ERR [IN-USE] too many connections\r\n')
+            return
+
+        mail_box = self.server.mailbox
+        deleted = set()
+        self.send('+OK mock POP3 ready\r\n')
+
+        while True:
+            line = self.rfile.readline()
+
+            if not line:
+                return
+
+            self.wait()
+            parts = line.decode('utf-8', 'replace').strip().split()
+
+            if not parts:
+                continue
+
+            command, arguments = parts[0].upper(), parts[1:]
+            self.count('commands')
+            self.count(command)
+
+            with mail_box.lock:
+                messages = mail_box.messages
+
+                if command in ('USER', 'PASS', 'NOOP', 'RSET'):
+                    if command == 'RSET':
+                        deleted.clear()
+                    self.send('+OK\r\n')
+                elif command == 'STAT':
+                    live = [message for n, message in enumerate(messages) if n + 1 not in deleted]
+                    self.send(f'+OK {len(live)} {sum(len(message["raw"]) for message in live)}\r\n')
+                elif command in ('LIST', 'UIDL'):
+                    if command == 'UIDL' and not self.server.uidl:
+                        self.send('-ERR not supported\r\n')
+                        continue
+
+                    self.send('+OK\r\n')
+                    self.send_multiline('\r\n'.join(f'{n + 1} ' + (str(len(message['raw'])) if command == 'LIST' else hashlib.md5(message['raw']).hexdigest())
+                                                    for n, message in enumerate(messages) if n + 1 not in deleted).encode())
+                elif command in ('RETR', 'TOP'):
+                    number = int(arguments[0])
+
+                    if number < 1 or number > len(messages) or number in deleted:
+                        self.send('-ERR no such message\r\n')
+                        continue
+
+                    raw = messages[number - 1]['raw']
+
+                    if command == 'TOP':
+                        headers, _, body = raw.partition(b'\r\n\r\n')
+                        body_lines = body.split(b'\r\n')[:int(arguments[1])]
+                        raw = headers + b'\r\n\r\n' + b'\r\n'.join(body_lines) if body_lines else headers + b'\r\n'
+
+                    self.send(f'+OK {len(raw)} octets\r\n')
+                    self.send_multiline(raw)
+                elif command == 'DELE':
+                    deleted.add(int(arguments[0]))
+                    self.send('+OK\r\n')
+                elif command == 'QUIT':
+                    for number in sorted(deleted, reverse=True):
+                        del messages[number - 1]
+                    self.send('+OK bye\r\n')
+                    return
+                else:
+                    self.send('-ERR unknown command\r\n')
+
+class Mock_Server(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, handler, mail_box, password=None, latency=0.0, bandwidth=0, max_connections=0, uidl=True):
+        # Example usage:
+        #   mail_box = load_maildir('/tmp/maildir')
+        #   server = Mock_Server(('127.0.0.1', 0), IMAP_Handler, mail_box, latency=0.01)
+        #   threading.Thread(target=server.serve_forever, daemon=True).start()
+        #   port = server.server_address[1]
+        #
+        # latency is the seconds to wait before every command, bandwidth the max bytes per second that
+        # are send per connection (0 = no max) and max_connections the max connections at the same time.
+        super().__init__(address, handler)
+        self.mailbox = mail_box
+        self.password = password
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.max_connections = max_connections
+        self.uidl = uidl
+        self.active_connections = 0
+        self.stats = {}
+        self.stats_lock = threading.Lock()
+
+if __name__ == '__main__':
+    options = argparse.ArgumentParser(description='Local IMAP/POP3 server for a maildir, for testing only', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    options.add_argument('--maildir', required=True, help='The maildir with the messages')
+    options.add_argument('--host', default='127.0.0.1', help='The address to listen on')
+    options.add_argument('--imap_port', type=int, default=1143, help='The IMAP port, 0 = no IMAP server')
+    options.add_argument('--pop3_port', type=int, default=1110, help='The POP3 port, 0 = no POP3 server')
+    options.add_argument('--password', help='Only accept this password (IMAP), default: any password')
+    options.add_argument('--latency', type=float, default=0.0, help='Seconds to wait before every command')
+    options.add_argument('--bandwidth', type=int, default=0, help='Max bytes per second per connection, 0 = no max')
+    options.add_argument('--max_connections', type=int, default=0, help='Max connections at the same time, 0 = no max')
+    args = options.parse_args()
+
+    shared_mailbox = load_maildir(args.maildir)
+    servers = []
+
+    for port, handler in ((args.imap_port, IMAP_Handler), (args.pop3_port, POP3_Handler)):
+        if port:
+            server = Mock_Server((args.host, port), handler, shared_mailbox, args.password, args.latency, args.bandwidth, args.max_connections)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+            print(f"{handler.__name__.split('_')[0]} server on {args.host}:{server.server_address[1]} with {len(shared_mailbox.messages)} messages")
+
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        for server in servers:
+            print(f"{server.RequestHandlerClass.__name__.split('_')[0]} statistics: {server.stats}")